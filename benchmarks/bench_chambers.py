@@ -0,0 +1,83 @@
+# CPU used by the control loop as the number of chambers grows. Every
+# chamber has its own heater pin (FakeGPIO) and probe in a fake 1-wire sysfs
+# tree read by the real W1Sampler; the loop runs on a virtual clock so the
+# ticks are back to back and only their CPU cost is measured.
+#
+# "shared" is Dryer's single sampling pass per tick; "per chamber" reads the
+# bus once for every chamber, as separate loops would.
+#
+#   python benchmarks/bench_chambers.py [--chambers 1 2 4 8 16 32] [--ticks 2000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_w1_sampler import make_fake_tree
+from dryer import Dryer, ChamberConfig
+from hardware import GPIOBackend
+from preset_store import Preset
+from simulation import FakeGPIO, VirtualClock
+from w1_sampler import W1Sampler
+
+
+class PerChamberScanDryer(Dryer):
+    def step(self, now=None, late=0.0):
+        if now is None:
+            now = self.backend.clock()
+        for chamber in self.chambers:
+            chamber.readings = self.backend.sensors.read_all()
+            chamber.engine.step(now, late)
+
+
+def run(dryer_class, chambers, ticks, tmp):
+    w1_dir = os.path.join(tmp, f'w1-{dryer_class.__name__}-{chambers}') + '/'
+    make_fake_tree(w1_dir, chambers)
+    sensors = W1Sampler(base_dir=w1_dir)
+    clock = VirtualClock()
+    gpio = FakeGPIO()
+    configs = [ChamberConfig(f'Box {i}', 2 + i, sensor_id) for i, sensor_id in enumerate(sensors.sensor_ids())]
+    backend = GPIOBackend(gpio, configs[0].pin, sensors, clock=clock.monotonic, sleep=clock.sleep)
+    dryer = dryer_class(backend=backend, chambers=configs, telemetry_dir=os.path.join(tmp, 'telemetry'))
+    for i in range(chambers):
+        dryer.run_preset(Preset('PLA', 50.0), chamber=i)
+    dryer.run(dryer.period * 10)
+    start = time.process_time()
+    dryer.run(dryer.period * ticks)
+    cpu = (time.process_time() - start) / ticks
+    dryer.close()
+    return cpu
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chambers', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--ticks', type=int, default=2000)
+    args = parser.parse_args()
+
+    rows = []
+    # Silence the per-chamber start/stop prints
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in args.chambers:
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                shared = run(Dryer, n, args.ticks, tmp)
+                separate = run(PerChamberScanDryer, n, args.ticks, tmp)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+            rows.append((n, shared, separate))
+
+    period = 0.5
+    print(f"[BENCH] ticks={args.ticks} period={period}s")
+    print("[BENCH] chambers  shared us/tick  CPU%   per-chamber us/tick  CPU%")
+    for n, shared, separate in rows:
+        print(f"[BENCH] {n:8d}  {shared * 1e6:14.1f}  {shared / period * 100:5.2f}  "
+              f"{separate * 1e6:19.1f}  {separate / period * 100:5.2f}")
+
+
+if __name__ == '__main__':
+    main()
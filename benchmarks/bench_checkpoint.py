@@ -0,0 +1,168 @@
+# Session checkpoints (session_checkpoint.py): what they cost the control
+# loop, how often they hit the SD card, and what a power cut does to a run.
+#
+#   tick cost    what a control tick spends asking whether a checkpoint is
+#                due, and handing one over to the checkpoint thread
+#   writes       checkpoints per hour of a run and their write+fsync time
+#   power cuts   a 50 °C run is cut at some point, the box cools with the
+#                heater off for the outage, and a new Dryer on the same
+#                simulated box resumes from the file. Soak is the time the
+#                program spent soaking before and after the cut against the
+#                preset's; a resumed soak may repeat up to one checkpoint
+#                interval, never come up short.
+#
+#   python benchmarks/bench_checkpoint.py [--interval 60] [--ticks 20000]
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dryer import Dryer, ChamberConfig
+from drying_program import SOAK
+from metrics import METRICS
+from preset_store import Preset
+from session_checkpoint import SessionCheckpoint, MAX_OUTAGE
+from simulation import SimulatedBackend
+
+TARGET = 50.0
+SOAK_MINUTES = 120
+EPOCH = 1.7e9
+
+# stage to cut in, minutes into that stage, minutes without power
+CUTS = (
+    ('ramp', 5, 30),
+    ('soak', 30, 2),
+    ('soak', 30, 45),
+    ('soak', 100, 180),
+    ('soak', 30, MAX_OUTAGE / 60 + 30),
+    ('cooldown', 5, 20),
+)
+
+
+def make_dryer(backend, tmp, checkpoint):
+    return Dryer(backend=backend, chambers=[ChamberConfig('Box', backend.pin)], telemetry_dir=os.path.join(tmp, 'telemetry'),
+                 watchdog=False, checkpoint=checkpoint)
+
+
+def tick_cost(args, tmp):
+    # A run with checkpoints on the virtual clock, then the two things a tick
+    # can do timed on their own: ask whether one is due, and hand one over
+    backend = SimulatedBackend(speed=None, seed=1)
+    checkpoint = SessionCheckpoint(os.path.join(tmp, 'cost.json'), interval=args.interval,
+                                   clock=lambda: EPOCH + backend.clock())
+    checkpoint.start()
+    dryer = make_dryer(backend, tmp, checkpoint)
+    dryer.run_preset(Preset('Bench', TARGET, SOAK_MINUTES))
+    submits = 0
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        last = checkpoint._last_write
+        dryer.step()
+        submits += checkpoint._last_write != last
+        backend.virtual_clock.sleep(dryer.period)
+    tick = (time.perf_counter() - start) / args.ticks
+    hours = args.ticks * dryer.period / 3600
+    checkpoint.interval = float('inf')
+    start = time.perf_counter()
+    for _ in range(args.ticks):
+        dryer._checkpoint()
+    check = (time.perf_counter() - start) / args.ticks
+    handovers = []
+    for _ in range(1000):
+        start = time.perf_counter()
+        dryer._checkpoint(force=True)
+        handovers.append(time.perf_counter() - start)
+    dryer.close()
+    return tick, check, sum(handovers) / len(handovers), max(handovers), submits / hours
+
+
+def stage_of(dryer):
+    snapshot = dryer.latest()
+    return snapshot.program if snapshot is not None else None
+
+
+def power_cut(stage, minutes_in, outage_minutes, args, tmp):
+    backend = SimulatedBackend(speed=None, seed=3)
+    path = os.path.join(tmp, f'cut-{stage}-{minutes_in}-{outage_minutes:g}.json')
+    clock = lambda: EPOCH + backend.clock()
+    dryer = make_dryer(backend, tmp, SessionCheckpoint(path, interval=args.interval, clock=clock))
+    dryer.run_preset(Preset('Bench', TARGET, SOAK_MINUTES))
+    soaked = 0.0
+    entered = None
+    while True:
+        dryer.step()
+        backend.virtual_clock.sleep(dryer.period)
+        status = stage_of(dryer)
+        if status is None or status.stage_kind is None:
+            continue
+        if status.stage_kind == SOAK:
+            soaked += dryer.period
+        if status.stage_kind == stage:
+            entered = backend.clock() if entered is None else entered
+            if backend.clock() - entered >= minutes_in * 60:
+                break
+    # Power gone: nothing more reaches the disk and the heater is off
+    dryer.checkpoint = None
+    backend.plant.set_duty(0.0)
+    backend.virtual_clock.sleep(outage_minutes * 60)
+    backend.plant.advance_to(backend.clock())
+    temperature = backend.plant.sensor_temperature
+
+    dryer = make_dryer(backend, tmp, SessionCheckpoint(path, interval=args.interval, clock=clock))
+    resumed = dryer.resume()
+    detail = 'not resumed'
+    stages = None
+    if resumed:
+        start = backend.clock()
+        while dryer.engine.program is not None and backend.clock() - start < 12 * 3600:
+            dryer.step()
+            backend.virtual_clock.sleep(dryer.period)
+            status = stage_of(dryer)
+            if status is not None and status.stage_kind == SOAK:
+                soaked += dryer.period
+            if status is not None and status.stage_kind is not None:
+                stages = status.stage_count
+        detail = 'ramped back up' if stages == 4 else 'carried on'
+        if dryer.engine.program is not None:
+            detail += ', did not finish'
+    left = os.path.exists(path)
+    dryer.close()
+    return temperature, detail, soaked / 60, left
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--interval', type=float, default=60.0, help='checkpoint interval, s')
+    parser.add_argument('--ticks', type=int, default=20000, help='ticks for the cost measurement')
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            tick, check, handover, worst, per_hour = tick_cost(args, tmp)
+            cuts = [power_cut(*cut, args, tmp) for cut in CUTS]
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+    write_time = METRICS.get('dryer_checkpoint_write_seconds')
+
+    print(f"[BENCH] Checkpoint every {args.interval:g} s, {args.ticks} ticks")
+    print(f"[BENCH] control tick           {tick * 1e6:8.1f} us")
+    print(f"[BENCH] checkpoint due check   {check * 1e6:8.2f} us per tick")
+    print(f"[BENCH] checkpoint hand-over   {handover * 1e6:8.1f} us mean, {worst * 1e6:.1f} us max")
+    print(f"[BENCH] checkpoints per hour   {per_hour:8.1f}")
+    print(f"[BENCH] write + fsync          {write_time.sum / max(write_time.count, 1) * 1e3:8.2f} ms mean, "
+          f"{write_time.max * 1e3:.2f} ms max, on the checkpoint thread")
+    print(f"[BENCH] Power cuts in a {TARGET:g} °C run with a {SOAK_MINUTES} min soak")
+    print("[BENCH] cut in     at min  outage min  probe °C  resume                     soak min  file left")
+    for (stage, minutes_in, outage), (temperature, detail, soaked, left) in zip(CUTS, cuts):
+        print(f"[BENCH] {stage:9s}  {minutes_in:6d}  {outage:10g}  {temperature:8.1f}  {detail:25s}  "
+              f"{soaked:8.1f}  {'yes' if left else 'no':>9s}")
+
+
+if __name__ == '__main__':
+    main()
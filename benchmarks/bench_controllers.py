@@ -0,0 +1,343 @@
+# Controller comparison to run before rolling out a new build. Every
+# controller is put through scripted plant scenarios on the simulator (on a
+# virtual clock, so hours take seconds) and, with --trace, through recorded
+# telemetry. The results go to a table, optionally to CSV/JSON, and can be
+# checked against a saved baseline.
+#
+# Scenario scores use the simulated chamber air temperature, not the probe:
+#
+#   rise      10 % -> 90 % of the step from the starting temperature, min
+#   overshoot highest air temperature above the target, °C
+#   ss err    mean |air - target| over the last 30 min, °C
+#   recovery  time from a disturbance until the air stays within 0.5 °C, min
+#             (only if it was within 0.5 °C before)
+#   energy    heater energy, Wh
+#   switches  heater off -> on transitions on the output pin
+#   changes   how often the duty written to the output changed
+#
+# Replays feed the recorded probe readings and setpoints to each controller
+# open loop (the trace does not react to its duty), so they score energy,
+# switching, and `diff`, the mean |duty - recorded duty| in %, which is what
+# to look at for behaviour changes in the controller.
+#
+#   python benchmarks/bench_controllers.py [--scenarios door dropout] [--controllers stepped pid predictive]
+#       [--trace telemetry/ | --trace session.csv] [--csv out.csv] [--save results.json]
+#       [--baseline results.json]
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+import tempfile
+from collections import namedtuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from bench_thermal_model import identify
+from controllers import SteppedController, PredictiveController, create_pid
+from dryer import Dryer, ChamberConfig
+from sensor_filter import SensorFilterBank
+from simulation import SimulatedBackend
+from telemetry_log import query
+from thermal_model import fit_model, load_model
+
+CONTROLLERS = ('stepped', 'pid', 'predictive')
+METRICS = ('rise', 'overshoot', 'ss_err', 'recovery', 'energy', 'switches', 'changes', 'diff')
+TOLERANCE = 0.5     # °C, for recovery
+STEADY_WINDOW = 1800.0
+DISTURBANCE_AT = 90 * 60.0
+
+# `events` is a list of (time s, action(backend)); `plant` holds ThermalPlant
+# overrides and `sensors` SimulatedSensors ones
+Scenario = namedtuple('Scenario', 'name description target duration events plant sensors',
+                      defaults=((), None, None))
+
+
+def _open_door(backend):
+    # Most of the warm air is swapped for room air and the box loses heat
+    # fast while the door is open
+    plant = backend.plant
+    plant.advance_to(backend.clock())
+    plant.chamber_temperature -= 0.6 * (plant.chamber_temperature - plant.ambient)
+    plant.loss *= 20.0
+
+
+def _close_door(backend):
+    backend.plant.advance_to(backend.clock())
+    backend.plant.loss /= 20.0
+
+
+def _ambient_drop(backend):
+    backend.plant.advance_to(backend.clock())
+    backend.plant.ambient -= 10.0
+
+
+def _load_spool(backend, capacity=800.0):
+    # A cold 1 kg spool: mix its heat capacity into the chamber
+    plant = backend.plant
+    plant.advance_to(backend.clock())
+    total = plant.chamber_capacity + capacity
+    plant.chamber_temperature = (plant.chamber_capacity * plant.chamber_temperature + capacity * plant.ambient) / total
+    plant.chamber_capacity = total
+
+
+def _drop_probe(backend):
+    sensors = backend.simulated_sensors
+    sensors.dropped.update(sensors.ids)
+
+
+def _restore_probe(backend):
+    backend.simulated_sensors.dropped.clear()
+
+
+SCENARIOS = [
+    Scenario('warmup', 'Cold start to 55 °C', 55.0, 2 * 3600),
+    Scenario('abs', 'Cold start to 69 °C', 69.0, 3 * 3600),
+    Scenario('door', 'Door open for 60 s at 90 min', 55.0, 3 * 3600,
+             [(DISTURBANCE_AT, _open_door), (DISTURBANCE_AT + 60, _close_door)]),
+    Scenario('ambient', 'Room drops 10 °C at 90 min', 55.0, 3 * 3600, [(DISTURBANCE_AT, _ambient_drop)]),
+    Scenario('spool', 'Cold spool loaded at 90 min', 55.0, 3 * 3600, [(DISTURBANCE_AT, _load_spool)]),
+    Scenario('dropout', 'Probe lost for 3 s and for 60 s', 55.0, 3 * 3600,
+             [(DISTURBANCE_AT, _drop_probe), (DISTURBANCE_AT + 3, _restore_probe),
+              (DISTURBANCE_AT + 600, _drop_probe), (DISTURBANCE_AT + 660, _restore_probe)]),
+    Scenario('noisy', 'Noisy probe with CRC errors and spikes', 55.0, 2 * 3600,
+             sensors={'crc_error_rate': 0.05, 'spike_rate': 0.005}, plant={'noise': 0.3}),
+]
+
+
+def make_controller(kind, model, gains):
+    if kind == 'stepped':
+        return SteppedController()
+    if kind == 'pid':
+        return create_pid(gains)
+    if kind == 'predictive':
+        return PredictiveController(model) if model is not None else None
+    raise ValueError(f'Unknown controller: {kind}')
+
+
+def score(t, temps, duties, target, start_temperature, events=()):
+    # Scores for one closed-loop run (arrays per tick)
+    result = dict.fromkeys(METRICS)
+    step = target - start_temperature
+    lo = np.flatnonzero(temps >= start_temperature + 0.1 * step)
+    hi = np.flatnonzero(temps >= start_temperature + 0.9 * step)
+    if len(lo) and len(hi):
+        result['rise'] = (t[hi[0]] - t[lo[0]]) / 60.0
+    result['overshoot'] = max(float(temps.max() - target), 0.0)
+    steady = t >= t[-1] - STEADY_WINDOW
+    result['ss_err'] = float(np.abs(temps[steady] - target).mean())
+    before = np.flatnonzero(t < events[0]) if events else ()
+    # Only meaningful if the run had settled before the disturbance
+    if len(before) and abs(temps[before[-1]] - target) <= TOLERANCE:
+        after = t >= events[0]
+        outside = np.flatnonzero(after & (np.abs(temps - target) > TOLERANCE))
+        result['recovery'] = (t[outside[-1]] - events[0]) / 60.0 if len(outside) else 0.0
+    result['changes'] = int(np.count_nonzero(np.diff(duties)))
+    return result
+
+
+def run_scenario(scenario, kind, model, args, tmp):
+    backend = SimulatedBackend(speed=None, seed=args.seed, **(scenario.plant or {}))
+    for key, value in (scenario.sensors or {}).items():
+        setattr(backend.simulated_sensors, key, value)
+    dryer = Dryer(backend=backend, chambers=[ChamberConfig('Bench', backend.pin, heater=args.heater)],
+                  telemetry_dir=os.path.join(tmp, f'{scenario.name}-{kind}'),
+                  sensor_filter=SensorFilterBank(args.filter))
+    controller = make_controller(kind, model, args.gains)
+    if controller is None:
+        dryer.close()
+        return None
+    edges = [0, False]
+
+    def on_pin(pin, duty):
+        if pin == backend.pin and (duty > 0) != edges[1]:
+            edges[1] = duty > 0
+            edges[0] += edges[1]
+
+    backend.gpio.listeners.append(on_pin)
+    engine = dryer.engine
+    engine.set_controller(controller)
+    engine.set_target(scenario.target)
+    engine.set_active(True)
+    plant = backend.plant
+    start_temperature = plant.chamber_temperature
+    events = sorted(scenario.events, key=lambda e: e[0])
+    ticks = int(scenario.duration / dryer.period)
+    t = np.empty(ticks)
+    temps = np.empty(ticks)
+    duties = np.empty(ticks)
+    start = backend.clock()
+    pending = list(events)
+    for i in range(ticks):
+        now = backend.clock() - start
+        while pending and pending[0][0] <= now:
+            pending.pop(0)[1](backend)
+        dryer.step()
+        t[i] = now
+        temps[i] = plant.chamber_temperature
+        duties[i] = engine.duty
+        backend.virtual_clock.sleep(dryer.period)
+    energy = plant.energy
+    dryer.close()
+    result = score(t, temps, duties, scenario.target, start_temperature, [e[0] for e in events])
+    result['energy'] = energy / 3600.0
+    result['switches'] = edges[0]
+    return result
+
+
+def load_trace(path):
+    # A telemetry directory or a CSV from export_csv: (t, temperature, setpoint, duty)
+    if os.path.isdir(path):
+        _, records = query(directory=path)
+        if not len(records) or not records['temps'].shape[1]:
+            raise ValueError(f'No telemetry in {path}')
+        return (records['t'].astype(np.float64), records['temps'][:, 0].astype(np.float64),
+                records['setpoint'].astype(np.float64), records['duty'].astype(np.float64))
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = [[float(v) if v else math.nan for v in (row[0], row[4] if len(row) > 4 else '', row[2], row[3])]
+                for row in reader]
+    if not rows or len(header) < 5:
+        raise ValueError(f'{path} has no probe column')
+    return tuple(np.array(column) for column in zip(*rows))
+
+
+def replay(trace, kind, model, args):
+    t, temps, setpoints, recorded = trace
+    controller = make_controller(kind, model, args.gains)
+    if controller is None:
+        return None
+    duties = np.zeros(len(t))
+    for i in range(len(t)):
+        # Like ControlEngine: no reading or no setpoint means heater off
+        if math.isfinite(temps[i]) and math.isfinite(setpoints[i]):
+            duties[i] = controller.update(float(setpoints[i]), float(temps[i]), float(t[i]))
+    result = duty_scores(t, duties, args.heater_watts)
+    result['diff'] = float(np.nanmean(np.abs(duties - recorded)))
+    return result
+
+
+def duty_scores(t, duties, heater_watts):
+    # Energy and switching from a duty series alone
+    dt = np.diff(t, append=t[-1])
+    on = duties > 0
+    result = dict.fromkeys(METRICS)
+    result['energy'] = float(np.sum(duties * dt)) / 100.0 * heater_watts / 3600.0
+    result['switches'] = int(np.count_nonzero(on[1:] & ~on[:-1]))
+    result['changes'] = int(np.count_nonzero(np.diff(duties)))
+    return result
+
+
+def regressions(rows, baseline, tolerance):
+    # Rows whose scores got worse than the baseline by more than `tolerance`
+    # (relative) plus a small absolute slack. A score that is missing now but
+    # was not before (no longer reaches 90 %, no longer settles) is worse.
+    slack = {'rise': 0.5, 'overshoot': 0.1, 'ss_err': 0.05, 'recovery': 0.5, 'energy': 0.5,
+             'switches': 2, 'changes': 5, 'diff': 0.5}
+    previous = {(r['case'], r['controller']): r for r in baseline}
+    worse = []
+    for row in rows:
+        old = previous.get((row['case'], row['controller']))
+        if old is None:
+            continue
+        for metric in METRICS:
+            new_value, old_value = row.get(metric), old.get(metric)
+            if old_value is None:
+                continue
+            if new_value is None or new_value > old_value * (1.0 + tolerance) + slack[metric]:
+                worse.append((row['case'], row['controller'], metric, old_value, new_value))
+    return worse
+
+
+def _cell(value, digits):
+    if value is None:
+        return '-'
+    return f'{value:.{digits}f}' if isinstance(value, float) else str(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare temperature controllers on scenarios and recorded traces')
+    parser.add_argument('--scenarios', nargs='*', default=[s.name for s in SCENARIOS],
+                        help='scenario names (none with --trace only)')
+    parser.add_argument('--controllers', nargs='+', default=list(CONTROLLERS), choices=CONTROLLERS)
+    parser.add_argument('--trace', action='append', default=[], help='telemetry directory or exported CSV to replay')
+    parser.add_argument('--model', help='thermal model name in thermal_models.json for the predictive controller '
+                                        '(default: fitted from an identification run or from the trace)')
+    parser.add_argument('--gains', default='default', help='PID gains name in controller_gains.json')
+    parser.add_argument('--heater', default='soft', choices=('soft', 'ssr'))
+    parser.add_argument('--filter', default='kalman', help='sensor filter (see sensor_filter.FILTER_KINDS)')
+    parser.add_argument('--heater-watts', type=float, default=60.0, help='heater power for replay energy')
+    parser.add_argument('--seed', type=int, default=2)
+    parser.add_argument('--csv', help='write the table as CSV')
+    parser.add_argument('--save', help='write the results as JSON (a baseline for later runs)')
+    parser.add_argument('--baseline', help='JSON from an earlier --save; exit 1 if a score got worse')
+    parser.add_argument('--tolerance', type=float, default=0.05, help='relative slack for --baseline')
+    args = parser.parse_args(argv)
+
+    names = {s.name for s in SCENARIOS}
+    unknown = [name for name in args.scenarios if name not in names]
+    if unknown:
+        parser.error(f"unknown scenario(s) {', '.join(unknown)}; choose from {', '.join(sorted(names))}")
+
+    rows = []
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            model = load_model(args.model) if args.model else None
+            if model is None and 'predictive' in args.controllers and args.scenarios:
+                model, _ = identify(tmp)
+            for scenario in SCENARIOS:
+                if scenario.name not in args.scenarios:
+                    continue
+                for kind in args.controllers:
+                    result = run_scenario(scenario, kind, model, args, tmp)
+                    if result is not None:
+                        rows.append({'case': scenario.name, 'controller': kind, **result})
+            for path in args.trace:
+                trace = load_trace(path)
+                trace_model = model if args.model else fit_model(trace[0], trace[1], trace[3])
+                case = os.path.basename(os.path.normpath(path))
+                rows.append({'case': f'trace:{case}', 'controller': 'recorded',
+                             **duty_scores(trace[0], np.nan_to_num(trace[3]), args.heater_watts)})
+                for kind in args.controllers:
+                    result = replay(trace, kind, trace_model, args)
+                    if result is not None:
+                        rows.append({'case': f'trace:{case}', 'controller': kind, **result})
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    columns = (('rise', 1), ('overshoot', 2), ('ss_err', 3), ('recovery', 1), ('energy', 1),
+               ('switches', 0), ('changes', 0), ('diff', 2))
+    print("[BENCH] case              controller  rise min  overshoot °C  ss err °C  recovery min  "
+          "energy Wh  switches  changes  diff %")
+    for row in rows:
+        cells = [_cell(row[name], digits) for name, digits in columns]
+        print(f"[BENCH] {row['case'][:16]:16s}  {row['controller']:10s}  {cells[0]:>8s}  {cells[1]:>12s}  "
+              f"{cells[2]:>9s}  {cells[3]:>12s}  {cells[4]:>9s}  {cells[5]:>8s}  {cells[6]:>7s}  {cells[7]:>6s}")
+
+    if args.csv:
+        with open(args.csv, 'w', newline='') as f:
+            writer = csv.DictWriter(f, ['case', 'controller'] + list(METRICS))
+            writer.writeheader()
+            writer.writerows(rows)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(rows, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            worse = regressions(rows, json.load(f), args.tolerance)
+        for case, kind, metric, old, new in worse:
+            print(f"[BENCH] REGRESSION {case} {kind}: {metric} {old:g} -> {'never' if new is None else f'{new:g}'}")
+        if worse:
+            return 1
+        print(f"[BENCH] No regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
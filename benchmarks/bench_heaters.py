@@ -0,0 +1,200 @@
+# CPU cost and edge timing of the heater outputs, idle and with a busy
+# thread competing for the GIL (what a matplotlib redraw does to the app).
+#
+#   soft model  not GPIOPWMHeater itself, whose pulses come from RPi.GPIO's
+#               thread: a 100 Hz loop timed with sleeps the way that thread
+#               is (it runs in C, but is woken by the same scheduler and
+#               shares the CPU with everything else)
+#   sysfs       SysfsPWMHeater against a FakePWMTree; the pulses are timed
+#               by the PWM peripheral, so only the cost of a duty write is
+#               measured
+#   ssr         TimeProportioningHeater on a HeaterScheduler thread, FakeGPIO
+#               edges timestamped against the window they belong to
+#
+# Before timing, SysfsPWMHeater is checked against the tree: period, enable,
+# duty scaling and stop(). A wrong value fails the run (exit status 1).
+#
+#   python benchmarks/bench_heaters.py [--seconds 5] [--window 1.0]
+import argparse
+import math
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from heater_outputs import SysfsPWMHeater, TimeProportioningHeater, HeaterScheduler
+from simulation import FakeGPIO, FakePWMTree
+
+DUTY = 30.0
+
+
+class BusyThread:
+    # Pure-Python work in short bursts, like a plot redraw on the UI thread
+    def __init__(self):
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            sum(i * i for i in range(20000))
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop_event.set()
+        self._thread.join()
+
+
+def percentiles(values):
+    values = sorted(values)
+    if not values:
+        return 0.0, 0.0, 0.0
+    return (values[len(values) // 2], values[min(len(values) - 1, int(len(values) * 0.99))], values[-1])
+
+
+def bench_soft(seconds, frequency=100.0):
+    # A model of RPi.GPIO's PWM thread toggling a FakeGPIO pin
+    gpio = FakeGPIO()
+    period = 1.0 / frequency
+    on = period * DUTY / 100.0
+    lateness = []
+    cpu = []
+
+    def run():
+        start_cpu = time.thread_time()
+        origin = time.monotonic()
+        edges = 0
+        end = origin + seconds
+        while True:
+            edge = origin + (edges // 2) * period + (on if edges % 2 else 0.0)
+            if edge > end:
+                break
+            delay = edge - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            lateness.append(time.monotonic() - edge)
+            gpio.output(18, edges % 2 == 0)
+            edges += 1
+        cpu.append(time.thread_time() - start_cpu)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    thread.join()
+    return cpu[0] / seconds, lateness
+
+
+def check_sysfs(tmp):
+    # What SysfsPWMHeater leaves in the tree; returns the mismatches
+    tree = FakePWMTree(tmp)
+    heater = SysfsPWMHeater(channel=1, base_dir=tmp, frequency=1000)
+    failures = []
+
+    def expect(what, value, expected):
+        if value != expected:
+            failures.append(f"{what}: {value!r}, expected {expected!r}")
+
+    heater.set_duty(DUTY)
+    expect('period at 1 kHz', tree.read('period', 1), '1000000')
+    expect('enable', tree.read('enable', 1), '1')
+    expect(f'duty at {DUTY:g} %', round(tree.duty(1), 6), DUTY)
+    heater.set_duty(100)
+    expect('duty at 100 %', round(tree.duty(1), 6), 100.0)
+    heater.set_duty(0.5)
+    expect('duty_cycle at 0.5 %', tree.read('duty_cycle', 1), '5000')
+    heater.stop()
+    expect('enable after stop()', tree.read('enable', 1), '0')
+    expect('duty after stop()', tree.duty(1), 0.0)
+    expect('other channel', tree.read('enable', 0), '0')
+    return failures
+
+
+def bench_sysfs(seconds, tmp):
+    FakePWMTree(tmp)
+    heater = SysfsPWMHeater(channel=1, base_dir=tmp, frequency=1000)
+    # The control loop changes the duty twice a second
+    writes = 2000
+    start = time.process_time()
+    for i in range(writes):
+        heater.set_duty(DUTY + (i % 7))
+    per_write = (time.process_time() - start) / writes
+    heater.stop()
+    return per_write * 2.0, []
+
+
+class _TimedScheduler(HeaterScheduler):
+    def _run(self):
+        start = time.thread_time()
+        super()._run()
+        self.cpu = time.thread_time() - start
+
+
+def bench_ssr(seconds, window):
+    gpio = FakeGPIO()
+    scheduler = _TimedScheduler()
+    edges = []
+    gpio.listeners.append(lambda pin, duty: edges.append((time.monotonic(), duty > 0)))
+    heater = TimeProportioningHeater(23, gpio, scheduler, window=window, min_pulse=window / 100.0)
+    del edges[:]
+    heater.set_duty(DUTY)
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    heater.stop()
+    on = window * DUTY / 100.0
+    lateness = []
+    for t, state in edges[:-1]:
+        window_start = heater.origin + math.floor((t - heater.origin) / window) * window
+        expected = window_start if state else window_start + on
+        lateness.append(t - expected)
+    return scheduler.cpu / seconds, lateness
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--window', type=float, default=1.0, help='SSR window (10 s in use; shorter to collect more edges)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = check_sysfs(os.path.join(tmp, 'check'))
+    for failure in failures:
+        print(f"[BENCH] sysfs check failed: {failure}")
+    if failures:
+        return 1
+    print("[BENCH] sysfs checks passed: period, enable, duty scaling, stop()")
+
+    print(f"[BENCH] {args.seconds:g} s per run, duty {DUTY:g} %")
+    print("[BENCH] output       load   CPU%    edges  late p50 ms  p99 ms  max ms")
+    with tempfile.TemporaryDirectory() as tmp:
+        for load in (False, True):
+            for name in ('soft', 'sysfs', 'ssr'):
+                busy = BusyThread() if load else None
+                if busy:
+                    busy.__enter__()
+                try:
+                    if name == 'soft':
+                        cpu, lateness = bench_soft(args.seconds)
+                    elif name == 'sysfs':
+                        cpu, lateness = bench_sysfs(args.seconds, os.path.join(tmp, f'pwm-{load}'))
+                    else:
+                        cpu, lateness = bench_ssr(args.seconds, args.window)
+                finally:
+                    if busy:
+                        busy.__exit__()
+                p50, p99, worst = percentiles(lateness)
+                if lateness:
+                    timing = f"{len(lateness):6d}  {p50 * 1e3:11.3f}  {p99 * 1e3:6.3f}  {worst * 1e3:6.3f}"
+                else:
+                    timing = "     -  hardware-timed"
+                label = 'soft model' if name == 'soft' else name
+                print(f"[BENCH] {label:11s}  {'busy' if load else 'idle'}  {cpu * 100:6.3f}  {timing}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,131 @@
+# Frame time and CPU cost per graph update for the old full matplotlib
+# redraw, the matplotlib blitting fallback and the Kivy Line LivePlot.
+#
+#   python benchmarks/bench_live_plot.py [--updates 600] [--capacity 120]
+#
+# CPU% is the process CPU time per update relative to the 0.5 s update
+# interval the Testing page uses.
+import argparse
+import collections
+import math
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('KIVY_NO_ARGS', '1')
+
+from plot_buffer import PlotBuffer, BlitRenderer
+
+UPDATE_INTERVAL = 0.5
+
+
+def samples(n):
+    for i in range(n):
+        t = i * UPDATE_INTERVAL
+        temp = 50.0 - 28.0 * math.exp(-t / 120.0) + 0.1 * math.sin(i)
+        # A dropout now and then, like a failed CRC
+        yield t, (None if i % 97 == 0 else temp), max(0.0, min(100.0, (50.0 - temp) * 10.0))
+
+
+def legacy(figure_canvas_cls, capacity):
+    # The original TestingPage.update_graph
+    from matplotlib.figure import Figure
+    fig = Figure()
+    canvas = figure_canvas_cls(fig)
+    ax1 = fig.add_subplot(111)
+    ax2 = ax1.twinx()
+    temp_line, = ax1.plot([], [], 'r-')
+    pwm_line, = ax2.plot([], [], 'b-')
+    temp_history = collections.deque(maxlen=capacity)
+    pwm_history = collections.deque(maxlen=capacity)
+    time_history = collections.deque(maxlen=capacity)
+
+    def update(t, temp, duty):
+        time_history.append(t)
+        temp_history.append(temp)
+        pwm_history.append(duty)
+        times = list(time_history)
+        temps = [x if x is not None else float('nan') for x in temp_history]
+        temp_line.set_data(times, temps)
+        pwm_line.set_data(times, list(pwm_history))
+        ax1.relim()
+        ax1.autoscale_view()
+        ax2.relim()
+        ax2.autoscale_view()
+        canvas.draw()
+    return update
+
+
+def blit(figure_canvas_cls, capacity):
+    from matplotlib.figure import Figure
+    fig = Figure()
+    canvas = figure_canvas_cls(fig)
+    renderer = BlitRenderer(fig, canvas)
+    buffer = PlotBuffer(capacity, series=2)
+
+    def update(t, temp, duty):
+        buffer.append(t, temp, duty)
+        renderer.render(buffer)
+    update.renderer = renderer
+    return update
+
+
+def kivy_lines(capacity):
+    from live_plot import LivePlot
+    plot = LivePlot(capacity, size=(800, 300))
+
+    def update(t, temp, duty):
+        plot.append(t, temp, duty)
+        plot.refresh()
+    update.plot = plot
+    return update
+
+
+def run(name, update, updates):
+    frame_times = []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for t, temp, duty in samples(updates):
+        start = time.perf_counter()
+        update(t, temp, duty)
+        frame_times.append(time.perf_counter() - start)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+    frame_times.sort()
+    mean = sum(frame_times) / len(frame_times)
+    p95 = frame_times[int(len(frame_times) * 0.95)]
+    cpu_pct = cpu / updates / UPDATE_INTERVAL * 100.0
+    print(f"[BENCH] {name:<28} mean {mean * 1e3:7.2f} ms  p95 {p95 * 1e3:7.2f} ms  "
+          f"cpu {cpu_pct:6.2f}% @ {1 / UPDATE_INTERVAL:.0f} Hz  (wall {wall:.2f} s)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--updates', type=int, default=600)
+    parser.add_argument('--capacity', type=int, default=120)
+    args = parser.parse_args()
+
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+    except ImportError:
+        print("[BENCH] matplotlib not installed, skipping matplotlib variants")
+    else:
+        run('matplotlib full redraw', legacy(FigureCanvasAgg, args.capacity), args.updates)
+        update = blit(FigureCanvasAgg, args.capacity)
+        run('matplotlib blit', update, args.updates)
+        print(f"[BENCH]   blit full draws (axis rescales): {update.renderer.full_draws}")
+
+    try:
+        update = kivy_lines(args.capacity)
+    except Exception as e:
+        print(f"[BENCH] Kivy LivePlot unavailable: {e}")
+    else:
+        run('kivy LivePlot', update, args.updates)
+        print(f"[BENCH]   LivePlot axis relayouts: {update.plot.rescales}")
+
+
+if __name__ == '__main__':
+    main()
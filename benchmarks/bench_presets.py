@@ -0,0 +1,103 @@
+# Cost of the preset library with a large catalog: index build, search as
+# the user types (prefix, typo and fuzzy queries, each sort order), patching
+# the index on single edits, bulk JSON/CSV import and export, and building
+# the recycled list's row data for a result. No display is needed; the row
+# data is what the list hands to its few on-screen rows.
+#
+#   python benchmarks/bench_presets.py [--presets 4000] [--repeat 20]
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from preset_index import PresetIndex, SORT_KEYS
+from preset_store import Preset, PresetStore, MATERIALS, format_temperature, format_duration
+
+BRANDS = ['Prusament', 'eSun', 'Polymaker', 'Sunlu', 'Overture', 'Bambu', 'Elegoo', 'Hatchbox', 'Fillamentum', 'Extrudr']
+FINISHES = ['', 'HF ', 'Matte ', 'Silk ', 'CF ', 'Pro ']
+COLOURS = ['Black', 'White', 'Red', 'Blue', 'Grey', 'Orange', 'Green', 'Clear', 'Yellow', 'Purple']
+# Typing "petg black" one key at a time, then typos and abbreviations
+QUERIES = ['p', 'pe', 'pet', 'petg', 'petg b', 'petg bl', 'petg bla', 'petg black',
+           'petq blakc', 'polymkr', 'ptgblk', 'nylon cf', 'zzz']
+
+
+def catalog(n, seed=1):
+    random.seed(seed)
+    materials = sorted(MATERIALS)
+    presets = []
+    while len(presets) < n:
+        material = random.choice(materials)
+        name = f'{random.choice(BRANDS)} {random.choice(FINISHES)}{material} {random.choice(COLOURS)} {len(presets)}'
+        presets.append(Preset(name, float(random.randrange(40, 90, 5)), random.choice([240, 360, 480]),
+                              material=material))
+    return presets
+
+
+def timed(fn, repeat=1):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - start) / repeat, result
+
+
+def row_data(preset):
+    return {'preset_name': preset.name, 'temperature_text': format_temperature(preset.temperature),
+            'duration_text': format_duration(preset.duration)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--presets', type=int, default=4000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            store = PresetStore(os.path.join(tmp, 'presets.json'))
+            presets = catalog(args.presets)
+            store.update_many(presets)
+            size = len(store.names())
+            build, index = timed(lambda: PresetIndex(store))
+            searches = []
+            for query in QUERIES:
+                for sort in SORT_KEYS:
+                    elapsed, names = timed(lambda: index.search(query, sort), args.repeat)
+                    searches.append((query, sort, elapsed, len(names)))
+            edit, _ = timed(lambda: store.update(presets[0].name, temperature=store.get(presets[0].name).temperature + 1),
+                            args.repeat)
+            add, _ = timed(lambda: store.update_many([Preset(f'Extra {random.random()}', 50.0)]), args.repeat)
+            files = {}
+            for ext in ('json', 'csv'):
+                path = os.path.join(tmp, f'library.{ext}')
+                export_time, _ = timed(lambda: store.export_file(path))
+                fresh = PresetStore(os.path.join(tmp, f'fresh-{ext}.json'))
+                fresh_index = PresetIndex(fresh)
+                import_time, (count, skipped) = timed(lambda: fresh.import_file(path))
+                files[ext] = (export_time, import_time, count, os.path.getsize(path))
+                fresh_index.close()
+            everything = index.search('')
+            rows, _ = timed(lambda: [row_data(store.presets[n]) for n in everything], 5)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    print(f"[BENCH] {size} presets; index built in {build * 1e3:.1f} ms")
+    print("[BENCH] query        sort         ms  results")
+    for query, sort, elapsed, found in searches:
+        print(f"[BENCH] {query!r:12s} {sort:11s} {elapsed * 1e3:6.2f}  {found:7d}")
+    print(f"[BENCH] edit one preset (index patch + listeners): {edit * 1e3:.3f} ms")
+    print(f"[BENCH] add one preset: {add * 1e3:.3f} ms")
+    for ext, (export_time, import_time, count, file_size) in files.items():
+        print(f"[BENCH] {ext:4s} export {export_time * 1e3:7.1f} ms, import + index {import_time * 1e3:7.1f} ms, "
+              f"{count} presets, {file_size / 1024:.0f} KiB")
+    print(f"[BENCH] row data for all {len(everything)} presets: {rows * 1e3:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
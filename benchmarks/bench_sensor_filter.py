@@ -0,0 +1,95 @@
+# What the sensor filter does to the control loop. A simulated box runs a
+# 50 °C preset on a virtual clock with a noisy probe that fails CRC and
+# spikes to 85 °C now and then; each filter is scored on
+#
+#   chatter   mean |duty change| per tick in the soak (relay/SSR wear)
+#   blind     ticks the heater was forced off for lack of a reading
+#   rms       RMS of chamber air temperature - setpoint in the soak
+#   us/read   CPU per filtered reading
+#
+#   python benchmarks/bench_sensor_filter.py [--hours 2] [--noise 0.2] [--crc 0.05] [--spikes 0.005]
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dryer import Dryer, ChamberConfig
+from preset_store import Preset
+from sensor_filter import SensorFilterBank, SensorFilter
+from simulation import SimulatedBackend
+
+TARGET = 50.0
+
+
+def run(kind, retries, args, tmp):
+    backend = SimulatedBackend(speed=None, seed=1, noise=args.noise, crc_error_rate=args.crc)
+    backend.simulated_sensors.crc_retries = retries
+    backend.simulated_sensors.spike_rate = args.spikes
+    dryer = Dryer(backend=backend, chambers=[ChamberConfig('Box', backend.pin)],
+                  telemetry_dir=os.path.join(tmp, f'{kind}-{retries}'), sensor_filter=SensorFilterBank(kind))
+    dryer.run_preset(Preset('Bench', TARGET, duration=int(args.hours * 60)))
+    engine = dryer.engine
+    plant = backend.plant
+    last_duty = 0.0
+    chatter = []
+    errors = []
+    blind = 0
+    while engine.program is not None:
+        dryer.step()
+        backend.virtual_clock.sleep(dryer.period)
+        snapshot = engine.snapshots.latest()
+        if snapshot.temperature is None:
+            blind += 1
+        status = snapshot.program
+        if status is not None and status.stage_kind == 'soak':
+            chatter.append(abs(snapshot.duty - last_duty))
+            errors.append(plant.chamber_temperature - TARGET)
+        last_duty = snapshot.duty
+    dryer.close()
+    return (sum(chatter) / max(len(chatter), 1), blind,
+            math.sqrt(sum(e * e for e in errors) / max(len(errors), 1)))
+
+
+def filter_cost(kind, n=100000):
+    sensor_filter = SensorFilter(kind)
+    start = time.process_time()
+    for i in range(n):
+        sensor_filter.update(i * 0.5, 50.0 + (i % 7) * 0.0625)
+    return (time.process_time() - start) / n
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--hours', type=float, default=2.0, help='soak length')
+    parser.add_argument('--noise', type=float, default=0.2, help='probe noise, °C standard deviation')
+    parser.add_argument('--crc', type=float, default=0.05, help='CRC failure rate per read')
+    parser.add_argument('--spikes', type=float, default=0.005, help='85 °C spike rate per read')
+    args = parser.parse_args()
+
+    rows = []
+    stdout = sys.stdout
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ('off', 'ema', 'median', 'kalman'):
+            for retries in (0, 1):
+                sys.stdout = open(os.devnull, 'w')
+                try:
+                    result = run(kind, retries, args, tmp)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                rows.append((kind, retries) + result)
+
+    print(f"[BENCH] {TARGET:g} °C soak for {args.hours:g} h, noise {args.noise:g} °C, "
+          f"CRC failures {args.crc:.1%}, spikes {args.spikes:.1%}")
+    print("[BENCH] filter  retries  chatter %/tick  blind ticks  rms °C  us/read")
+    for kind, retries, chatter, blind, rms in rows:
+        cost = filter_cost(kind) * 1e6 if kind != 'off' else 0.0
+        print(f"[BENCH] {kind:6s}  {retries:7d}  {chatter:14.2f}  {blind:11d}  {rms:6.3f}  {cost:7.2f}")
+
+
+if __name__ == '__main__':
+    main()
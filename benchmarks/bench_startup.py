@@ -0,0 +1,86 @@
+# Cold-start time of the GUI broken down by phase, so regressions in import
+# time, build() or first-visit screen construction show up.
+#
+#   python benchmarks/bench_startup.py [--runs 5]
+#
+# Each run is a fresh interpreter. The child reports when each phase ended;
+# the parent prints the median duration per phase.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCREENS = ('settings', 'preset_selection', 'testing', 'chambers', 'diagnostics')
+
+
+def child():
+    t0 = time.perf_counter()
+    marks = []
+
+    def mark(phase):
+        marks.append((phase, time.perf_counter() - t0))
+
+    sys.path.insert(0, ROOT)
+    os.environ.setdefault('KIVY_NO_ARGS', '1')
+    os.environ.setdefault('KIVY_LOG_LEVEL', 'critical')
+    import kivy.app  # noqa: F401
+    mark('import kivy')
+    from kivy.clock import Clock
+    import filament_dryer_gui
+    mark('import app')
+
+    class TimedApp(filament_dryer_gui.FilamentDryerApp):
+        def build(self):
+            mark('App.run() until build')
+            root = super().build()
+            mark('build()')
+            return root
+
+        def on_start(self):
+            Clock.schedule_once(self.first_frame, 0)
+
+        def first_frame(self, dt):
+            mark('first frame')
+            for name in SCREENS:
+                self.ensure_screen(name)
+                mark(f'first visit: {name}')
+            # on_stop closes the dryer the testing page started
+            self.stop()
+
+    TimedApp().run()
+    print('MARKS ' + json.dumps(marks), flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--child', action='store_true')
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    durations = {}
+    totals = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT,
+                             capture_output=True, text=True, check=True).stdout
+        totals.append(time.perf_counter() - start)
+        marks = json.loads(next(line for line in out.splitlines() if line.startswith('MARKS '))[6:])
+        previous = 0.0
+        for phase, t in marks:
+            durations.setdefault(phase, []).append(t - previous)
+            previous = t
+    print(f"[BENCH] startup phases, median of {args.runs} runs")
+    for phase, values in durations.items():
+        print(f"[BENCH] {phase:<28} {statistics.median(values) * 1e3:8.1f} ms")
+    print(f"[BENCH] {'process total (incl. exit)':<28} {statistics.median(totals) * 1e3:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
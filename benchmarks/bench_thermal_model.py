@@ -0,0 +1,116 @@
+# Warm-up time, overshoot and energy per preset for the old stepped duty
+# table, the PID and the predictive controller on a model fitted from
+# telemetry. A simulated box first logs one PID run, the model is fitted from
+# that log the way the app does it, then every preset is run from cold with
+# each controller on a virtual clock.
+#
+#   warm-up   time until the program's ramp ends (probe within 1 °C)
+#   overshoot highest probe reading above the target during the soak
+#   error     RMS of probe - target over the soak
+#   energy    heater energy for the warm-up and for warm-up + soak
+#
+#   python benchmarks/bench_thermal_model.py [--soak 60] [--limit 4]
+import argparse
+import math
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from controllers import SteppedController, PIDController, PredictiveController
+from drying_program import SOAK, COOLDOWN
+from dryer import Dryer, ChamberConfig
+from preset_store import Preset, PresetStore
+from simulation import SimulatedBackend
+from thermal_model import fit_from_telemetry
+
+
+def make_dryer(tmp, name, seed):
+    backend = SimulatedBackend(speed=None, seed=seed)
+    return Dryer(backend=backend, chambers=[ChamberConfig('Box', backend.pin)],
+                 telemetry_dir=os.path.join(tmp, name))
+
+
+def identify(tmp, hours=3.0):
+    # One logged PETG run with the PID, then a fit from the log
+    dryer = make_dryer(tmp, 'identify', seed=1)
+    dryer.engine.set_controller(PIDController())
+    dryer.run_preset(Preset('PETG', 55.0, 60))
+    dryer.run(hours * 3600)
+    dryer.telemetry.flush()
+    start = time.perf_counter()
+    model = fit_from_telemetry(dryer.telemetry.directory)
+    elapsed = time.perf_counter() - start
+    dryer.close()
+    return model, elapsed
+
+
+def run(tmp, preset, controller, soak, limit):
+    dryer = make_dryer(tmp, f'{preset.name}-{type(controller).__name__}', seed=2)
+    engine = dryer.engine
+    engine.set_controller(controller)
+    dryer.run_preset(preset._replace(duration=soak))
+    plant = dryer.backend.plant
+    warmup = warmup_energy = None
+    overshoot = 0.0
+    errors = []
+    while engine.program is not None and (engine.snapshots.latest() is None or engine.snapshots.latest().t < limit):
+        dryer.run(dryer.period)
+        snapshot = engine.snapshots.latest()
+        status = snapshot.program
+        if status is None or status.stage_kind == COOLDOWN:
+            break
+        if status.stage_kind == SOAK:
+            if warmup is None:
+                warmup = snapshot.t
+                warmup_energy = plant.energy
+            overshoot = max(overshoot, snapshot.temperature - preset.temperature)
+            errors.append(snapshot.temperature - preset.temperature)
+    energy = plant.energy
+    dryer.close()
+    rms = math.sqrt(sum(e * e for e in errors) / len(errors)) if errors else None
+    return warmup, warmup_energy, overshoot, rms, energy
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--soak', type=int, default=60, help='soak minutes')
+    parser.add_argument('--limit', type=float, default=4.0, help='hours before a warm-up counts as failed')
+    parser.add_argument('--presets', default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'presets.json'))
+    args = parser.parse_args()
+    presets = list(PresetStore(args.presets))
+
+    stdout = sys.stdout
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            model, fit_time = identify(tmp)
+            if model is not None:
+                for preset in presets:
+                    for controller in (SteppedController(), PIDController(), PredictiveController(model)):
+                        rows.append((preset, type(controller).__name__.replace('Controller', '').lower(),
+                                     run(tmp, preset, controller, args.soak, args.limit * 3600)))
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+    if model is None:
+        print("[BENCH] The identification run did not give a model")
+        return
+    print(f"[BENCH] fitted in {fit_time * 1e3:.1f} ms: gain {model.gain:.3f} °C/%, tau {model.tau:.0f} s, "
+          f"dead time {model.dead_time:g} s, ambient {model.ambient:.1f} °C, rmse {model.rmse:.3f} °C")
+    print(f"[BENCH] soak {args.soak} min; warm-up that takes over {args.limit:g} h counts as failed")
+    print("[BENCH] preset  temp  controller  warm-up min  overshoot °C  soak rms °C  warm-up Wh  total Wh")
+    for preset, name, (warmup, warmup_energy, overshoot, rms, energy) in rows:
+        if warmup is None:
+            result = f"{'-':>11s}  {'-':>12s}  {'-':>11s}  {'-':>10s}"
+        else:
+            result = f"{warmup / 60:11.1f}  {overshoot:12.2f}  {rms:11.3f}  {warmup_energy / 3600:10.1f}"
+        print(f"[BENCH] {preset.name:6s}  {preset.temperature:4g}  {name:10s}  {result}  {energy / 3600:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# Compare the old glob + reopen + readlines sensor read with W1Sampler
+# against a fake 1-wire sysfs tree.
+#
+#   python benchmarks/bench_w1_sampler.py [--probes 3] [--iterations 5000]
+import argparse
+import glob
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from w1_sampler import W1Sampler, format_w1_slave
+
+
+def make_fake_tree(base_dir, probes):
+    for i in range(probes):
+        folder = os.path.join(base_dir, f'28-00000{i:07x}')
+        os.makedirs(folder)
+        with open(os.path.join(folder, 'w1_slave'), 'w') as f:
+            f.write(format_w1_slave(20.0 + i))
+    # Non-thermometer entries live in the same directory on a real Pi
+    os.makedirs(os.path.join(base_dir, 'w1_bus_master1'))
+
+
+def legacy_read_all(base_dir):
+    # What TestingPage.get_sensor_file/read_temperature did, once per probe
+    readings = {}
+    for folder in glob.glob(base_dir + '28-*'):
+        with open(folder + '/w1_slave', 'r') as f:
+            lines = f.readlines()
+        if lines[0].strip()[-3:] != 'YES':
+            readings[folder] = None
+            continue
+        equals_pos = lines[1].find('t=')
+        readings[folder] = float(lines[1][equals_pos + 2:]) / 1000.0 if equals_pos != -1 else None
+    return readings
+
+
+def bench(fn, iterations):
+    fn()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--probes', type=int, default=3)
+    parser.add_argument('--iterations', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        base_dir = tmp + '/'
+        make_fake_tree(base_dir, args.probes)
+        sampler = W1Sampler(base_dir=base_dir, hotplug_interval=30.0)
+        assert len(sampler.read_all()) == args.probes
+
+        legacy_us = bench(lambda: legacy_read_all(base_dir), args.iterations)
+        sampler_us = bench(sampler.read_all, args.iterations)
+        rescan_us = bench(sampler.rescan, args.iterations // 10 or 1)
+        sampler.close()
+
+    print(f"[BENCH] probes={args.probes} iterations={args.iterations}")
+    print(f"[BENCH] legacy glob+open+readlines: {legacy_us:8.1f} us/pass")
+    print(f"[BENCH] W1Sampler.read_all:         {sampler_us:8.1f} us/pass")
+    print(f"[BENCH] W1Sampler.rescan:           {rescan_us:8.1f} us/scan")
+    print(f"[BENCH] speedup: {legacy_us / sampler_us:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
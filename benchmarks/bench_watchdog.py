@@ -0,0 +1,251 @@
+# How quickly the heater watchdog (heater_watchdog.py) switches the heater
+# off, with every CPU busy. A simulated box with a kernel PWM heater runs a
+# preset in realtime (sped up by --speed) while a fault is provoked:
+#
+#   over-temperature  max_temperature below the preset
+#   runaway           the heater sticks at 100 % once the box is warm
+#   reading lost      the probe drops out and the filter keeps holding its
+#                     last value, so the controller keeps heating
+#   no rise           a heater with no power
+#   loop stalled      the sensor read blocks forever
+#   ui stalled        the touchscreen heartbeat stops
+#   watchdog lost     the watchdog process is killed (the dryer's own check)
+#
+# The latency is from the condition becoming true (the sample showing it was
+# published, or the heartbeat timeout ran out) to the fake PWM tree having
+# been written low; "dryer off" is how much later the dryer acknowledged
+# with every heater at 0. A latency over --deadline, a tree that is not low
+# or a fault that never comes fails the run. Then a few normal presets with
+# each controller run on a virtual clock through the same fault checks,
+# which must never trip. Each fault is then cleared the way the popup's
+# Clear Fault button does; "cleared" says the latch went (or re-latched on
+# a condition that still holds) within a second.
+#
+#   python benchmarks/bench_watchdog.py [--load 4] [--speed 50] [--deadline 0.25]
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dryer import Dryer, ChamberConfig
+from heater_watchdog import Watchdog, FaultDetector, DEFAULT_CONFIG, FAULTS
+from preset_store import Preset
+from sensor_filter import SensorFilterBank
+from simulation import SimulatedBackend
+
+TARGET = 60.0
+# Shorter timeouts than the defaults so every scenario finishes in seconds
+BENCH_CONFIG = {'stall_timeout': 1.0, 'ui_timeout': 1.0, 'no_rise_time': 300.0, 'kill_unresponsive': False}
+
+
+def over_temperature(dryer, backend):
+    return None
+
+
+def runaway(dryer, backend):
+    plant = backend.plant
+    plant.set_duty(100.0)
+    plant.set_duty = lambda duty: None
+
+
+def reading_lost(dryer, backend):
+    backend.simulated_sensors.dropped.update(backend.sensors.sensor_ids())
+
+
+def loop_stalled(dryer, backend):
+    blocked = threading.Event()
+    read_all = backend.sensors.read_all
+
+    def stuck():
+        blocked.wait()
+        return read_all()
+    backend.sensors.read_all = stuck
+    return blocked.set
+
+
+def ui_stalled(dryer, backend):
+    # The beat the app sends every second, then nothing
+    dryer.watchdog.ui_beat()
+
+
+def watchdog_lost(dryer, backend):
+    dryer.watchdog.process.kill()
+
+
+# name, trigger, when to trigger (chamber °C), plant options, watchdog options, filter options
+SCENARIOS = (
+    ('over-temperature', over_temperature, None, {}, {'max_temperature': 40.0}, {}),
+    ('runaway', runaway, 45.0, {}, {}, {}),
+    ('reading lost', reading_lost, 40.0, {}, {}, {'max_hold': 1e9}),
+    ('no rise', None, None, {'heater_power': 0.0}, {}, {}),
+    ('loop stalled', loop_stalled, 30.0, {}, {}, {}),
+    ('ui stalled', ui_stalled, 30.0, {}, {}, {}),
+    ('watchdog lost', watchdog_lost, 30.0, {}, {}, {}),
+)
+
+
+def run_scenario(scenario, args, tmp):
+    name, trigger, trigger_at, plant_options, watchdog_options, filter_options = scenario
+    backend = SimulatedBackend(speed=args.speed, seed=1, **plant_options)
+    heater = backend.heater_for(backend.pin, 'sysfs')
+    directory = os.path.join(tmp, name.replace(' ', '-'))
+    os.makedirs(directory)
+    watchdog = Watchdog([backend.watchdog_output(heater)], fault_file=os.path.join(directory, 'fault.json'),
+                        **dict(BENCH_CONFIG, **watchdog_options))
+    dryer = Dryer(backend=backend, chambers=[ChamberConfig('Box', backend.pin, heater='sysfs')],
+                  telemetry_dir=directory, sensor_filter=SensorFilterBank(**filter_options), watchdog=watchdog,
+                  checkpoint=False)
+    dryer.start()
+    dryer.run_preset(Preset('Bench', TARGET, 240))
+    release = None
+    triggered = None
+    fault = None
+    deadline = time.monotonic() + args.timeout
+    while time.monotonic() < deadline:
+        if triggered is None and trigger is not None and (
+                trigger_at is None or backend.plant.chamber_temperature >= trigger_at):
+            triggered = time.monotonic()
+            release = trigger(dryer, backend)
+        fault = dryer.fault()
+        if fault is not None:
+            break
+        time.sleep(0.001)
+    low = fault is not None and backend.pwm_tree.duty() == 0.0
+    off = None
+    if fault is not None:
+        # The dryer acknowledges from its fault thread, even with the tick stuck
+        end = time.monotonic() + 1.0
+        while time.monotonic() < end:
+            if watchdog.header.ack == watchdog.header.fault_seq and dryer.engine.duty == 0:
+                off = time.monotonic() - fault.acted
+                break
+            time.sleep(0.001)
+        if watchdog.local_fault is not None:
+            # Nobody else could force the output low
+            low = off is not None and backend.pwm_tree.duty() == 0.0
+    if release is not None:
+        release()
+    cleared = fault is not None and clear(dryer, fault)
+    dryer.close()
+    if fault is None:
+        return name, None, None, None, False, False
+    # The dryer notices a dead watchdog itself; count from the kill
+    onset = triggered if name == 'watchdog lost' else fault.onset
+    return name, fault, fault.acted - onset, off, low, cleared
+
+
+def clear(dryer, fault):
+    dryer.clear_fault()
+    end = time.monotonic() + 1.0
+    while time.monotonic() < end:
+        current = dryer.fault()
+        if current is None or current.acted != fault.acted:
+            return True
+        time.sleep(0.001)
+    return False
+
+
+def false_trips(kind, temperature, hours, tmp):
+    # A normal run on a virtual clock, every tick through the fault checks
+    os.environ['DRYER_CONTROLLER'] = kind
+    backend = SimulatedBackend(speed=None, seed=2)
+    dryer = Dryer(backend=backend, chambers=[ChamberConfig('Box', backend.pin)],
+                  telemetry_dir=os.path.join(tmp, f'normal-{kind}-{temperature:g}'), watchdog=False)
+    dryer.run_preset(Preset('Bench', temperature, int(hours * 60)))
+    detector = FaultDetector(DEFAULT_CONFIG)
+    engine = dryer.engine
+    trips = []
+    # The stepped table can settle short of the soak band, so the program
+    # may not finish; stop it after the run and watch the box cool
+    stop = backend.clock() + hours * 3600
+    end = stop + 1800
+    while backend.clock() < end:
+        if engine.program is not None and backend.clock() >= stop:
+            dryer.stop_program()
+        dryer.step()
+        backend.virtual_clock.sleep(dryer.period)
+        snapshot = engine.snapshots.latest()
+        temperature_now = snapshot.temperature if snapshot.temperature is not None else float('nan')
+        target = snapshot.target if snapshot.target is not None else float('nan')
+        result = detector.update(snapshot.t, temperature_now, target, snapshot.duty, snapshot.t)
+        if result is not None:
+            trips.append((snapshot.t, FAULTS[result[0]], result[1]))
+            detector = FaultDetector(DEFAULT_CONFIG)
+    dryer.close()
+    return trips
+
+
+def start_load(n):
+    return [subprocess.Popen([sys.executable, '-c', 'while True: pass']) for _ in range(n)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--load', type=int, default=os.cpu_count() or 1, help='busy processes while measuring')
+    parser.add_argument('--speed', type=float, default=50.0, help='virtual seconds per second')
+    parser.add_argument('--deadline', type=float, default=0.25, help='s from onset to heater off')
+    parser.add_argument('--timeout', type=float, default=60.0, help='s to wait for each fault')
+    parser.add_argument('--hours', type=float, default=2.0, help='length of the normal runs')
+    args = parser.parse_args()
+
+    rows = []
+    stdout = sys.stdout
+    load = start_load(args.load)
+    # The watchdog processes inherit the descriptor, not sys.stdout
+    saved = os.dup(1)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for scenario in SCENARIOS:
+                sys.stdout.flush()
+                devnull = os.open(os.devnull, os.O_WRONLY)
+                os.dup2(devnull, 1)
+                os.close(devnull)
+                try:
+                    rows.append(run_scenario(scenario, args, tmp))
+                finally:
+                    sys.stdout.flush()
+                    os.dup2(saved, 1)
+    finally:
+        os.close(saved)
+        for process in load:
+            process.kill()
+            process.wait()
+
+    failed = False
+    print(f"[BENCH] Watchdog poll {DEFAULT_CONFIG['poll'] * 1e3:g} ms, {args.load} busy processes, "
+          f"speed {args.speed:g}x, deadline {args.deadline * 1e3:g} ms")
+    print("[BENCH] scenario          fault                                      latency ms  dryer off ms  PWM low  cleared")
+    for name, fault, latency, off, low, cleared in rows:
+        if fault is None:
+            print(f"[BENCH] {name:16s}  no fault within {args.timeout:g} s")
+            failed = True
+            continue
+        ok = latency <= args.deadline and low and cleared
+        failed = failed or not ok
+        off_text = f"{off * 1e3:12.1f}" if off is not None else f"{'-':>12s}"
+        print(f"[BENCH] {name:16s}  {fault.reason:41s}  {latency * 1e3:10.1f}  {off_text}  "
+              f"{'yes' if low else 'NO':>7s}  {'yes' if cleared else 'NO':>7s}{'' if ok else '  MISSED'}")
+
+    print(f"[BENCH] Normal runs, {args.hours:g} h each plus 30 min cooling")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in ('pid', 'stepped'):
+            for temperature in (45.0, 60.0, 80.0):
+                sys.stdout = open(os.devnull, 'w')
+                try:
+                    trips = false_trips(kind, temperature, args.hours, tmp)
+                finally:
+                    sys.stdout.close()
+                    sys.stdout = stdout
+                failed = failed or bool(trips)
+                detail = f"  first: {trips[0][1]} at {trips[0][0]:.0f} s ({trips[0][2]:.2f})" if trips else ''
+                print(f"[BENCH] {kind:8s} {temperature:4g} °C  false trips {len(trips)}{detail}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,61 @@
+from kivy.metrics import sp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.button import Button
+from kivy.uix.gridlayout import GridLayout
+from kivy.clock import Clock
+from drying_program import describe_status
+from ui_updates import UI_UPDATES
+
+class ChambersPage(BoxLayout):
+    # One row per chamber: temperature, heater duty and program status, with
+    # start/stop buttons. Rows only change text when their snapshot did.
+    def __init__(self, switch_to_main, dryer, start_chamber, stop_chamber, **kwargs):
+        super().__init__(orientation='vertical', **kwargs)
+        self.dryer = dryer
+
+        self.add_widget(Label(text='Chambers', font_size=sp(32), bold=True, size_hint=(1, 0.15)))
+
+        self.grid_layout = GridLayout(cols=5, size_hint=(1, 0.7))
+        self.rows = []
+        for index, chamber in enumerate(dryer.chambers):
+            self.grid_layout.add_widget(Label(text=chamber.name, font_size=sp(18)))
+            temperature_label = Label(text='-- °C', font_size=sp(18))
+            self.grid_layout.add_widget(temperature_label)
+            status_label = Label(text='Idle', font_size=sp(14), halign='center', valign='middle')
+            status_label.bind(size=lambda label, size: setattr(label, 'text_size', size))
+            self.grid_layout.add_widget(status_label)
+
+            start_button = Button(text='Start', font_size=sp(18))
+            start_button.bind(on_press=lambda instance, i=index: start_chamber(i))
+            self.grid_layout.add_widget(start_button)
+
+            stop_button = Button(text='Stop', font_size=sp(18))
+            stop_button.bind(on_press=lambda instance, i=index: stop_chamber(i))
+            self.grid_layout.add_widget(stop_button)
+
+            self.rows.append((chamber, temperature_label, status_label, [0]))
+        self.add_widget(self.grid_layout)
+
+        self.back_button = Button(text='Back to Main', size_hint=(1, 0.15), font_size=sp(18))
+        self.back_button.bind(on_press=lambda instance: switch_to_main())
+        self.add_widget(self.back_button)
+
+        self.refresh_event = Clock.schedule_interval(self.refresh, 1.0)
+
+    def refresh(self, dt=None):
+        for chamber, temperature_label, status_label, last_seq in self.rows:
+            snapshot = chamber.latest()
+            if snapshot is None or snapshot.seq == last_seq[0]:
+                continue
+            last_seq[0] = snapshot.seq
+            if snapshot.temperature is None:
+                text = '-- °C'
+            else:
+                text = f'{snapshot.temperature:.1f}°C ({snapshot.duty:g}%)'
+            UI_UPDATES.set(temperature_label, text=text)
+            UI_UPDATES.set(status_label, text=describe_status(snapshot.program))
+
+    def on_parent(self, widget, parent):
+        if parent is None:
+            self.refresh_event.cancel()
@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import namedtuple
+from controllers import PIDController, RelayAutotuner
+
+# One published state of the control loop. `t` is seconds since the engine
+# started, `late` is how far behind its deadline the tick ran, `program` is
+# the running drying program's ProgramStatus (or None).
+Snapshot = namedtuple('Snapshot', 'seq t temperature readings target duty heating late program', defaults=(None,))
+
+
+class SnapshotRing:
+    # Fixed-size ring written by the control thread and read by the UI.
+    # The lock is only held for the slot swap, never across I/O.
+    def __init__(self, size=256):
+        self._slots = [None] * size
+        self._size = size
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def publish(self, snapshot):
+        with self._lock:
+            self._slots[snapshot.seq % self._size] = snapshot
+            self._seq = snapshot.seq
+
+    def latest(self):
+        with self._lock:
+            if self._seq == 0:
+                return None
+            return self._slots[self._seq % self._size]
+
+    def since(self, seq):
+        # Snapshots newer than `seq`, oldest first. Readers that fall more than
+        # one ring behind just lose the oldest entries.
+        with self._lock:
+            newest = self._seq
+            first = max(seq + 1, newest - self._size + 1, 1)
+            return [self._slots[i % self._size] for i in range(first, newest + 1)]
+
+
+class ControlEngine:
+    def __init__(self, read_temperatures, set_duty, period=0.5, controller=None, clock=time.monotonic, sleep=None, ring_size=256, telemetry=None):
+        self.read_temperatures = read_temperatures
+        self.set_duty = set_duty
+        self.period = period
+        self.controller = controller if controller is not None else PIDController()
+        self.clock = clock
+        # Simulated backends hand in their virtual clock's sleep
+        self.sleep = sleep
+        self.snapshots = SnapshotRing(ring_size)
+        self.telemetry = telemetry
+        self.target_temperature = None
+        self.control_active = False
+        self.program = None
+        self.program_status = None
+        self.duty = 0
+        self._seq = 0
+        self._start = None
+        self._tuned_controller = None
+        self._on_autotune = None
+        self._thread = None
+        self._stop_event = threading.Event()
+
+    def set_target(self, target):
+        self.target_temperature = target
+
+    def set_active(self, active):
+        if not active and self.autotuning:
+            self.cancel_autotune()
+        if active and not self.control_active:
+            self.controller.reset()
+        self.control_active = active
+
+    def run_program(self, program):
+        # Hand the setpoint over to a DryingProgram until it finishes
+        self.cancel_autotune()
+        self.controller.reset()
+        self.program = program
+        self.program_status = None
+        self.control_active = True
+
+    def stop_program(self):
+        self.program = None
+        self.program_status = None
+        self.control_active = False
+        self.target_temperature = None
+
+    def heater_off(self):
+        # Output 0 now rather than on the next step
+        self._apply_duty(0)
+
+    def set_controller(self, controller):
+        controller.reset()
+        self.controller = controller
+
+    @property
+    def autotuning(self):
+        return isinstance(self.controller, RelayAutotuner)
+
+    def autotune(self, on_complete=None, tuner=None):
+        # Run a relay experiment around the current target. When it finishes
+        # the previous controller comes back (with the new gains if it is a
+        # PID) and on_complete(tuner) is called from the control thread.
+        if self.autotuning:
+            return
+        self._tuned_controller = self.controller
+        self._on_autotune = on_complete
+        self.set_controller(tuner or RelayAutotuner())
+        self.control_active = True
+
+    def cancel_autotune(self):
+        if self.autotuning:
+            self.set_controller(self._tuned_controller)
+            self._tuned_controller = None
+            self._on_autotune = None
+
+    def _finish_autotune(self):
+        tuner = self.controller
+        restored = self._tuned_controller
+        if tuner.gains and isinstance(restored, PIDController):
+            restored.kp = tuner.gains['kp']
+            restored.ki = tuner.gains['ki']
+            restored.kd = tuner.gains['kd']
+        elif tuner.gains:
+            print(f"[CONTROL] Autotuned PID gains not applied: the {type(restored).__name__} "
+                  f"stays in control")
+        self.set_controller(restored)
+        self._tuned_controller = None
+        if self._on_autotune is not None:
+            self._on_autotune(tuner)
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='control-engine', daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=2.0):
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+        self._apply_duty(0)
+
+    def step(self, now=None, late=0.0):
+        # One control tick; callable directly when no thread is wanted
+        if now is None:
+            now = self.clock()
+        if self._start is None:
+            self._start = now
+        readings = self.read_temperatures()
+        temp = next(iter(readings.values()), None)
+        program = self.program
+        if program is not None:
+            self.target_temperature = program.update(now - self._start, temp)
+            self.program_status = program.status
+            if program.finished:
+                # Run complete: leave the heater off
+                self.program = None
+                self.control_active = False
+                self.target_temperature = None
+        status = self.program_status
+        target = self.target_temperature
+        if temp is not None and self.control_active and target is not None:
+            duty = self.controller.update(target, temp, now)
+            if self.controller.finished:
+                self._finish_autotune()
+        else:
+            # No reading or control disabled: never leave the heater on blind
+            duty = 0
+        self._apply_duty(duty)
+        self._seq += 1
+        snapshot = Snapshot(self._seq, now - self._start, temp, readings, target, duty, duty > 0, late, status)
+        self.snapshots.publish(snapshot)
+        if self.telemetry is not None:
+            self.telemetry.append_snapshot(snapshot)
+        return snapshot
+
+    def _apply_duty(self, duty):
+        if duty != self.duty:
+            self.set_duty(duty)
+            self.duty = duty
+
+    def run(self, duration=None):
+        # Run the loop on the calling thread, for `duration` seconds of engine
+        # time or until stop(). On a virtual clock this is faster than realtime.
+        self._stop_event.clear()
+        self._run(duration)
+
+    def _run(self, duration=None):
+        run_periodic(self.step, self.period, self.clock, self.sleep or self._stop_event.wait,
+                     self._stop_event, duration)
+
+
+def run_periodic(tick, period, clock, wait, stop_event, duration=None):
+    # Call tick(now, late) every `period` seconds of `clock` until stop_event
+    # is set or `duration` has passed. Scheduled on absolute deadlines so the
+    # time spent in tick() does not accumulate as drift; whole periods are
+    # skipped if a tick overran.
+    deadline = clock()
+    end = None if duration is None else deadline + duration
+    while not stop_event.is_set():
+        now = clock()
+        if end is not None and now >= end:
+            break
+        tick(now, now - deadline)
+        deadline += period
+        now = clock()
+        if now > deadline:
+            deadline += period * int((now - deadline) / period + 1)
+        wait(deadline - now)
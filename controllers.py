@@ -0,0 +1,278 @@
+import json
+import math
+import os
+from collections import deque
+from file_utils import write_json_atomic
+
+GAINS_FILE = 'controller_gains.json'
+
+
+class Controller:
+    # Maps (target, measured temperature, time in seconds) to a heater duty in %.
+    # `finished` lets one-shot controllers such as the autotuner signal the
+    # engine that they are done.
+    finished = False
+
+    def update(self, target, temperature, now):
+        raise NotImplementedError
+
+    def reset(self):
+        pass
+
+
+class SteppedController(Controller):
+    # The original 100/60/30/10/0 % duty table
+    def update(self, target, temperature, now):
+        error = target - temperature
+        if error > 5:
+            return 100
+        elif error > 2:
+            return 60
+        elif error > 0.5:
+            return 30
+        elif error > 0:
+            return 10
+        return 0
+
+
+class PIDController(Controller):
+    def __init__(self, kp=8.0, ki=0.02, kd=20.0, output_min=0.0, output_max=100.0,
+                 integral_limit=None, slew_rate=None, derivative_tau=5.0):
+        # kp in %/°C, ki in %/(°C*s), kd in %*s/°C. slew_rate limits the output
+        # change in %/s; derivative_tau low-pass filters the derivative term.
+        self.kp = kp
+        self.ki = ki
+        self.kd = kd
+        self.output_min = output_min
+        self.output_max = output_max
+        self.integral_limit = integral_limit
+        self.slew_rate = slew_rate
+        self.derivative_tau = derivative_tau
+        self.reset()
+
+    @property
+    def gains(self):
+        return {'kp': self.kp, 'ki': self.ki, 'kd': self.kd}
+
+    def reset(self):
+        self.integral = 0.0
+        self.derivative = 0.0
+        self.output = 0.0
+        self._last_temperature = None
+        self._last_time = None
+
+    def update(self, target, temperature, now):
+        dt = 0.0 if self._last_time is None else now - self._last_time
+        error = target - temperature
+
+        # Derivative on measurement: setpoint steps do not kick the output
+        if self._last_temperature is not None and dt > 0:
+            raw = -(temperature - self._last_temperature) / dt
+            alpha = dt / (self.derivative_tau + dt)
+            self.derivative += alpha * (raw - self.derivative)
+
+        p_term = self.kp * error
+        d_term = self.kd * self.derivative
+        integral = self.integral + self.ki * error * dt
+        limit = self.integral_limit if self.integral_limit is not None else self.output_max - self.output_min
+        integral = min(max(integral, -limit), limit)
+
+        output = p_term + integral + d_term
+        clamped = min(max(output, self.output_min), self.output_max)
+        # Anti-windup: only accept integration that does not push further into
+        # saturation
+        if output == clamped or (output > clamped) != (integral > self.integral):
+            self.integral = integral
+        output = min(max(p_term + self.integral + d_term, self.output_min), self.output_max)
+
+        if self.slew_rate is not None and self._last_time is not None:
+            step = self.slew_rate * dt
+            output = min(max(output, self.output - step), self.output + step)
+
+        self.output = output
+        self._last_temperature = temperature
+        self._last_time = now
+        return round(output, 1)
+
+
+class PredictiveController(Controller):
+    # Short-horizon predictive control on a fitted ThermalModel (see
+    # thermal_model.py). A Smith predictor takes the dead time out: an
+    # internal copy of the model is driven with the duty actually applied,
+    # and its change over the last dead_time seconds is added to the
+    # measurement. The output is the duty that brings the model to the target
+    # within `horizon` seconds, so it heats flat out while far away and eases
+    # onto the holding duty near the target instead of overshooting. A slow
+    # integral inside integral_band takes out what the model gets wrong
+    # (room temperature, a cold spool).
+    def __init__(self, model, horizon=None, ki=0.001, integral_band=2.0, integral_limit=20.0,
+                 output_min=0.0, output_max=100.0):
+        self.model = model
+        self.horizon = horizon if horizon is not None else max(model.dead_time, 30.0)
+        self.ki = ki
+        self.integral_band = integral_band
+        self.integral_limit = integral_limit
+        self.output_min = output_min
+        self.output_max = output_max
+        self.reset()
+
+    def reset(self):
+        self.integral = 0.0
+        self.output = 0.0
+        self.predicted = None
+        self._model_temperature = None
+        self._history = deque()
+        self._last_time = None
+
+    def update(self, target, temperature, now):
+        model = self.model
+        dt = 0.0 if self._last_time is None else now - self._last_time
+        if self._model_temperature is None:
+            self._model_temperature = temperature
+        elif dt > 0:
+            steady = model.ambient + model.gain * self.output
+            self._model_temperature = steady + (self._model_temperature - steady) * math.exp(-dt / model.tau)
+        self._history.append((now, self._model_temperature))
+        while len(self._history) > 1 and self._history[1][0] <= now - model.dead_time:
+            self._history.popleft()
+        # What the probe will read once the heat already committed arrives
+        self.predicted = temperature + self._model_temperature - self._history[0][1]
+
+        error = target - temperature
+        decay = math.exp(-self.horizon / model.tau)
+        output = (target - model.ambient - (self.predicted - model.ambient) * decay) / (model.gain * (1.0 - decay))
+        if abs(error) < self.integral_band and dt > 0:
+            integral = min(max(self.integral + self.ki * error * dt, -self.integral_limit), self.integral_limit)
+            # Anti-windup: do not integrate further into saturation
+            unclamped = output + integral
+            if self.output_min <= unclamped <= self.output_max or (unclamped > self.output_max) != (integral > self.integral):
+                self.integral = integral
+        output = min(max(output + self.integral, self.output_min), self.output_max)
+
+        self.output = output
+        self._last_time = now
+        return round(output, 1)
+
+
+# Gain rules for relay autotuning, as (Kp/Ku, Ti/Pu, Td/Pu)
+TUNING_RULES = {
+    'ziegler_nichols': (0.6, 0.5, 0.125),
+    'some_overshoot': (0.33, 0.5, 0.33),
+    'no_overshoot': (0.2, 0.5, 0.33),
+}
+
+
+class RelayAutotuner(Controller):
+    # Åström–Hägglund relay experiment: switch the heater between high and low
+    # around the target, measure the resulting limit cycle and derive the
+    # ultimate gain Ku = 4d / (pi * a) and period Pu from it.
+    def __init__(self, high=100.0, low=0.0, hysteresis=0.3, cycles=4, rule='some_overshoot', timeout=4 * 3600):
+        self.high = high
+        self.low = low
+        self.hysteresis = hysteresis
+        self.cycles = cycles
+        self.rule = rule
+        self.timeout = timeout
+        self.reset()
+
+    def reset(self):
+        self.finished = False
+        self.failed = False
+        self.gains = None
+        self.ultimate_gain = None
+        self.ultimate_period = None
+        self._output = self.high
+        self._start = None
+        self._peak_max = -math.inf
+        self._peak_min = math.inf
+        self._rise_times = []
+        self._amplitudes = []
+
+    def update(self, target, temperature, now):
+        if self.finished:
+            return self.low
+        if self._start is None:
+            self._start = now
+        if now - self._start > self.timeout:
+            self.finished = self.failed = True
+            return self.low
+
+        self._peak_max = max(self._peak_max, temperature)
+        self._peak_min = min(self._peak_min, temperature)
+        if self._output == self.high and temperature > target + self.hysteresis:
+            self._output = self.low
+        elif self._output == self.low and temperature < target - self.hysteresis:
+            # Each low->high switch closes one full oscillation period
+            self._output = self.high
+            if self._rise_times:
+                self._amplitudes.append((self._peak_max - self._peak_min) / 2.0)
+            self._rise_times.append(now)
+            self._peak_max = -math.inf
+            self._peak_min = math.inf
+            if len(self._amplitudes) >= self.cycles:
+                self._compute_gains()
+        return self._output
+
+    def _compute_gains(self):
+        # Ignore the first cycle, which still contains the warm-up transient
+        amplitudes = self._amplitudes[1:] or self._amplitudes
+        periods = [b - a for a, b in zip(self._rise_times, self._rise_times[1:])][1:] or [self._rise_times[-1] - self._rise_times[0]]
+        a = sum(amplitudes) / len(amplitudes)
+        pu = sum(periods) / len(periods)
+        d = (self.high - self.low) / 2.0
+        self.finished = True
+        if a <= 0 or pu <= 0:
+            self.failed = True
+            return
+        ku = 4.0 * d / (math.pi * a)
+        kp_ratio, ti_ratio, td_ratio = TUNING_RULES[self.rule]
+        kp = kp_ratio * ku
+        ti = ti_ratio * pu
+        td = td_ratio * pu
+        self.ultimate_gain = ku
+        self.ultimate_period = pu
+        self.gains = {'kp': kp, 'ki': kp / ti, 'kd': kp * td}
+
+
+def load_gains(name='default', path=GAINS_FILE):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file).get(name)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def save_gains(gains, name='default', path=GAINS_FILE):
+    try:
+        with open(path, 'r') as file:
+            all_gains = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        all_gains = {}
+    all_gains[name] = gains
+    write_json_atomic(path, all_gains, indent=2)
+
+
+def create_pid(name='default', path=GAINS_FILE, **kwargs):
+    # PID with this chamber's autotuned gains if there are any
+    gains = load_gains(name, path) or {}
+    return PIDController(**{**gains, **kwargs})
+
+
+CONTROLLER_KINDS = ('auto', 'pid', 'predictive', 'stepped')
+
+
+def create_controller(name='default', kind=None):
+    # The controller for a chamber. kind (or $DRYER_CONTROLLER): 'auto' uses
+    # the predictive controller once a thermal model has been fitted for
+    # `name` and the PID until then.
+    kind = kind or os.environ.get('DRYER_CONTROLLER', 'auto')
+    if kind == 'stepped':
+        return SteppedController()
+    if kind in ('auto', 'predictive'):
+        from thermal_model import load_model
+        model = load_model(name)
+        if model is not None:
+            return PredictiveController(model)
+        if kind == 'predictive':
+            print(f"[CONTROL] No thermal model for '{name}' yet, using the PID")
+    return create_pid(name)
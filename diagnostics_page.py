@@ -0,0 +1,97 @@
+from kivy.metrics import sp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.button import Button
+from kivy.uix.gridlayout import GridLayout
+from kivy.clock import Clock
+from metrics import METRICS, PROFILER, METRICS_FILE
+from ui_updates import UI_UPDATES
+
+# Histograms shown on the page, in order, with a short label
+SHOWN = (
+    ('dryer_sensor_read_seconds', 'Sensor read'),
+    ('dryer_control_lateness_seconds', 'Loop lateness'),
+    ('dryer_control_tick_seconds', 'Control tick'),
+    ('ui_graph_render_seconds', 'Graph render'),
+    ('ui_frame_interval_seconds', 'UI frame'),
+)
+
+
+def format_ms(seconds):
+    return '--' if seconds is None else f'{seconds * 1e3:.2f}'
+
+
+class DiagnosticsPage(BoxLayout):
+    def __init__(self, switch_to_main, metrics_file=METRICS_FILE, **kwargs):
+        super().__init__(orientation='vertical', **kwargs)
+        self.metrics_file = metrics_file
+
+        self.add_widget(Label(text='Diagnostics', font_size=sp(32), bold=True, size_hint=(1, 0.12)))
+
+        self.grid_layout = GridLayout(cols=5, size_hint=(1, 0.58))
+        for heading in ('', 'count', 'p50 ms', 'p99 ms', 'max ms'):
+            self.grid_layout.add_widget(Label(text=heading, font_size=sp(16), bold=True))
+        self.rows = {}
+        for name, label in SHOWN:
+            self.grid_layout.add_widget(Label(text=label, font_size=sp(16)))
+            cells = [Label(text='--', font_size=sp(16)) for _ in range(4)]
+            for cell in cells:
+                self.grid_layout.add_widget(cell)
+            self.rows[name] = cells
+        self.add_widget(self.grid_layout)
+
+        self.sensor_label = Label(text='Sensor errors: --', font_size=sp(16), size_hint=(1, 0.1))
+        self.add_widget(self.sensor_label)
+
+        button_layout = BoxLayout(size_hint=(1, 0.2))
+        self.export_button = Button(text='Export Metrics', font_size=sp(18))
+        self.export_button.bind(on_press=self.export_metrics)
+        button_layout.add_widget(self.export_button)
+
+        self.profile_button = Button(text='Start Profiling', font_size=sp(18))
+        self.profile_button.bind(on_press=self.toggle_profiling)
+        button_layout.add_widget(self.profile_button)
+
+        self.reset_button = Button(text='Reset', font_size=sp(18))
+        self.reset_button.bind(on_press=lambda instance: self.reset())
+        button_layout.add_widget(self.reset_button)
+
+        self.back_button = Button(text='Back to Main', font_size=sp(18))
+        self.back_button.bind(on_press=lambda instance: switch_to_main())
+        button_layout.add_widget(self.back_button)
+        self.add_widget(button_layout)
+
+        self.refresh_event = Clock.schedule_interval(self.refresh, 1.0)
+        self.refresh()
+
+    def refresh(self, dt=None):
+        for name, cells in self.rows.items():
+            histogram = METRICS.get(name)
+            if histogram is None:
+                continue
+            values = (str(histogram.count), format_ms(histogram.quantile(0.5)),
+                      format_ms(histogram.quantile(0.99)), format_ms(histogram.max if histogram.count else None))
+            for cell, text in zip(cells, values):
+                UI_UPDATES.set(cell, text=text)
+        reads = sum(c.value for c in METRICS.counters() if c.name == 'dryer_sensor_reads_total')
+        errors = sum(c.value for c in METRICS.counters() if c.name == 'dryer_sensor_read_errors_total')
+        rate = f'{100.0 * errors / reads:.2f}%' if reads else '--'
+        text = f'Sensor errors: {errors} of {reads} reads ({rate})'
+        UI_UPDATES.set(self.sensor_label, text=text)
+        UI_UPDATES.set(self.profile_button, text='Stop Profiling' if PROFILER.active else 'Start Profiling')
+
+    def export_metrics(self, instance=None):
+        METRICS.write_prometheus(self.metrics_file)
+        print(f'Metrics written to {self.metrics_file}')
+
+    def toggle_profiling(self, instance=None):
+        PROFILER.toggle()
+        self.refresh()
+
+    def reset(self):
+        METRICS.reset()
+        self.refresh()
+
+    def on_parent(self, widget, parent):
+        if parent is None:
+            self.refresh_event.cancel()
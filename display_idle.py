@@ -0,0 +1,140 @@
+import glob
+import os
+from kivy.clock import Clock
+from kivy.graphics import Color, Rectangle
+from kivy.uix.widget import Widget
+from ui_updates import UI_UPDATES
+
+# Seconds without a touch before the frame rate drops, and before the
+# display is blanked; 0 turns either off
+IDLE_TIMEOUT = float(os.environ.get('DRYER_IDLE_TIMEOUT', 60))
+BLANK_TIMEOUT = float(os.environ.get('DRYER_BLANK_TIMEOUT', 600))
+# Frame rates while idle and while blanked; input is only read once a frame,
+# so the blanked rate sets how fast a touch wakes the screen
+IDLE_FPS = float(os.environ.get('DRYER_IDLE_FPS', 10))
+BLANK_FPS = 4.0
+BACKLIGHT_DIR = '/sys/class/backlight'
+
+ACTIVE, IDLE, BLANK = 'active', 'idle', 'blank'
+
+
+class Backlight:
+    # Panel power through the kernel backlight class (the Pi touchscreen and
+    # most DSI panels). Without one, or without write access, blanking only
+    # draws black.
+    def __init__(self, directory=BACKLIGHT_DIR):
+        paths = sorted(glob.glob(os.path.join(directory, '*', 'bl_power')))
+        self.path = paths[0] if paths else None
+        self.powered = True
+
+    def set_power(self, on):
+        if self.path is None:
+            return False
+        try:
+            with open(self.path, 'w') as file:
+                # FB_BLANK_UNBLANK / FB_BLANK_POWERDOWN
+                file.write('0' if on else '4')
+            self.powered = on
+            return True
+        except OSError as e:
+            print(f"[DISPLAY] Cannot switch the backlight at {self.path}: {e}")
+            if not on:
+                # Blank by drawing black from now on. A failed power-on is
+                # retried on the next touch, or the panel would stay dark.
+                self.path = None
+            return False
+
+
+class BlankOverlay(Widget):
+    # Black cover over the whole window while blanked
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        with self.canvas:
+            Color(0, 0, 0, 1)
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=lambda w, pos: setattr(self.rect, 'pos', pos), size=lambda w, size: setattr(self.rect, 'size', size))
+
+
+class IdleDisplay:
+    # Drops Kivy's frame rate after IDLE_TIMEOUT without input and blanks the
+    # display after BLANK_TIMEOUT. Widget updates are held while blanked, so
+    # nothing is redrawn. A touch wakes it; the touch that wakes a blanked
+    # display is swallowed so it cannot press whatever is under the finger.
+    def __init__(self, window, idle_timeout=IDLE_TIMEOUT, blank_timeout=BLANK_TIMEOUT, idle_fps=IDLE_FPS,
+                 blank_fps=BLANK_FPS, backlight=None, updates=UI_UPDATES):
+        self.window = window
+        self.idle_timeout = idle_timeout
+        self.blank_timeout = blank_timeout
+        self.idle_fps = idle_fps
+        self.blank_fps = blank_fps
+        self.backlight = backlight if backlight is not None else Backlight()
+        self.updates = updates
+        # Kivy has no public way to change maxfps once running
+        self.active_fps = Clock._max_fps
+        self.state = ACTIVE
+        self.last_input = Clock.get_boottime()
+        self.swallowed = set()
+        self.overlay = None
+        window.bind(on_touch_down=self.on_touch_down, on_touch_move=self.on_touch_other,
+                    on_touch_up=self.on_touch_up, on_key_down=self.on_key_down)
+        self.check_event = Clock.schedule_interval(self.check, 1.0)
+
+    def close(self):
+        self.check_event.cancel()
+        self.wake()
+        self.window.unbind(on_touch_down=self.on_touch_down, on_touch_move=self.on_touch_other,
+                           on_touch_up=self.on_touch_up, on_key_down=self.on_key_down)
+
+    def check(self, dt=None):
+        idle = Clock.get_boottime() - self.last_input
+        if self.blank_timeout and idle >= self.blank_timeout:
+            if self.state != BLANK:
+                self.blank()
+        elif self.idle_timeout and idle >= self.idle_timeout and self.state == ACTIVE:
+            self.set_state(IDLE, self.idle_fps)
+
+    def set_state(self, state, fps):
+        print(f"[DISPLAY] {self.state} -> {state}, {fps:g} fps")
+        self.state = state
+        Clock._max_fps = fps
+
+    def blank(self):
+        self.updates.pause()
+        self.overlay = BlankOverlay(size=self.window.size)
+        self.window.add_widget(self.overlay)
+        self.backlight.set_power(False)
+        self.set_state(BLANK, self.blank_fps)
+
+    def wake(self):
+        self.last_input = Clock.get_boottime()
+        if self.state == ACTIVE:
+            if not self.backlight.powered:
+                self.backlight.set_power(True)
+            return
+        if self.state == BLANK:
+            self.backlight.set_power(True)
+            self.window.remove_widget(self.overlay)
+            self.overlay = None
+            self.updates.resume()
+        self.set_state(ACTIVE, self.active_fps)
+
+    def on_touch_down(self, window, touch):
+        blanked = self.state == BLANK
+        self.wake()
+        if blanked:
+            self.swallowed.add(touch.uid)
+            return True
+
+    def on_touch_other(self, window, touch):
+        self.last_input = Clock.get_boottime()
+        if touch.uid in self.swallowed:
+            return True
+
+    def on_touch_up(self, window, touch):
+        self.last_input = Clock.get_boottime()
+        if touch.uid in self.swallowed:
+            self.swallowed.discard(touch.uid)
+            return True
+
+    def on_key_down(self, window, *args):
+        self.wake()
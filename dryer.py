@@ -0,0 +1,418 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+from hardware import create_backend, backend_kind, PWM_PIN, HEATER_KINDS, HEATER_OPTIONS
+from control_engine import ControlEngine, run_periodic
+from controllers import create_controller
+from telemetry_log import TelemetryLog, TelemetryGroup, TELEMETRY_DIR
+from drying_program import program_from_preset, DryingProgram
+from metrics import METRICS, PROFILER
+from sensor_filter import SensorFilterBank
+from thermal_model import fit_from_telemetry, save_model
+from session_checkpoint import SessionCheckpoint, MAX_OUTAGE
+from preset_store import format_duration
+
+CHAMBERS_FILE = 'chambers.json'
+# DRYER_WATCHDOG=0 runs without the watchdog process
+WATCHDOG_ENABLED = os.environ.get('DRYER_WATCHDOG', '1') != '0'
+# DRYER_CHECKPOINT=0 neither saves running programs nor resumes them
+CHECKPOINT_ENABLED = os.environ.get('DRYER_CHECKPOINT', '1') != '0'
+
+# One dryer box: its heater pin, its probe (None = next unassigned probe on
+# the bus), the name its autotuned gains and thermal model are stored under,
+# the heater output type (see hardware.HEATER_KINDS) and that output's options
+ChamberConfig = namedtuple('ChamberConfig', 'name pin sensor_id gains heater options', defaults=(None, None, 'soft', None))
+CHAMBER_KEYS = ('name', 'pin', 'sensor', 'gains', 'heater')
+
+
+def load_chambers(path=CHAMBERS_FILE):
+    # chambers.json: [{"name": "Box 1", "pin": 18, "sensor": "28-...", "gains": "box1",
+    #                  "heater": "ssr", "window": 10}, ...]
+    # Keys other than CHAMBER_KEYS are options for the heater output, e.g.
+    # frequency, window, min_pulse, pwm_chip, pwm_channel (see
+    # hardware.HEATER_OPTIONS); ones the heater type does not take are
+    # dropped. Without the file there is a single chamber on PWM_PIN.
+    try:
+        with open(path, 'r') as file:
+            data = json.load(file)
+        configs = []
+        for c in data:
+            heater = c.get('heater', 'soft')
+            if heater not in HEATER_KINDS:
+                raise ValueError(f"{c['name']}: unknown heater type {heater!r}")
+            options = {}
+            for key, value in c.items():
+                if key in CHAMBER_KEYS:
+                    continue
+                if key in HEATER_OPTIONS[heater]:
+                    options[key] = value
+                else:
+                    print(f"[CHAMBERS] {c['name']}: ignoring {key!r}, not an option for heater type {heater}")
+            configs.append(ChamberConfig(c['name'], int(c['pin']), c.get('sensor'), c.get('gains'), heater, options))
+        return configs
+    except FileNotFoundError:
+        return [ChamberConfig('Dryer', PWM_PIN)]
+    except (json.JSONDecodeError, KeyError, ValueError, TypeError, AttributeError) as e:
+        print(f"[CHAMBERS] Could not read {path}: {e}. Using a single chamber.")
+        return [ChamberConfig('Dryer', PWM_PIN)]
+
+
+def chamber_backend(configs, kind=None, **kwargs):
+    kind = backend_kind(kind)
+    if kind == 'sim':
+        from simulation import sim_sensor_id
+        chambers = [(c.pin, c.sensor_id or sim_sensor_id(i)) for i, c in enumerate(configs)]
+        return create_backend(kind, chambers=chambers, **kwargs)
+    return create_backend(kind, pin=configs[0].pin, **kwargs)
+
+
+class Chamber:
+    # One box's control loop. It does not sample or schedule itself: the
+    # Dryer reads the whole bus once per tick and steps every chamber.
+    # `shared_bus` is set when this is the only chamber: without a probe of
+    # its own it then controls on every probe on the bus. A chamber among
+    # several never reads another box's probe; without one it reads nothing
+    # and its heater stays off.
+    def __init__(self, config, heater, sensor_id, clock, telemetry, shared_bus=False):
+        self.name = config.name
+        self.config = config
+        self.heater = heater
+        self.sensor_id = sensor_id
+        self.shared_bus = shared_bus
+        self.telemetry = telemetry
+        self.readings = {}
+        self.engine = ControlEngine(read_temperatures=self.read_temperatures, set_duty=heater.set_duty,
+                                    controller=create_controller(config.gains or 'default'), clock=clock,
+                                    telemetry=telemetry)
+
+    def read_temperatures(self):
+        if self.sensor_id is None:
+            return self.readings if self.shared_bus else {}
+        return {self.sensor_id: self.readings.get(self.sensor_id)}
+
+    def probe_readings(self, readings):
+        # This chamber's values out of one pass over the bus
+        if self.sensor_id is None:
+            return list(readings.values()) if self.shared_bus else []
+        return [readings.get(self.sensor_id)]
+
+    def run_preset(self, preset):
+        program = program_from_preset(preset)
+        self.engine.run_program(program)
+        self.telemetry.history_start = self.telemetry.session_start
+        print(f'{self.name} started: {preset.name} at {preset.temperature:g}°C for {preset.duration} min')
+        return program
+
+    def resume_program(self, program, outage, history_start=None):
+        # A run from a checkpoint; its history goes back to the session it started in
+        self.engine.run_program(program)
+        if history_start is not None:
+            self.telemetry.history_start = history_start
+        print(f"[CHECKPOINT] {self.name}: resuming {program.name} at stage {program.index + 1}/{len(program.stages)} "
+              f"({program.stage.kind}) after {format_duration(outage / 60)} off")
+
+    def stop_program(self):
+        self.engine.stop_program()
+        print(f'{self.name} stopped')
+
+    def latest(self):
+        return self.engine.snapshots.latest()
+
+    def fit_model(self):
+        # Fit and store this box's thermal model from its telemetry log
+        self.telemetry.flush()
+        model = fit_from_telemetry(self.telemetry.directory)
+        if model is None:
+            print(f"[MODEL] {self.name}: not enough heating in the log to fit a model yet")
+            return None
+        save_model(model, self.config.gains or 'default')
+        print(f"[MODEL] {self.name}: {model.gain:.3f} °C/%, tau {model.tau:.0f} s, "
+              f"dead time {model.dead_time:g} s, ambient {model.ambient:.1f} °C")
+        return model
+
+
+class Dryer:
+    # All chambers on this board with their backend and telemetry. It lives
+    # for the whole app, independent of which screen is showing. One thread
+    # samples the shared 1-wire bus and steps every chamber, however many
+    # there are. The raw readings go through `sensor_filter` (a
+    # SensorFilterBank, see sensor_filter.py) before the controllers see them.
+    # Once started, a watchdog process (heater_watchdog.py) checks every tick;
+    # while it has a fault latched every heater stays off. Pass watchdog=False
+    # to run without one, or a heater_watchdog.Watchdog to configure it.
+    # Running programs are saved to a SessionCheckpoint the same way
+    # (checkpoint=False to not) and resumed by start() after a restart.
+    def __init__(self, backend=None, telemetry_dir=TELEMETRY_DIR, chambers=None, period=0.5, sensor_filter=None,
+                 watchdog=None, checkpoint=None):
+        configs = chambers or load_chambers()
+        self.backend = backend or chamber_backend(configs)
+        self.period = period
+        self.sensor_filter = sensor_filter or SensorFilterBank()
+        self.watchdog = watchdog if watchdog is not False else None
+        self.watchdog_enabled = watchdog is not False and WATCHDOG_ENABLED
+        self._fault_seq = None
+        self.checkpoint = checkpoint if checkpoint is not False else None
+        self.checkpoint_enabled = checkpoint is not False and CHECKPOINT_ENABLED
+        probes = [s for s in self.backend.sensors.sensor_ids() if s not in {c.sensor_id for c in configs}]
+        self.chambers = []
+        for config in configs:
+            sensor_id = config.sensor_id
+            if sensor_id is None and len(configs) > 1:
+                sensor_id = probes.pop(0) if probes else None
+                if sensor_id is None:
+                    print(f"[CHAMBERS] No probe left for {config.name}; its heater stays off")
+            if len(configs) == 1:
+                directory = telemetry_dir
+                sensor_ids = self.backend.sensors.sensor_ids() if sensor_id is None else [sensor_id]
+            else:
+                directory = os.path.join(telemetry_dir, re.sub(r'[^A-Za-z0-9_-]+', '_', config.name))
+                sensor_ids = [sensor_id] if sensor_id else []
+            telemetry = TelemetryLog(directory, sensor_ids=sensor_ids)
+            heater = self.backend.heater_for(config.pin, config.heater, **(config.options or {}))
+            self.chambers.append(Chamber(config, heater, sensor_id,
+                                         self.backend.clock, telemetry, shared_bus=len(configs) == 1))
+        self.telemetry_group = TelemetryGroup([c.telemetry for c in self.chambers])
+        self.readings = {}
+        self.raw_readings = {}
+        # Dryer clock of each chamber's last good raw reading
+        self._reading_clock = [None] * len(self.chambers)
+        # Commands can come from the UI or API threads; they never run in the
+        # middle of a control tick
+        self._lock = threading.Lock()
+        self._sensor_read_time = METRICS.histogram('dryer_sensor_read_seconds', 'Time to read every probe on the bus')
+        self._lateness = METRICS.histogram('dryer_control_lateness_seconds', 'How far behind its deadline a control tick started')
+        self._tick_time = METRICS.histogram('dryer_control_tick_seconds', 'Time for one tick: sensors, controllers, outputs')
+        self._sensor_counters = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._fault_thread = None
+
+    @property
+    def engine(self):
+        # The first chamber, for single-chamber screens
+        return self.chambers[0].engine
+
+    @property
+    def telemetry(self):
+        return self.chambers[0].telemetry
+
+    def chamber(self, index=0):
+        return self.chambers[index]
+
+    def step(self, now=None, late=0.0):
+        # One sampling pass over the bus feeds every chamber's control loop
+        if PROFILER.active:
+            return PROFILER.run(self._step, now, late)
+        return self._step(now, late)
+
+    def _step(self, now, late):
+        start = time.perf_counter()
+        if now is None:
+            now = self.backend.clock()
+        self.backend.poll(now)
+        readings = self.backend.sensors.read_all()
+        self._sensor_read_time.observe(time.perf_counter() - start)
+        self._lateness.observe(late)
+        for sensor_id, value in readings.items():
+            counters = self._sensor_counters.get(sensor_id)
+            if counters is None:
+                counters = self._sensor_counters[sensor_id] = (
+                    METRICS.counter('dryer_sensor_reads_total', 'Probe reads', sensor=sensor_id),
+                    METRICS.counter('dryer_sensor_read_errors_total', 'Probe reads that failed CRC or parsing', sensor=sensor_id))
+            counters[0].inc()
+            if value is None:
+                counters[1].inc()
+        raw_readings = readings
+        readings = self.sensor_filter.update(now, readings)
+        watchdog = self.watchdog
+        fault = watchdog.fault() if watchdog is not None else None
+        with self._lock:
+            self.raw_readings = raw_readings
+            self.readings = readings
+            if fault is not None:
+                self._enforce_fault(fault)
+            for index, chamber in enumerate(self.chambers):
+                chamber.readings = readings
+                snapshot = chamber.engine.step(now, late)
+                if watchdog is not None:
+                    probes = chamber.probe_readings(raw_readings)
+                    if any(value is not None for value in probes) or self._reading_clock[index] is None:
+                        self._reading_clock[index] = now
+                    watchdog.publish(index, now, snapshot.temperature, snapshot.target, snapshot.duty,
+                                     self._reading_clock[index])
+            if fault is not None:
+                # Every heater has been set to 0 by the steps above
+                watchdog.acknowledge()
+            if self.checkpoint is not None:
+                self._checkpoint()
+        if watchdog is not None:
+            watchdog.beat()
+        self._tick_time.observe(time.perf_counter() - start)
+
+    def _enforce_fault(self, fault):
+        # Nothing heats while a fault is latched, whatever asked for it
+        if fault.acted != self._fault_seq:
+            self._fault_seq = fault.acted
+            print(f"[WATCHDOG] {fault.reason}; all heaters off until the fault is cleared")
+            for chamber in self.chambers:
+                chamber.heater.forced_low()
+        for chamber in self.chambers:
+            if chamber.engine.control_active or chamber.engine.program is not None:
+                chamber.engine.set_active(False)
+                chamber.engine.stop_program()
+            chamber.engine.heater_off()
+
+    def _watch_faults(self):
+        # Acknowledges a fault as soon as it latches. A tick can spend well
+        # over the watchdog's ack_timeout in a sequential read of several
+        # probes, and a dryer that does not acknowledge in time is killed.
+        while not self._stop_event.wait(self.watchdog.config['poll']):
+            watchdog = self.watchdog
+            fault = watchdog.fault() if watchdog is not None else None
+            if fault is None or (fault.acted == self._fault_seq and watchdog.acknowledged):
+                continue
+            with self._lock:
+                self._enforce_fault(fault)
+                watchdog.acknowledge()
+
+    def _checkpoint(self, force=False):
+        # Runs under the lock every tick; the state is only built when a
+        # write is due and written by the checkpoint's own thread
+        running = [(c, c.engine.program) for c in self.chambers if c.engine.program is not None]
+        key = tuple((c.name, id(program), program.index) for c, program in running) or None
+        if not force and not self.checkpoint.due(key):
+            return
+        state = None
+        if running:
+            state = {'chambers': [{'name': c.name, 'history_start': c.telemetry.history_start,
+                                   'program': program.checkpoint()} for c, program in running]}
+        self.checkpoint.submit(key, state)
+
+    def resume(self):
+        # Carry on with the programs a power cut or restart interrupted.
+        # Returns the chambers that were resumed.
+        state = self.checkpoint.load() if self.checkpoint is not None else None
+        if state is None or any(c.engine.program is not None for c in self.chambers):
+            return []
+        outage = self.checkpoint.clock() - state.get('time', 0.0)
+        if outage < 0:
+            # No RTC on a Pi: the clock may not be set yet after a power cut
+            print("[CHECKPOINT] The clock is behind the checkpoint; resuming as if no time had passed")
+        elif outage > MAX_OUTAGE:
+            print(f"[CHECKPOINT] Not resuming: the run was interrupted {format_duration(outage / 60)} ago")
+            self.checkpoint.clear()
+            return []
+        fault = self.fault()
+        if fault is not None:
+            print(f"[CHECKPOINT] Not resuming: {fault.reason}")
+            self.checkpoint.clear()
+            return []
+        resumed = []
+        with self._lock:
+            for entry in state.get('chambers', []):
+                chamber = next((c for c in self.chambers if c.name == entry.get('name')), None)
+                if chamber is None:
+                    print(f"[CHECKPOINT] No chamber {entry.get('name')} to resume")
+                    continue
+                try:
+                    program = DryingProgram.from_checkpoint(entry['program'], outage)
+                except (KeyError, TypeError, ValueError) as e:
+                    print(f"[CHECKPOINT] Could not resume {chamber.name}: {e}")
+                    continue
+                if not program.finished:
+                    chamber.resume_program(program, max(outage, 0.0), entry.get('history_start'))
+                    resumed.append(chamber)
+        return resumed
+
+    def fault(self):
+        # The watchdog's latched fault (heater_watchdog.WatchdogFault) or None
+        return self.watchdog.fault() if self.watchdog is not None else None
+
+    def clear_fault(self):
+        if self.watchdog is not None:
+            self.watchdog.clear()
+            self._fault_seq = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        if self.watchdog is None and self.watchdog_enabled:
+            from heater_watchdog import Watchdog
+            self.watchdog = Watchdog([self.backend.watchdog_output(c.heater) for c in self.chambers])
+        if self.watchdog is not None and self.watchdog.process is None:
+            self.watchdog.start()
+        if self.checkpoint is None and self.checkpoint_enabled:
+            self.checkpoint = SessionCheckpoint()
+        if self.checkpoint is not None:
+            self.resume()
+            self.checkpoint.start()
+        self.telemetry_group.start()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='dryer', daemon=True)
+        self._thread.start()
+        if self.watchdog is not None:
+            self._fault_thread = threading.Thread(target=self._watch_faults, name='dryer-faults', daemon=True)
+            self._fault_thread.start()
+
+    def run(self, duration=None):
+        # Run the loop on the calling thread; on a virtual clock this is
+        # faster than realtime
+        self._stop_event.clear()
+        self._run(duration)
+
+    def _run(self, duration=None):
+        run_periodic(self.step, self.period, self.backend.clock, self.backend.sleep or self._stop_event.wait,
+                     self._stop_event, duration)
+
+    def run_preset(self, preset, chamber=0):
+        fault = self.fault()
+        if fault is not None:
+            print(f"[WATCHDOG] Not starting {preset.name}: {fault.reason}. Clear the fault first.")
+            return None
+        with self._lock:
+            return self.chambers[chamber].run_preset(preset)
+
+    def stop_program(self, chamber=0):
+        with self._lock:
+            self.chambers[chamber].stop_program()
+
+    def latest(self, chamber=0):
+        return self.chambers[chamber].latest()
+
+    def fit_model(self, chamber=0):
+        # The fit runs on the calling thread; only the switch to the new
+        # controller waits for the control loop. An autotune in progress
+        # keeps its controller, the model is used from the next start.
+        chamber = self.chambers[chamber]
+        model = chamber.fit_model()
+        if model is not None:
+            controller = create_controller(chamber.config.gains or 'default')
+            with self._lock:
+                if not chamber.engine.autotuning:
+                    chamber.engine.set_controller(controller)
+        return model
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+        if self._fault_thread is not None:
+            self._fault_thread.join(2.0)
+            self._fault_thread = None
+        for chamber in self.chambers:
+            chamber.engine.stop()
+        if self.checkpoint is not None:
+            # A clean shutdown mid-run resumes like a power cut, from now
+            self._checkpoint(force=True)
+            self.checkpoint.close()
+            self.checkpoint = None
+        self.telemetry_group.close()
+        # The watchdog goes first: it may still touch the backend's outputs
+        if self.watchdog is not None:
+            self.watchdog.close()
+            self.watchdog = None
+        self.backend.close()
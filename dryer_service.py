@@ -0,0 +1,594 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import signal
+import socket
+import struct
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs, unquote
+from preset_store import Preset, parse_library, parse_preset, parse_field
+from preset_index import PresetIndex, SORT_KEYS
+from metrics import METRICS, PROFILER, MetricsExporter
+
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+WS_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC11B65'
+
+# Streamed values are sent as integers in these units: t in ms, temperatures
+# in 1/100 °C, duty in 1/10 %
+STREAM_SCALES = {'t': 1000, 'temperature': 100, 'target': 100, 'duty': 10}
+MIN_INTERVAL = 0.1
+MAX_INTERVAL = 60.0
+MAX_MESSAGE = 64 * 1024
+
+
+def delta_encode(values, scale):
+    # First value absolute, the rest as differences, all scaled to ints.
+    # None stays None and the next value is relative to the last non-None one.
+    out = []
+    last = None
+    for value in values:
+        if value is None:
+            out.append(None)
+            continue
+        q = int(round(value * scale))
+        out.append(q if last is None else q - last)
+        last = q
+    return out
+
+
+def delta_decode(encoded, scale):
+    values = []
+    last = None
+    for d in encoded:
+        if d is None:
+            values.append(None)
+            continue
+        last = d if last is None else last + d
+        values.append(last / scale)
+    return values
+
+
+def snapshot_json(snapshot):
+    if snapshot is None:
+        return None
+    return {'seq': snapshot.seq, 't': snapshot.t, 'temperature': snapshot.temperature, 'readings': snapshot.readings,
+            'target': snapshot.target, 'duty': snapshot.duty, 'heating': snapshot.heating,
+            'program': status_json(snapshot.program)}
+
+
+def status_json(status):
+    return None if status is None else status._asdict()
+
+
+def fault_json(fault):
+    if fault is None:
+        return None
+    return {'code': fault.code, 'reason': fault.reason, 'chamber': fault.chamber, 'value': fault.value,
+            'latency': fault.acted - fault.onset}
+
+
+def preset_json(preset):
+    return preset._asdict()
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def json_object(body):
+    # A request body that must be a JSON object; no body is an empty one
+    if body is None:
+        return {}
+    if not isinstance(body, dict):
+        raise ApiError(400, 'Expected a JSON object')
+    return body
+
+
+class StreamClient:
+    # One WebSocket subscriber. `interval` is how often it gets a batch and
+    # `sample` the spacing (engine seconds) between the snapshots in it, so a
+    # dashboard can ask for a point a minute while a local UI takes them all.
+    def __init__(self, connection, chambers):
+        self.connection = connection
+        self.send_lock = threading.Lock()
+        self.interval = 1.0
+        self.sample = 0.0
+        self.chambers = list(range(chambers))
+        self.next_send = 0.0
+        self.last_seq = {}
+        self.last_sample = {}
+        self.last_program = {}
+        self.closed = False
+
+    def configure(self, message, chambers):
+        if 'interval' in message:
+            self.interval = min(max(float(message['interval']), MIN_INTERVAL), MAX_INTERVAL)
+        if 'sample' in message:
+            self.sample = max(float(message['sample']), 0.0)
+        if 'chambers' in message:
+            self.chambers = [int(i) for i in message['chambers'] if 0 <= int(i) < chambers]
+        self.next_send = 0.0
+
+    def send_text(self, text):
+        data = text.encode()
+        header = bytes([0x81])
+        if len(data) < 126:
+            header += bytes([len(data)])
+        elif len(data) < 1 << 16:
+            header += bytes([126]) + struct.pack('!H', len(data))
+        else:
+            header += bytes([127]) + struct.pack('!Q', len(data))
+        self.send_frame(header + data)
+
+    def send_frame(self, frame):
+        with self.send_lock:
+            self.connection.sendall(frame)
+
+
+class DryerService:
+    # Local HTTP API for presets and start/stop, and a WebSocket telemetry
+    # stream, around a running Dryer. Request handlers run on the server's
+    # threads; `dispatch` runs state changes somewhere else (the Kivy main
+    # thread when the GUI is up), the default runs them in place.
+    def __init__(self, dryer, presets, host=API_HOST, port=API_PORT, dispatch=None, stream_tick=0.1, preset_index=None):
+        self.dryer = dryer
+        self.presets = presets
+        self.preset_index = preset_index if preset_index is not None else PresetIndex(presets)
+        self.dispatch = dispatch or (lambda fn: fn())
+        self.stream_tick = stream_tick
+        self.clients = []
+        self._clients_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._threads = []
+        self.server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self.server.daemon_threads = True
+        self.address = self.server.server_address
+
+    def start(self):
+        for target, name in ((self.server.serve_forever, 'api-http'), (self._stream, 'api-stream')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"[API] Listening on http://{self.address[0]}:{self.address[1]}")
+
+    def close(self):
+        self._stop_event.set()
+        self.server.shutdown()
+        self.server.server_close()
+        with self._clients_lock:
+            clients = list(self.clients)
+        for client in clients:
+            self._drop(client)
+        for thread in self._threads:
+            thread.join(2.0)
+        self._threads = []
+
+    # HTTP
+
+    def handle(self, method, path, query, body):
+        parts = [unquote(p) for p in path.split('/') if p]
+        if parts[:1] != ['api']:
+            raise ApiError(404, 'Not found')
+        parts = parts[1:]
+        if parts == ['chambers'] and method == 'GET':
+            return [self.chamber_json(i) for i in range(len(self.dryer.chambers))]
+        if parts[:1] == ['chambers'] and len(parts) >= 2:
+            index = self.chamber_index(parts[1])
+            if len(parts) == 2 and method == 'GET':
+                return self.chamber_json(index)
+            if parts[2:] == ['start'] and method == 'POST':
+                return self.start_chamber(index, body)
+            if parts[2:] == ['stop'] and method == 'POST':
+                self.dispatch(lambda: self.dryer.stop_program(index))
+                return {'chamber': index, 'stopped': True}
+            if parts[2:] == ['history'] and method == 'GET':
+                return self.history(index, query)
+            if parts[2:] == ['model']:
+                return self.model(index, method)
+        if parts == ['fault']:
+            # The watchdog's latched fault; DELETE clears it
+            if method == 'GET':
+                return {'fault': fault_json(self.dryer.fault())}
+            if method == 'DELETE':
+                self.dispatch(self.dryer.clear_fault)
+                return {'cleared': True}
+        if parts == ['profile']:
+            # {"enabled": true} starts profiling control ticks, false saves it
+            if method == 'POST':
+                if json_object(body).get('enabled'):
+                    PROFILER.start()
+                    return {'profiling': True}
+                return {'profiling': False, 'path': PROFILER.stop()}
+            if method == 'GET':
+                return {'profiling': PROFILER.active}
+        if parts == ['presets'] and method == 'GET':
+            return self.search_presets(query)
+        if parts == ['presets'] and method == 'POST':
+            return self.import_presets(body)
+        if parts[:1] == ['presets'] and len(parts) == 2:
+            name = parts[1]
+            if method == 'GET':
+                return preset_json(self.preset(name))
+            if method in ('PUT', 'POST'):
+                return self.update_preset(name, body)
+            if method == 'DELETE':
+                self.preset(name)
+                self.dispatch(lambda: self.save_presets(remove=name))
+                return {'name': name, 'removed': True}
+        raise ApiError(404 if method == 'GET' else 405, f'No route for {method} {path}')
+
+    def chamber_index(self, text):
+        try:
+            index = int(text)
+        except ValueError:
+            names = [c.name for c in self.dryer.chambers]
+            if text not in names:
+                raise ApiError(404, f'No chamber {text}')
+            return names.index(text)
+        if not 0 <= index < len(self.dryer.chambers):
+            raise ApiError(404, f'No chamber {index}')
+        return index
+
+    def chamber_json(self, index):
+        chamber = self.dryer.chambers[index]
+        return {'index': index, 'name': chamber.name, 'pin': chamber.config.pin, 'sensor_id': chamber.sensor_id,
+                'snapshot': snapshot_json(chamber.latest())}
+
+    def preset(self, name):
+        preset = self.presets.get(name)
+        if preset is None:
+            raise ApiError(404, f'No preset {name}')
+        return preset
+
+    def start_chamber(self, index, body):
+        # {"preset": "PLA"} or an ad-hoc {"temperature": 50, "duration": 120}
+        body = json_object(body)
+        try:
+            if 'preset' in body:
+                preset = self.preset(body['preset'])
+            else:
+                preset = parse_preset(str(body.get('name', 'Manual')), body)
+        except (KeyError, TypeError, ValueError):
+            raise ApiError(400, 'Expected {"preset": name} or {"temperature": °C, "duration": minutes}')
+        fault = self.dryer.fault()
+        if fault is not None:
+            raise ApiError(409, f'Heater fault latched: {fault.reason}. DELETE /api/fault to clear it')
+        self.dispatch(lambda: self.dryer.run_preset(preset, index))
+        return {'chamber': index, 'preset': preset_json(preset)}
+
+    def update_preset(self, name, body):
+        body = json_object(body)
+        fields = {}
+        try:
+            for key in Preset._fields[1:]:
+                if key in body:
+                    fields[key] = parse_field(key, body[key])
+        except (TypeError, ValueError) as e:
+            raise ApiError(400, f'Invalid preset fields: {e}')
+        if name not in self.presets and 'temperature' not in fields:
+            raise ApiError(400, 'A new preset needs a temperature')
+        current = self.presets.get(name) or Preset(name, fields['temperature'])
+        self.dispatch(lambda: self.save_presets(name, fields))
+        return preset_json(current._replace(**fields))
+
+    def search_presets(self, query):
+        # ?q= filters like the preset screens' search box, ?sort=name,
+        # material or temperature, ?limit= caps the list
+        text = query.get('q', [''])[0]
+        sort = query.get('sort', ['name'])[0]
+        if sort not in SORT_KEYS:
+            raise ApiError(400, f'sort must be one of {", ".join(SORT_KEYS)}')
+        try:
+            limit = int(query['limit'][0]) if 'limit' in query else None
+        except ValueError:
+            limit = -1
+        if limit is not None and limit < 0:
+            raise ApiError(400, 'Invalid limit')
+        names = self.preset_index.search(text, sort)[:limit]
+        return [preset_json(self.presets.presets[n]) for n in names if n in self.presets.presets]
+
+    def import_presets(self, body):
+        # A whole library, {name: fields} or [{"name": ..., fields}], merged
+        # into the presets and saved
+        if not isinstance(body, (dict, list)):
+            raise ApiError(400, 'Expected {name: fields} or [{"name": ..., "temperature": ...}]')
+        presets, skipped = parse_library(body)
+        if not presets:
+            raise ApiError(400, f'No valid presets ({skipped} skipped)')
+        self.dispatch(lambda: self.save_presets(imported=presets))
+        return {'imported': len(presets), 'skipped': skipped}
+
+    def save_presets(self, name=None, fields=None, remove=None, imported=None):
+        if remove is not None:
+            self.presets.remove(remove)
+        elif imported is not None:
+            self.presets.update_many(imported)
+        else:
+            self.presets.update(name, **fields)
+        self.presets.save()
+
+    def history(self, index, query):
+        # Decimated run history from the chamber's telemetry log
+        from telemetry_log import query as query_log, decimate
+        telemetry = self.dryer.chambers[index].telemetry
+        try:
+            t0 = float(query['t0'][0]) if 't0' in query else None
+            t1 = float(query['t1'][0]) if 't1' in query else None
+            points = int(query.get('points', ['600'])[0])
+        except ValueError:
+            raise ApiError(400, 'Invalid history query')
+        telemetry.flush()
+        _, records = query_log(t0, t1, directory=telemetry.directory, session_start=telemetry.session_start)
+        times, temps, duties = decimate(records, max(points, 1))
+        return {'chamber': index, 't': times.tolist(),
+                'temperature': [None if v != v else v for v in temps.tolist()], 'duty': duties.tolist()}
+
+    def model(self, index, method):
+        # GET the stored thermal model, POST to fit it from the telemetry log.
+        # The fit runs on this request's thread, not through dispatch, so the
+        # UI does not stall while it runs.
+        if method == 'POST':
+            model = self.dryer.fit_model(index)
+            if model is None:
+                raise ApiError(409, 'Not enough heating in the log to fit a model yet')
+        elif method == 'GET':
+            from thermal_model import load_model
+            model = load_model(self.dryer.chambers[index].config.gains or 'default')
+            if model is None:
+                raise ApiError(404, 'No thermal model fitted for this chamber')
+        else:
+            raise ApiError(405, f'No route for {method} model')
+        controller = self.dryer.chambers[index].engine.controller
+        return {'chamber': index, 'model': model._asdict(), 'controller': type(controller).__name__}
+
+    # WebSocket
+
+    def accept(self, handler):
+        key = handler.headers.get('Sec-WebSocket-Key')
+        if handler.headers.get('Upgrade', '').lower() != 'websocket' or not key:
+            raise ApiError(400, 'Expected a WebSocket upgrade')
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WS_GUID).digest()).decode()
+        handler.send_response(101, 'Switching Protocols')
+        handler.send_header('Upgrade', 'websocket')
+        handler.send_header('Connection', 'Upgrade')
+        handler.send_header('Sec-WebSocket-Accept', accept)
+        handler.end_headers()
+        handler.wfile.flush()
+        client = StreamClient(handler.connection, len(self.dryer.chambers))
+        with self._clients_lock:
+            self.clients.append(client)
+        try:
+            self._read_messages(client, handler.rfile)
+        finally:
+            self._drop(client)
+
+    def _read_messages(self, client, rfile):
+        # Clients send JSON text messages such as
+        # {"interval": 5, "sample": 10, "chambers": [0, 2]}
+        while not client.closed:
+            frame = _read_frame(rfile)
+            if frame is None:
+                return
+            opcode, payload = frame
+            if opcode == 0x8:
+                client.send_frame(bytes([0x88, 0]))
+                return
+            if opcode == 0x9:
+                if len(payload) > 125:
+                    # Control frames carry at most 125 bytes: protocol error
+                    client.send_frame(bytes([0x88, 2]) + (1002).to_bytes(2, 'big'))
+                    return
+                client.send_frame(bytes([0x8A, len(payload)]) + payload)
+            elif opcode == 0x1:
+                try:
+                    client.configure(json.loads(payload), len(self.dryer.chambers))
+                except (ValueError, TypeError, AttributeError) as e:
+                    client.send_text(json.dumps({'type': 'error', 'error': f'Bad subscription: {e}'}))
+
+    def _drop(self, client):
+        client.closed = True
+        with self._clients_lock:
+            if client in self.clients:
+                self.clients.remove(client)
+        try:
+            client.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def _stream(self):
+        while not self._stop_event.wait(self.stream_tick):
+            now = time.monotonic()
+            with self._clients_lock:
+                clients = [c for c in self.clients if c.next_send <= now]
+            for client in clients:
+                client.next_send = now + client.interval
+                try:
+                    for index in client.chambers:
+                        message = self.batch(client, index)
+                        if message is not None:
+                            client.send_text(json.dumps(message, separators=(',', ':')))
+                except OSError:
+                    self._drop(client)
+
+    def batch(self, client, index):
+        # Snapshots the client has not seen, thinned to its sampling rate and
+        # delta-encoded per field. The program status is only sent when it
+        # moved on.
+        snapshots = self.dryer.chambers[index].engine.snapshots
+        last_seq = client.last_seq.get(index)
+        if last_seq is None:
+            # New subscribers start from now, not from the whole ring
+            last_seq = max(snapshots.seq - 1, 0)
+        picked = []
+        last_sample = client.last_sample.get(index)
+        for snapshot in snapshots.since(last_seq):
+            if last_sample is None or snapshot.t - last_sample >= client.sample:
+                picked.append(snapshot)
+                last_sample = snapshot.t
+        if snapshots.seq:
+            client.last_seq[index] = snapshots.seq
+        if not picked:
+            return None
+        client.last_sample[index] = last_sample
+        message = {'type': 'batch', 'chamber': index, 'seq': picked[-1].seq, 'n': len(picked)}
+        for field, scale in STREAM_SCALES.items():
+            message[field] = delta_encode([getattr(s, field) for s in picked], scale)
+        status = picked[-1].program
+        # Elapsed times change every tick; resend on a new stage or minute
+        key = None if status is None else (status.name, status.stage_index, status.finished,
+                                           None if status.total_remaining is None else int(status.total_remaining // 60))
+        if key != client.last_program.get(index, False):
+            client.last_program[index] = key
+            message['program'] = status_json(status)
+        return message
+
+
+def _read_exact(rfile, n):
+    data = rfile.read(n)
+    return data if data is not None and len(data) == n else None
+
+
+def _read_frame(rfile):
+    # (opcode, payload) of one client frame, or None when the socket closed.
+    # Fragmented messages are not supported; clients only send short JSON.
+    header = _read_exact(rfile, 2)
+    if header is None:
+        return None
+    opcode = header[0] & 0x0F
+    masked = header[1] & 0x80
+    length = header[1] & 0x7F
+    if length == 126:
+        ext = _read_exact(rfile, 2)
+        length = struct.unpack('!H', ext)[0] if ext else None
+    elif length == 127:
+        ext = _read_exact(rfile, 8)
+        length = struct.unpack('!Q', ext)[0] if ext else None
+    if length is None or length > MAX_MESSAGE or not masked:
+        return None
+    mask = _read_exact(rfile, 4)
+    payload = _read_exact(rfile, length) if length else b''
+    if mask is None or payload is None:
+        return None
+    return opcode, bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+
+
+def _make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            if urlsplit(self.path).path == '/ws':
+                try:
+                    service.accept(self)
+                except ApiError as e:
+                    self.reply(e.status, {'error': str(e)})
+                self.close_connection = True
+                return
+            if urlsplit(self.path).path == '/metrics':
+                # For Prometheus to scrape directly
+                payload = METRICS.render_prometheus().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+                return
+            self.route('GET')
+
+        def do_POST(self):
+            self.route('POST')
+
+        def do_PUT(self):
+            self.route('PUT')
+
+        def do_DELETE(self):
+            self.route('DELETE')
+
+        def route(self, method):
+            url = urlsplit(self.path)
+            try:
+                body = None
+                try:
+                    length = int(self.headers.get('Content-Length') or 0)
+                except ValueError:
+                    length = -1
+                if length < 0:
+                    raise ApiError(400, 'Invalid Content-Length')
+                if length:
+                    if length > MAX_MESSAGE:
+                        raise ApiError(413, 'Request too large')
+                    try:
+                        body = json.loads(self.rfile.read(length))
+                    except ValueError:
+                        raise ApiError(400, 'Body is not JSON')
+                self.reply(200, service.handle(method, url.path, parse_qs(url.query), body))
+            except ApiError as e:
+                self.reply(e.status, {'error': str(e)})
+            except Exception as e:
+                print(f"[API] {method} {url.path} failed: {e!r}")
+                self.reply(500, {'error': str(e) or type(e).__name__})
+
+        def reply(self, status, data):
+            payload = json.dumps(data).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def main(argv=None):
+    # Headless mode: the dryers and the API, no display and no Kivy
+    parser = argparse.ArgumentParser(description='Run the filament dryer without a display')
+    parser.add_argument('--headless', action='store_true', help='accepted for filament_dryer_gui.py --headless')
+    parser.add_argument('--host', default=os.environ.get('DRYER_API_HOST', API_HOST))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('DRYER_API_PORT', API_PORT)))
+    parser.add_argument('--presets', default='presets.json')
+    parser.add_argument('--metrics-file', default=os.environ.get('DRYER_METRICS_FILE'),
+                        help='rewrite this Prometheus text file every 15 s')
+    args = parser.parse_args(argv)
+
+    from dryer import Dryer
+    from preset_store import PresetStore
+    dryer = Dryer()
+    dryer.start()
+    service = DryerService(dryer, PresetStore(args.presets), args.host, args.port)
+    service.start()
+    exporter = None
+    if args.metrics_file:
+        exporter = MetricsExporter(METRICS, args.metrics_file)
+        exporter.start()
+
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda signum, frame: stop.set())
+    # kill -USR1 switches control-tick profiling on and off
+    toggle = threading.Event()
+    signal.signal(signal.SIGUSR1, lambda signum, frame: toggle.set())
+    while not stop.wait(1.0):
+        if toggle.is_set():
+            toggle.clear()
+            PROFILER.toggle()
+    print("[API] Shutting down")
+    if exporter is not None:
+        exporter.stop()
+    PROFILER.stop()
+    service.close()
+    dryer.close()
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,179 @@
+from collections import namedtuple
+from preset_store import format_duration
+
+RAMP = 'ramp'
+SOAK = 'soak'
+COOLDOWN = 'cooldown'
+
+# target in °C. duration in seconds: the soak time, or the longest a cooldown
+# may take. rate in °C/min for ramps; None ramps at full power.
+Stage = namedtuple('Stage', 'kind target duration rate', defaults=(None, None))
+
+ProgramStatus = namedtuple('ProgramStatus', 'name stage_index stage_count stage_kind setpoint '
+                                            'stage_elapsed stage_remaining total_remaining finished')
+
+# A ramp counts as done once the chamber is this close to its target
+RAMP_TOLERANCE = 1.0
+COOLDOWN_TEMPERATURE = 35.0
+COOLDOWN_TIMEOUT = 2 * 3600
+
+
+def program_from_preset(preset, cooldown_temperature=COOLDOWN_TEMPERATURE):
+    # Ramp to the preset temperature, hold it for the preset duration, then
+    # let the box cool with the heater off
+    return DryingProgram(preset.name, [
+        Stage(RAMP, preset.temperature, rate=preset.ramp_rate),
+        Stage(SOAK, preset.temperature, preset.duration * 60),
+        Stage(COOLDOWN, cooldown_temperature, COOLDOWN_TIMEOUT),
+    ])
+
+
+class DryingProgram:
+    # Walks a list of stages. update() is called every control tick with the
+    # engine time and the measured temperature and returns the setpoint to
+    # use (None = heater off); `status` describes where the run is.
+    def __init__(self, name, stages):
+        self.name = name
+        self.stages = list(stages)
+        self.index = 0
+        self.finished = False
+        self.setpoint = None
+        self._stage_start = None
+        self._ramp_from = None
+        self._now = None
+        self._temperature = None
+        self._resume = None
+
+    def checkpoint(self):
+        # Where the run is, as plain data for a SessionCheckpoint
+        if self._resume is not None:
+            elapsed = self._resume[0]
+        else:
+            elapsed = self._now - self._stage_start if self._stage_start is not None else 0.0
+        return {'name': self.name, 'stages': [list(stage) for stage in self.stages], 'index': self.index,
+                'stage_elapsed': elapsed, 'setpoint': self.setpoint}
+
+    @classmethod
+    def from_checkpoint(cls, state, outage=0.0):
+        # Carries on from checkpoint() after `outage` seconds with the heater
+        # off. The stage is picked up on the first tick with a reading:
+        # a ramp starts again from the temperature the box cooled to, a
+        # soak the box cooled out of gets a ramp back up before its
+        # remaining time, and a cooldown counts the outage as cooling.
+        program = cls(state['name'], [Stage(*stage) for stage in state['stages']])
+        program.index = min(int(state['index']), len(program.stages))
+        program.finished = program.index >= len(program.stages)
+        program._resume = (float(state['stage_elapsed']), max(outage, 0.0))
+        return program
+
+    @property
+    def stage(self):
+        return self.stages[self.index] if self.index < len(self.stages) else None
+
+    def update(self, now, temperature):
+        self._now = now
+        if temperature is not None:
+            self._temperature = temperature
+        while not self.finished:
+            if self._stage_start is None:
+                if self._resume is not None:
+                    if self._temperature is None:
+                        # Heater off until there is a reading to resume from
+                        self.setpoint = None
+                        break
+                    self._resume_stage(now)
+                else:
+                    self._begin_stage(now)
+            if not self._stage_done(now):
+                break
+            self.index += 1
+            self._stage_start = None
+            if self.index >= len(self.stages):
+                self.finished = True
+                self.setpoint = None
+        return self.setpoint
+
+    def _begin_stage(self, now):
+        self._stage_start = now
+        self._ramp_from = self._temperature if self._temperature is not None else self.stage.target
+
+    def _resume_stage(self, now):
+        elapsed, outage = self._resume
+        self._resume = None
+        stage = self.stage
+        if stage.kind == SOAK and self._temperature < stage.target - RAMP_TOLERANCE:
+            # Cooled off during the outage: heat back up, then soak for the rest
+            rate = next((s.rate for s in self.stages[:self.index] if s.kind == RAMP and s.target == stage.target), None)
+            self.stages[self.index] = stage._replace(duration=max(stage.duration - elapsed, 0.0))
+            self.stages.insert(self.index, Stage(RAMP, stage.target, rate=rate))
+            elapsed = 0.0
+        self._begin_stage(now)
+        if self.stage.kind == SOAK:
+            self._stage_start = now - elapsed
+        elif self.stage.kind == COOLDOWN:
+            self._stage_start = now - elapsed - outage
+
+    def _stage_done(self, now):
+        stage = self.stage
+        elapsed = now - self._stage_start
+        temp = self._temperature
+        if stage.kind == RAMP:
+            if stage.rate:
+                direction = 1.0 if stage.target >= self._ramp_from else -1.0
+                moved = stage.rate * elapsed / 60.0
+                self.setpoint = self._ramp_from + direction * min(moved, abs(stage.target - self._ramp_from))
+            else:
+                self.setpoint = stage.target
+            return temp is not None and abs(temp - stage.target) <= RAMP_TOLERANCE and self.setpoint == stage.target
+        if stage.kind == SOAK:
+            self.setpoint = stage.target
+            return elapsed >= stage.duration
+        if stage.kind == COOLDOWN:
+            self.setpoint = None
+            return (temp is not None and temp <= stage.target) or (stage.duration is not None and elapsed >= stage.duration)
+        raise ValueError(f'Unknown stage kind: {stage.kind}')
+
+    def stage_remaining(self, index=None):
+        # Estimated seconds left in a stage; None if it cannot be estimated
+        # (full-power ramps and cooldowns depend on the box)
+        index = self.index if index is None else index
+        stage = self.stages[index]
+        current = index == self.index and self._stage_start is not None
+        if stage.kind == SOAK:
+            elapsed = self._now - self._stage_start if current else 0.0
+            return max(stage.duration - elapsed, 0.0)
+        if stage.kind == RAMP and stage.rate:
+            if current:
+                start = self.setpoint
+            else:
+                start = self.stages[index - 1].target if index else self._temperature
+            if start is None:
+                return None
+            return abs(stage.target - start) / stage.rate * 60.0
+        return None
+
+    @property
+    def status(self):
+        if self.finished or self._stage_start is None:
+            return ProgramStatus(self.name, self.index, len(self.stages), None, None, 0.0, 0.0, 0.0, self.finished)
+        stage_remaining = self.stage_remaining()
+        total = stage_remaining or 0.0
+        for i in range(self.index + 1, len(self.stages)):
+            total += self.stage_remaining(i) or 0.0
+        return ProgramStatus(self.name, self.index, len(self.stages), self.stage.kind, self.setpoint,
+                             self._now - self._stage_start, stage_remaining, total, False)
+
+
+def describe_status(status):
+    # One-line summary for the main page
+    if status is None:
+        return 'Idle'
+    if status.finished:
+        return f'{status.name}: finished'
+    if status.stage_kind is None:
+        return f'{status.name}: starting'
+    stage = f'{status.stage_kind.capitalize()} ({status.stage_index + 1}/{status.stage_count})'
+    if status.stage_kind == COOLDOWN:
+        return f'{status.name}: {stage}, heater off'
+    remaining = format_duration(status.total_remaining / 60.0)
+    return f'{status.name}: {stage}, {remaining} left'
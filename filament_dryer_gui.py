@@ -1,59 +1,217 @@
+import os
+import sys
+
+# `--headless` runs the dryers and the local API without a display; Kivy is
+# never imported
+if __name__ == '__main__' and '--headless' in sys.argv[1:]:
+    from dryer_service import main
+    sys.exit(main(sys.argv[1:]))
+
 from kivy.app import App
 from kivy.uix.screenmanager import ScreenManager, Screen
+from kivy.clock import Clock
 from main_page import MainPage
-from settings_page import SettingsPage
-from preset_selection_page import PresetSelectionPage
-from testing_page import TestingPage
+from preset_store import PresetStore, Preset
+from metrics import METRICS, MetricsExporter
+from display_idle import ACTIVE
 
 class FilamentDryerApp(App):
     def build(self):
         self.presets_file = 'presets.json'
-        self.presets = SettingsPage(switch_to_main=self.switch_to_main, presets_data_file=self.presets_file).load_presets()
+        # Loaded once and shared by every page
+        self.presets = PresetStore(self.presets_file)
+        self.preset_index = None
 
         self.screen_manager = ScreenManager()
 
-        self.main_page = MainPage(switch_to_settings=self.switch_to_settings, switch_to_preset_selection=self.switch_to_preset_selection, switch_to_testing=self.switch_to_testing)
-        self.settings_page = SettingsPage(switch_to_main=self.switch_to_main, presets_data_file=self.presets_file)
-        self.preset_selection_page = PresetSelectionPage(switch_to_main=self.switch_to_main_with_preset, presets=self.presets)
-        self.testing_page = TestingPage(switch_to_main=self.switch_to_main)
+        # Screens are built the first time they are visited; only the main
+        # page is needed to get the touchscreen up.
+        self.screen_factories = {
+            'main': self.build_main_page,
+            'settings': self.build_settings_page,
+            'preset_selection': self.build_preset_selection_page,
+            'testing': self.build_testing_page,
+            'chambers': self.build_chambers_page,
+            'diagnostics': self.build_diagnostics_page,
+        }
+        self.settings_page = None
+        self.preset_selection_page = None
+        self.testing_page = None
+        self.chambers_page = None
+        self.diagnostics_page = None
+        self.metrics_exporter = None
+        self.idle_display = None
+        self.selected_preset = None
+        self.dryer = None
+        self.service = None
+        self.ensure_screen('main')
+
+        return self.screen_manager
 
-        self.main_screen = Screen(name='main')
-        self.main_screen.add_widget(self.main_page)
-        self.screen_manager.add_widget(self.main_screen)
+    def build_main_page(self):
+        self.main_page = MainPage(switch_to_settings=self.switch_to_settings, switch_to_preset_selection=self.switch_to_preset_selection, switch_to_testing=self.switch_to_testing,
+                                  start_program=self.start_program, stop_program=self.stop_program,
+                                  switch_to_chambers=self.switch_to_chambers, switch_to_diagnostics=self.switch_to_diagnostics,
+                                  clear_fault=self.clear_fault)
+        return self.main_page
 
-        self.settings_screen = Screen(name='settings')
-        self.settings_screen.add_widget(self.settings_page)
-        self.screen_manager.add_widget(self.settings_screen)
+    def build_settings_page(self):
+        from settings_page import SettingsPage
+        self.settings_page = SettingsPage(switch_to_main=self.switch_to_main, presets_data_file=self.presets_file, preset_store=self.presets,
+                                          index=self.get_preset_index())
+        return self.settings_page
 
-        self.preset_selection_screen = Screen(name='preset_selection')
-        self.preset_selection_screen.add_widget(self.preset_selection_page)
-        self.screen_manager.add_widget(self.preset_selection_screen)
+    def build_preset_selection_page(self):
+        from preset_selection_page import PresetSelectionPage
+        self.preset_selection_page = PresetSelectionPage(switch_to_main=self.switch_to_main_with_preset, presets=self.presets,
+                                                         index=self.get_preset_index())
+        return self.preset_selection_page
 
-        self.testing_screen = Screen(name='testing')
-        self.testing_screen.add_widget(self.testing_page)
-        self.screen_manager.add_widget(self.testing_screen)
+    def build_testing_page(self):
+        # Pulls in NumPy, the hardware backend and the control loop
+        from testing_page import TestingPage
+        self.testing_page = TestingPage(switch_to_main=self.switch_to_main, dryer=self.get_dryer())
+        return self.testing_page
 
-        return self.screen_manager
+    def build_chambers_page(self):
+        from chambers_page import ChambersPage
+        self.chambers_page = ChambersPage(switch_to_main=self.switch_to_main, dryer=self.get_dryer(),
+                                          start_chamber=self.start_chamber, stop_chamber=self.stop_program)
+        return self.chambers_page
+
+    def build_diagnostics_page(self):
+        from diagnostics_page import DiagnosticsPage
+        self.diagnostics_page = DiagnosticsPage(switch_to_main=self.switch_to_main)
+        return self.diagnostics_page
+
+    def on_start(self):
+        # Bring the control loop up after the first frame so it does not
+        # delay the touchscreen
+        Clock.schedule_once(lambda dt: self.get_dryer(), 0)
+        Clock.schedule_interval(self.refresh_status, 1.0)
+        # Time between displayed frames; long ones are visible stutter
+        from kivy.core.window import Window
+        self.frame_interval = METRICS.histogram('ui_frame_interval_seconds', 'Time between displayed frames')
+        self.last_flip = None
+        Window.bind(on_flip=self.on_flip)
+        # Lower frame rate when left alone, blank the screen later
+        from display_idle import IdleDisplay
+        self.idle_display = IdleDisplay(Window)
+        if os.environ.get('DRYER_METRICS_FILE'):
+            self.metrics_exporter = MetricsExporter(METRICS, os.environ['DRYER_METRICS_FILE'])
+            self.metrics_exporter.start()
+
+    def on_flip(self, window):
+        # Frames while idle or blanked are slow on purpose
+        if self.idle_display is not None and self.idle_display.state != ACTIVE:
+            self.last_flip = None
+            return
+        now = Clock.get_boottime()
+        if self.last_flip is not None:
+            self.frame_interval.observe(now - self.last_flip)
+        self.last_flip = now
+
+    def on_stop(self):
+        if self.idle_display is not None:
+            self.idle_display.close()
+        if self.metrics_exporter is not None:
+            self.metrics_exporter.stop()
+        if self.service is not None:
+            self.service.close()
+        if self.dryer is not None:
+            self.dryer.close()
+
+    def get_dryer(self):
+        if self.dryer is None:
+            from dryer import Dryer
+            self.dryer = Dryer()
+            self.dryer.start()
+            if os.environ.get('DRYER_API_PORT'):
+                self.start_service(int(os.environ['DRYER_API_PORT']))
+        return self.dryer
+
+    def get_preset_index(self):
+        # One search index for both preset pages; built on first use
+        if self.preset_index is None:
+            from preset_index import PresetIndex
+            self.preset_index = PresetIndex(self.presets)
+        return self.preset_index
+
+    def start_service(self, port):
+        # Serve the API next to the GUI; commands from it run on the Kivy
+        # thread like button presses do
+        from dryer_service import DryerService, API_HOST
+        self.service = DryerService(self.dryer, self.presets, os.environ.get('DRYER_API_HOST', API_HOST), port,
+                                    dispatch=lambda fn: Clock.schedule_once(lambda dt: fn(), 0),
+                                    preset_index=self.get_preset_index())
+        self.service.start()
+
+    def refresh_status(self, dt):
+        if self.dryer is not None:
+            fault = self.dryer.fault()
+            if fault is not None and self.idle_display is not None:
+                self.idle_display.wake()
+            self.main_page.update_status(self.dryer.latest(), fault)
+            # Tells the watchdog the touchscreen is still responsive
+            if self.dryer.watchdog is not None:
+                self.dryer.watchdog.ui_beat()
+
+    def clear_fault(self):
+        if self.dryer is not None:
+            self.dryer.clear_fault()
+            # The watchdog process picks the request up on its next check
+            Clock.schedule_once(self.refresh_status, 0.2)
+
+    def start_program(self, slider_temperature, chamber=0):
+        # Run the selected preset; without one, dry at the slider temperature
+        # for the default duration
+        preset = self.presets.get(self.selected_preset) if self.selected_preset else None
+        if preset is None or preset.temperature != slider_temperature:
+            name = preset.name if preset is not None else 'Manual'
+            preset = Preset(name, float(int(slider_temperature)), *(preset[2:] if preset is not None else ()))
+        self.get_dryer().run_preset(preset, chamber)
+
+    def start_chamber(self, chamber):
+        self.start_program(self.main_page.temperature_slider.value, chamber)
+
+    def stop_program(self, chamber=0):
+        self.get_dryer().stop_program(chamber)
+
+    def ensure_screen(self, name):
+        if not self.screen_manager.has_screen(name):
+            screen = Screen(name=name)
+            screen.add_widget(self.screen_factories[name]())
+            self.screen_manager.add_widget(screen)
+        return self.screen_manager.get_screen(name)
+
+    def switch_to(self, name):
+        self.ensure_screen(name)
+        self.screen_manager.current = name
 
     def switch_to_settings(self):
-        self.screen_manager.current = 'settings'
+        self.switch_to('settings')
 
     def switch_to_main(self):
-        self.screen_manager.current = 'main'
+        self.switch_to('main')
 
     def switch_to_preset_selection(self):
-        self.screen_manager.current = 'preset_selection'
+        self.switch_to('preset_selection')
 
     def switch_to_testing(self):
-        self.screen_manager.current = 'testing'
+        self.switch_to('testing')
+
+    def switch_to_chambers(self):
+        self.switch_to('chambers')
+
+    def switch_to_diagnostics(self):
+        self.switch_to('diagnostics')
 
     def switch_to_main_with_preset(self, preset):
         self.main_page.update_selected_preset(preset)
-        target_temperature_str = self.presets.get(preset, "0°C")  # Default to "0°C" if preset not found
-        target_temperature = float(target_temperature_str.replace("°C", ""))  # Remove unit and convert to float
-        self.main_page.set_target_temperature(target_temperature)
-        self.screen_manager.current = 'main'
-        self.preset_selection_page.update_presets(self.presets)  # Ensure preset selection page is updated
+        self.selected_preset = preset
+        selected = self.presets.get(preset)
+        self.main_page.set_target_temperature(selected.temperature if selected is not None else 0.0)
+        self.switch_to('main')
 
 if __name__ == '__main__':
-    FilamentDryerApp().run()
\ No newline at end of file
+    FilamentDryerApp().run()
@@ -0,0 +1,47 @@
+import json
+import os
+import tempfile
+
+
+def write_json_atomic(path, data, indent=None):
+    write_text_atomic(path, json.dumps(data, indent=indent))
+
+
+def write_text_atomic(path, text):
+    # Write to a temp file in the same directory and rename over the target,
+    # so a power cut (or a reader such as a metrics scraper) sees either the
+    # old or the new file, never half of one
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path), suffix='.tmp')
+    try:
+        # mkstemp creates 0600; keep the target's mode (or a normal 0644)
+        try:
+            mode = os.stat(path).st_mode & 0o777
+        except OSError:
+            mode = 0o644
+        os.fchmod(fd, mode)
+        with os.fdopen(fd, 'w') as file:
+            file.write(text)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fsync_directory(path):
+    # A rename is only durable once its directory has been synced too
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
@@ -0,0 +1,254 @@
+import functools
+import os
+import platform
+import time
+from w1_sampler import W1Sampler
+
+PWM_PIN = 18  # Change to your desired GPIO pin
+W1_PIN = 4
+
+
+def is_raspberry_pi():
+    print("[RPI CHECK] Starting Raspberry Pi detection...")
+    # Check for Raspberry Pi by reading /proc/cpuinfo or using platform
+    try:
+        with open('/proc/cpuinfo', 'r') as f:
+            cpuinfo = f.read()
+        print("[RPI CHECK] /proc/cpuinfo read successfully.")
+        if 'Raspberry Pi' in cpuinfo:
+            print("[RPI CHECK] Found 'Raspberry Pi' in /proc/cpuinfo.")
+            return True
+        if 'BCM' in cpuinfo:
+            print("[RPI CHECK] Found 'BCM' in /proc/cpuinfo.")
+            return True
+        print("[RPI CHECK] No Raspberry Pi markers found in /proc/cpuinfo.")
+    except Exception as e:
+        print(f"[RPI CHECK] Failed to read /proc/cpuinfo: {e}")
+    # Fallback: check platform
+    try:
+        node_name = platform.uname().node
+        print(f"[RPI CHECK] platform.uname().node: {node_name}")
+        if 'raspberrypi' in node_name.lower():
+            print("[RPI CHECK] Found 'raspberrypi' in platform.uname().node.")
+            return True
+        print("[RPI CHECK] No Raspberry Pi markers found in platform.uname().node.")
+    except Exception as e:
+        print(f"[RPI CHECK] platform.uname() failed: {e}")
+    print("[RPI CHECK] Device is NOT a Raspberry Pi.")
+    return False
+
+
+@functools.lru_cache(maxsize=None)
+def get_gpio():
+    # RPi.GPIO is only imported the first time real hardware is needed
+    try:
+        import RPi.GPIO as GPIO
+        print("[GPIO] RPi.GPIO imported successfully.")
+        return GPIO
+    except ImportError as e:
+        print(f"[GPIO] Failed to import RPi.GPIO: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=None)
+def rpi_available():
+    # Detected once per process; later calls return the cached result
+    gpio_imported = get_gpio() is not None
+    available = gpio_imported and is_raspberry_pi()
+    print(f"[SETUP] GPIO_IMPORTED={gpio_imported}, RPI_AVAILABLE={available}")
+    return available
+
+
+class HeaterOutput:
+    # Drives one heater with a duty cycle in %
+    kind = None
+
+    def set_duty(self, duty):
+        raise NotImplementedError
+
+    def stop(self):
+        self.set_duty(0)
+
+    def forced_low(self):
+        # The watchdog process switched the output off behind this object's
+        # back; forget any cached output state
+        pass
+
+
+class TemperatureSensors:
+    # Reads every probe in one pass: {sensor_id: temp_c or None}
+    def read_all(self):
+        raise NotImplementedError
+
+    def sensor_ids(self):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GPIOPWMHeater(HeaterOutput):
+    # Software PWM through RPi.GPIO (or anything with the same API)
+    kind = 'soft'
+
+    def __init__(self, pin=PWM_PIN, frequency=100, gpio=None):
+        self.gpio = gpio or get_gpio()
+        self.pin = pin
+        self.frequency = frequency
+        self.pwm = None
+        self.gpio.setup(pin, self.gpio.OUT)
+
+    def set_duty(self, duty):
+        if self.pwm is None:
+            self.pwm = self.gpio.PWM(self.pin, self.frequency)
+            self.pwm.start(duty)
+        else:
+            self.pwm.ChangeDutyCycle(duty)
+
+    def stop(self):
+        if self.pwm is not None:
+            self.pwm.stop()
+            self.pwm = None
+            print(f"[GPIO] PWM stopped on pin {self.pin}.")
+        self.gpio.output(self.pin, self.gpio.LOW)
+
+
+class Backend:
+    # A heater, its sensors and the clock the control loop should run on.
+    # `sleep` is None for wall-clock backends; simulated ones pass their
+    # virtual clock's sleep so the loop can run faster than realtime.
+    name = 'base'
+
+    def __init__(self, heater, sensors, clock=time.monotonic, sleep=None):
+        self.heater = heater
+        self.sensors = sensors
+        self.clock = clock
+        self.sleep = sleep
+
+    def heater_for(self, pin, kind='soft', **options):
+        # The heater on `pin`, for setups with several chambers on one board
+        if pin is None or pin == getattr(self.heater, 'pin', None):
+            return self.heater
+        raise ValueError(f"The {self.name} backend has no heater on pin {pin}")
+
+    def poll(self, now):
+        # Called every control tick; for outputs that need servicing when
+        # nothing else times them
+        pass
+
+    def watchdog_output(self, heater):
+        # What the watchdog process can force low for `heater` on its own
+        # (see heater_watchdog), or None if only this process can
+        return None
+
+    def close(self):
+        self.heater.stop()
+        self.sensors.close()
+
+
+# Heater output types a chamber can ask for: software PWM, kernel PWM
+# through /sys/class/pwm, or time-proportioning for SSRs
+HEATER_KINDS = ('soft', 'sysfs', 'ssr')
+# The options create_heater() takes for each type
+HEATER_OPTIONS = {
+    'soft': ('frequency',),
+    'sysfs': ('frequency', 'pwm_chip', 'pwm_channel'),
+    'ssr': ('window', 'min_pulse'),
+}
+
+
+class GPIOBackend(Backend):
+    # Heaters on any number of pins of one GPIO module. They are created on
+    # first use, so a pin is only claimed by the output type its chamber
+    # asked for (setting up a hardware PWM pin as an output would detach it
+    # from the PWM peripheral).
+    def __init__(self, gpio, pin, sensors, clock=time.monotonic, sleep=None, pwm_base_dir=None, time_scale=1.0):
+        self.gpio = gpio
+        self.pin = pin
+        self.pwm_base_dir = pwm_base_dir
+        self.time_scale = time_scale
+        self.heaters = {}
+        self.scheduler = None
+        super().__init__(None, sensors, clock, sleep)
+
+    def heater_for(self, pin, kind='soft', **options):
+        if pin is None:
+            pin = self.pin
+        heater = self.heaters.get(pin)
+        if heater is None or heater.kind != kind:
+            if heater is not None:
+                heater.stop()
+            heater = self.heaters[pin] = self.create_heater(pin, kind, **options)
+            if pin == self.pin:
+                self.heater = heater
+        return heater
+
+    def create_heater(self, pin, kind='soft', frequency=100, window=10.0, min_pulse=0.1, pwm_chip=0, pwm_channel=None):
+        if kind == 'soft':
+            return GPIOPWMHeater(pin, frequency, gpio=self.gpio)
+        if kind == 'sysfs':
+            from heater_outputs import SysfsPWMHeater, PWM_CHANNELS, PWM_BASE_DIR
+            if pwm_channel is None:
+                if pin not in PWM_CHANNELS:
+                    raise ValueError(f"GPIO{pin} has no hardware PWM channel; set pwm_channel")
+                pwm_channel = PWM_CHANNELS[pin]
+            return SysfsPWMHeater(pwm_channel, pwm_chip, frequency, self.pwm_base_dir or PWM_BASE_DIR, pin=pin)
+        if kind == 'ssr':
+            from heater_outputs import TimeProportioningHeater
+            return TimeProportioningHeater(pin, self.gpio, self.heater_scheduler(), window, min_pulse)
+        raise ValueError(f"Unknown heater type: {kind}")
+
+    def heater_scheduler(self):
+        if self.scheduler is None:
+            from heater_outputs import HeaterScheduler
+            self.scheduler = HeaterScheduler(self.clock, self.time_scale)
+            # A clock that only moves when the control loop sleeps cannot be
+            # waited on; poll() services the heaters every tick instead
+            if self.time_scale is not None:
+                self.scheduler.start()
+        return self.scheduler
+
+    def poll(self, now):
+        if self.scheduler is not None and not self.scheduler.running:
+            self.scheduler.poll(now)
+
+    def watchdog_output(self, heater):
+        if heater.kind == 'sysfs':
+            return ('sysfs', heater.channel_dir)
+        return ('gpio', heater.pin)
+
+    def close(self):
+        if self.scheduler is not None:
+            self.scheduler.stop()
+        for heater in self.heaters.values():
+            heater.stop()
+        self.sensors.close()
+
+
+class RPiBackend(GPIOBackend):
+    name = 'rpi'
+
+    def __init__(self, pin=PWM_PIN, gpio=None, w1_base_dir=None):
+        gpio = gpio or get_gpio()
+        gpio.setmode(gpio.BCM)
+        # Enable internal pull-up for GPIO4 (1-wire data)
+        gpio.setup(W1_PIN, gpio.IN, pull_up_down=gpio.PUD_UP)
+        print(f"[GPIO] Setup complete for pin {pin} and internal pull-up enabled for GPIO{W1_PIN}.")
+        sensors = W1Sampler(w1_base_dir) if w1_base_dir else W1Sampler()
+        super().__init__(gpio, pin, sensors)
+
+
+def backend_kind(kind=None):
+    # 'rpi', 'sim' or None to pick from $DRYER_BACKEND / hardware detection
+    return kind or os.environ.get('DRYER_BACKEND') or ('rpi' if rpi_available() else 'sim')
+
+
+def create_backend(kind=None, **kwargs):
+    kind = backend_kind(kind)
+    if kind == 'rpi':
+        return RPiBackend(**kwargs)
+    if kind == 'sim':
+        from simulation import SimulatedBackend
+        print("[GPIO] RPi.GPIO not available. Using the simulated thermal backend.")
+        return SimulatedBackend(**kwargs)
+    raise ValueError(f"Unknown hardware backend: {kind}")
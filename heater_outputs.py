@@ -0,0 +1,186 @@
+import math
+import os
+import threading
+import time
+from hardware import HeaterOutput
+
+PWM_BASE_DIR = '/sys/class/pwm'
+# Raspberry Pi GPIOs that carry the two hardware PWM channels once
+# dtoverlay=pwm-2chan is enabled
+PWM_CHANNELS = {12: 0, 18: 0, 13: 1, 19: 1}
+EXPORT_TIMEOUT = 2.0
+
+
+class SysfsPWMHeater(HeaterOutput):
+    # Kernel PWM through /sys/class/pwm/pwmchipN/pwmM. The PWM peripheral
+    # times the pulses, so they cost no CPU and do not jitter when the Pi is
+    # busy; only a duty change costs one write.
+    kind = 'sysfs'
+
+    def __init__(self, channel=0, chip=0, frequency=100, base_dir=PWM_BASE_DIR, pin=None):
+        self.pin = pin
+        self.chip_dir = os.path.join(base_dir, f'pwmchip{chip}')
+        self.channel_dir = os.path.join(self.chip_dir, f'pwm{channel}')
+        self.channel = channel
+        self.period = int(round(1e9 / frequency))
+        self.duty_ns = None
+        self._export()
+        # duty_cycle may never exceed period, so zero it before changing the
+        # period and only enable once both are valid
+        self._write('enable', 0)
+        self._write('duty_cycle', 0)
+        self._write('period', self.period)
+        self._duty_fd = os.open(os.path.join(self.channel_dir, 'duty_cycle'), os.O_WRONLY)
+        self._enabled = False
+
+    def _export(self):
+        if os.path.isdir(self.channel_dir):
+            return
+        with open(os.path.join(self.chip_dir, 'export'), 'w') as f:
+            f.write(str(self.channel))
+        # udev needs a moment to create and chown the channel directory
+        deadline = time.monotonic() + EXPORT_TIMEOUT
+        while not os.access(os.path.join(self.channel_dir, 'enable'), os.W_OK):
+            if time.monotonic() > deadline:
+                raise OSError(f'{self.channel_dir} did not appear after export')
+            time.sleep(0.01)
+
+    def _write(self, name, value):
+        with open(os.path.join(self.channel_dir, name), 'w') as f:
+            f.write(str(value))
+
+    def set_duty(self, duty):
+        duty_ns = int(self.period * min(max(duty, 0.0), 100.0) / 100.0)
+        if duty_ns != self.duty_ns:
+            os.pwrite(self._duty_fd, b'%d\n' % duty_ns, 0)
+            self.duty_ns = duty_ns
+        if not self._enabled:
+            self._write('enable', 1)
+            self._enabled = True
+
+    def stop(self):
+        if self._duty_fd is None:
+            return
+        self.set_duty(0)
+        self._write('enable', 0)
+        self._enabled = False
+        os.close(self._duty_fd)
+        self._duty_fd = None
+        print(f"[PWM] Disabled {self.channel_dir}.")
+
+    def forced_low(self):
+        # Both were zeroed from outside; write them again on the next change
+        self.duty_ns = None
+        self._enabled = False
+
+
+class TimeProportioningHeater(HeaterOutput):
+    # Slow PWM for zero-crossing SSRs: the output is on for duty% of every
+    # `window` seconds. Pulses shorter than min_pulse are dropped (or the
+    # gap is, near 100 %) so the SSR is never asked for less than a few mains
+    # cycles. Edges are switched by a shared HeaterScheduler.
+    kind = 'ssr'
+
+    def __init__(self, pin, gpio, scheduler, window=10.0, min_pulse=0.1):
+        self.pin = pin
+        self.gpio = gpio
+        self.scheduler = scheduler
+        self.window = window
+        self.min_pulse = min_pulse
+        self.duty = 0.0
+        self.state = False
+        self.origin = scheduler.clock()
+        self.gpio.setup(pin, self.gpio.OUT)
+        self.gpio.output(pin, self.gpio.LOW)
+        scheduler.add(self)
+
+    def on_time(self):
+        on = self.window * self.duty / 100.0
+        if on < self.min_pulse:
+            return 0.0
+        if self.window - on < self.min_pulse:
+            return self.window
+        return on
+
+    def update(self, now):
+        # Apply the output level for `now`; returns when it next changes
+        window_start = self.origin + math.floor((now - self.origin) / self.window) * self.window
+        on = self.on_time()
+        state = now < window_start + on
+        if state != self.state:
+            self.gpio.output(self.pin, self.gpio.HIGH if state else self.gpio.LOW)
+            self.state = state
+        if state and on < self.window:
+            return window_start + on
+        return window_start + self.window
+
+    def set_duty(self, duty):
+        duty = min(max(duty, 0.0), 100.0)
+        if duty != self.duty:
+            self.duty = duty
+            self.scheduler.wake()
+
+    def stop(self):
+        self.scheduler.remove(self)
+        self.duty = 0.0
+        self.gpio.output(self.pin, self.gpio.LOW)
+        self.state = False
+
+
+class HeaterScheduler:
+    # One thread switching every time-proportioned heater at its edges,
+    # however many chambers there are. time_scale is the clock's speed
+    # relative to the wall clock (for simulated time). Without start(),
+    # poll() can be called from the control loop instead.
+    def __init__(self, clock=time.monotonic, time_scale=1.0):
+        self.clock = clock
+        self.time_scale = time_scale
+        self.heaters = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def add(self, heater):
+        with self._lock:
+            self.heaters.append(heater)
+        self.wake()
+
+    def remove(self, heater):
+        with self._lock:
+            if heater in self.heaters:
+                self.heaters.remove(heater)
+
+    def wake(self):
+        self._wake.set()
+
+    def poll(self, now=None):
+        # Switch whatever is due; returns the next edge (None if idle)
+        if now is None:
+            now = self.clock()
+        with self._lock:
+            return min((heater.update(now) for heater in self.heaters), default=None)
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='heater-scheduler', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.clear()
+            next_edge = self.poll()
+            timeout = None if next_edge is None else max(next_edge - self.clock(), 0.0) / self.time_scale
+            self._wake.wait(timeout)
@@ -0,0 +1,446 @@
+import ctypes
+import json
+import math
+import mmap
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+
+# The watchdog runs as its own small process next to the dryer (GUI or
+# headless). The dryer publishes a heartbeat and every chamber's latest
+# sample into a shared memory block; the watchdog checks them every POLL
+# seconds and on a fault forces the heater outputs low itself, latches the
+# fault in the block and in FAULT_FILE, and waits for the dryer to
+# acknowledge it. A dryer that does not, while its own threads drive the
+# heater pins (software PWM, SSR windows), is killed and the pins forced low
+# again. This module only imports the standard library so the process starts
+# quickly and does not depend on anything the dryer might have broken.
+
+STALLED = 1
+UI_STALLED = 2
+READING_LOST = 3
+OVER_TEMPERATURE = 4
+RUNAWAY = 5
+NO_RISE = 6
+WATCHDOG_LOST = 7
+DRYER_EXITED = 8
+FAULTS = {
+    STALLED: 'control loop stalled',
+    UI_STALLED: 'touchscreen stalled',
+    READING_LOST: 'probe reading lost while heating',
+    OVER_TEMPERATURE: 'over-temperature',
+    RUNAWAY: 'temperature rising with the heater off',
+    NO_RISE: 'heating without a temperature rise',
+    WATCHDOG_LOST: 'watchdog process lost',
+    DRYER_EXITED: 'dryer exited without shutting the heaters down',
+}
+
+FAULT_FILE = 'watchdog_fault.json'
+MAX_CHAMBERS = 8
+# The dryer treats a watchdog that has not checked in for this long as gone
+WATCHDOG_TIMEOUT = 2.0
+# How long start() waits for the new process to check in
+START_TIMEOUT = 10.0
+
+# Thresholds. Times marked "dryer clock" are measured on the backend's
+# clock (virtual on the simulator); the others are wall-clock seconds.
+DEFAULT_CONFIG = {
+    'poll': 0.05,              # s between checks
+    'stall_timeout': 5.0,      # s without a control tick
+    'ui_timeout': 30.0,        # s without a touchscreen heartbeat, once it sent one
+    'reading_timeout': 10.0,   # s (dryer clock) heating without a good probe reading
+    'max_temperature': float(os.environ.get('DRYER_MAX_TEMPERATURE', 100.0)),  # °C
+    'runaway_rise': 3.0,       # °C above the lowest reading since the heater went off,
+    'runaway_time': 600.0,     # s (dryer clock) within this long; slower drifts are the room
+    'no_rise_duty': 80.0,      # % from which heating below the target must show within no_rise_time
+    'no_rise_time': 600.0,     # s (dryer clock)
+    'no_rise_min': 2.0,        # °C
+    'ack_timeout': 1.0,        # s for the dryer to acknowledge a fault
+    'kill_unresponsive': True,
+}
+
+# `onset` is when the condition became true and `acted` when the outputs had
+# been forced low, both time.monotonic(); `value` is the reading, age or rise
+# that tripped it.
+WatchdogFault = namedtuple('WatchdogFault', 'code reason chamber value onset acted')
+
+
+class _Header(ctypes.Structure):
+    _fields_ = [
+        ('heartbeat', ctypes.c_double),           # dryer: monotonic time of its last tick
+        ('ui_heartbeat', ctypes.c_double),        # dryer: touchscreen, 0 without one
+        ('watchdog_heartbeat', ctypes.c_double),  # watchdog
+        ('closing', ctypes.c_int32),              # dryer: shutting down cleanly
+        ('clear', ctypes.c_int32),                # dryer: bumped to clear the fault
+        ('ack', ctypes.c_int32),                  # dryer: last fault_seq it acted on
+        ('fault_seq', ctypes.c_int32),            # watchdog, from here down
+        ('fault_chamber', ctypes.c_int32),
+        ('fault', ctypes.c_int32),
+        ('fault_value', ctypes.c_double),
+        ('onset', ctypes.c_double),
+        ('acted', ctypes.c_double),
+    ]
+
+
+class _Slot(ctypes.Structure):
+    # One chamber's latest sample; `seq` is odd while it is being written
+    _fields_ = [
+        ('seq', ctypes.c_uint32),
+        ('published', ctypes.c_double),      # monotonic time it was written
+        ('clock', ctypes.c_double),          # dryer clock of the sample
+        ('temperature', ctypes.c_double),    # NaN without a reading
+        ('target', ctypes.c_double),
+        ('duty', ctypes.c_double),
+        ('reading_clock', ctypes.c_double),  # dryer clock of the last good probe reading
+    ]
+
+
+class _Block(ctypes.Structure):
+    _fields_ = [('header', _Header), ('slots', _Slot * MAX_CHAMBERS)]
+
+
+def _map(path):
+    fd = os.open(path, os.O_RDWR)
+    try:
+        memory = mmap.mmap(fd, ctypes.sizeof(_Block))
+    finally:
+        os.close(fd)
+    return memory, _Block.from_buffer(memory)
+
+
+def read_slot(slot):
+    # Seqlock read: retry while the dryer is halfway through a write
+    while True:
+        seq = slot.seq
+        if seq % 2 == 0:
+            sample = (slot.published, slot.clock, slot.temperature, slot.target, slot.duty, slot.reading_clock)
+            if slot.seq == seq:
+                return seq, sample
+        time.sleep(0)
+
+
+class FaultDetector:
+    # The thermal checks for one chamber, fed the samples the dryer publishes.
+    # update() returns (fault code, value) or None.
+    def __init__(self, config=DEFAULT_CONFIG):
+        self.config = config
+        self.off_min = None      # (clock, temperature) of the lowest reading since the heater went off
+        self.heating = False     # in a stretch at no_rise_duty or more
+        self.watch = None        # (clock, temperature) it started at, until it shows a rise
+
+    def update(self, clock, temperature, target, duty, reading_clock):
+        config = self.config
+        if duty > 0 and clock - reading_clock > config['reading_timeout']:
+            return READING_LOST, clock - reading_clock
+        if math.isnan(temperature):
+            self.off_min = None
+            self.heating = False
+            self.watch = None
+            return None
+        if temperature > config['max_temperature']:
+            return OVER_TEMPERATURE, temperature
+        if duty <= 0:
+            self.heating = False
+            self.watch = None
+            if (self.off_min is None or temperature <= self.off_min[1]
+                    or clock - self.off_min[0] > config['runaway_time']):
+                self.off_min = (clock, temperature)
+            elif temperature - self.off_min[1] > config['runaway_rise']:
+                return RUNAWAY, temperature - self.off_min[1]
+            return None
+        self.off_min = None
+        # Holding the target at a high duty is fine; this is for warming up
+        if duty < config['no_rise_duty'] or temperature >= target - config['no_rise_min']:
+            self.heating = False
+            self.watch = None
+        elif not self.heating:
+            self.heating = True
+            self.watch = (clock, temperature)
+        elif self.watch is not None:
+            start, start_temperature = self.watch
+            if temperature - start_temperature >= config['no_rise_min']:
+                # The heater works; nothing more to check until the next stretch
+                self.watch = None
+            elif clock - start > config['no_rise_time']:
+                return NO_RISE, temperature - start_temperature
+        return None
+
+
+class _Outputs:
+    # Heater outputs the watchdog process can force low on its own:
+    # ('sysfs', channel_dir) for kernel PWM, ('gpio', pin) through RPi.GPIO.
+    # Everything is opened up front so forcing costs only the writes.
+    def __init__(self, outputs):
+        self.sysfs = []
+        self.pins = []
+        self.gpio = None
+        for output in outputs:
+            if output is None:
+                continue
+            kind, target = output
+            if kind == 'sysfs':
+                self.sysfs.append(target)
+            elif kind == 'gpio':
+                self.pins.append(int(target))
+        if self.pins:
+            try:
+                import RPi.GPIO as GPIO
+                GPIO.setwarnings(False)
+                GPIO.setmode(GPIO.BCM)
+                self.gpio = GPIO
+            except (ImportError, RuntimeError) as e:
+                print(f"[WATCHDOG] Cannot drive GPIO pins {self.pins}: {e}")
+
+    @property
+    def driven_by_dryer(self):
+        # Pins the dryer's own threads keep toggling while it runs
+        return bool(self.pins)
+
+    def force_low(self):
+        for channel_dir in self.sysfs:
+            for name in ('duty_cycle', 'enable'):
+                try:
+                    with open(os.path.join(channel_dir, name), 'w') as file:
+                        file.write('0')
+                except OSError as e:
+                    print(f"[WATCHDOG] Could not write {channel_dir}/{name}: {e}")
+        if self.gpio is not None:
+            for pin in self.pins:
+                try:
+                    self.gpio.setup(pin, self.gpio.OUT, initial=self.gpio.LOW)
+                    self.gpio.output(pin, self.gpio.LOW)
+                except RuntimeError as e:
+                    print(f"[WATCHDOG] Could not force GPIO{pin} low: {e}")
+
+
+def _raise_priority():
+    # Realtime priority keeps the response time bounded when the CPU is busy;
+    # without the permission fall back to a high nice level
+    try:
+        os.sched_setscheduler(0, os.SCHED_FIFO, os.sched_param(10))
+        return 'SCHED_FIFO'
+    except (AttributeError, OSError):
+        pass
+    try:
+        os.nice(-10)
+        return 'nice -10'
+    except OSError:
+        return 'normal'
+
+
+def run(path, config):
+    # The watchdog process
+    memory, block = _map(path)
+    header = block.header
+    chambers = config['chambers']
+    parent = config['parent']
+    fault_file = config['fault_file']
+    outputs = _Outputs(config['outputs'])
+    detectors = [FaultDetector(config) for _ in range(chambers)]
+    seen = [0] * chambers
+    clear = header.clear
+    killed = False
+    started = time.monotonic()
+    # The dryer's first heartbeat since this process started; until then it
+    # may still be starting up (or in its first, slow probe read) and is
+    # never killed for not acknowledging
+    first_beat = None
+    print(f"[WATCHDOG] Watching {chambers} chamber(s) every {config['poll'] * 1e3:g} ms, {_raise_priority()} priority")
+
+    def latch(code, chamber, value, onset):
+        outputs.force_low()
+        acted = time.monotonic()
+        header.fault_chamber = -1 if chamber is None else chamber
+        header.fault_value = value
+        header.onset = onset
+        header.acted = acted
+        header.fault_seq += 1
+        header.fault = code
+        print(f"[WATCHDOG] {FAULTS[code]}" + (f" in chamber {chamber}" if chamber is not None else "")
+              + f" ({value:.2f}); outputs forced low {(acted - onset) * 1e3:.1f} ms after onset")
+        try:
+            with open(fault_file, 'w') as file:
+                json.dump({'code': code, 'chamber': chamber, 'value': value, 'time': time.time()}, file)
+        except OSError as e:
+            print(f"[WATCHDOG] Could not record the fault in {fault_file}: {e}")
+
+    # A fault from before a restart stays latched until it is cleared
+    try:
+        with open(fault_file) as file:
+            saved = json.load(file)
+        now = time.monotonic()
+        latch(int(saved['code']), saved.get('chamber'), float(saved.get('value') or 0.0), now)
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+
+    try:
+        while True:
+            now = time.monotonic()
+            header.watchdog_heartbeat = now
+            if header.closing:
+                outputs.force_low()
+                break
+            if os.getppid() != parent:
+                if not header.fault:
+                    latch(DRYER_EXITED, None, now - header.heartbeat, now)
+                else:
+                    outputs.force_low()
+                break
+            if first_beat is None and header.heartbeat > started:
+                first_beat = header.heartbeat
+            if header.clear != clear:
+                clear = header.clear
+                if header.fault:
+                    print(f"[WATCHDOG] Fault cleared: {FAULTS[header.fault]}")
+                header.fault = 0
+                detectors = [FaultDetector(config) for _ in range(chambers)]
+                try:
+                    os.remove(fault_file)
+                except OSError:
+                    pass
+            if header.fault:
+                if (not killed and header.ack != header.fault_seq and config['kill_unresponsive']
+                        and outputs.driven_by_dryer and first_beat is not None
+                        and now - max(header.acted, first_beat) > config['ack_timeout']):
+                    # Its PWM threads may still be toggling the pins
+                    print(f"[WATCHDOG] Dryer did not acknowledge within {config['ack_timeout']:g} s; killing it")
+                    os.kill(parent, signal.SIGKILL)
+                    killed = True
+                    outputs.force_low()
+            elif header.heartbeat and now - header.heartbeat > config['stall_timeout']:
+                latch(STALLED, None, now - header.heartbeat, header.heartbeat + config['stall_timeout'])
+            elif header.ui_heartbeat and now - header.ui_heartbeat > config['ui_timeout']:
+                latch(UI_STALLED, None, now - header.ui_heartbeat, header.ui_heartbeat + config['ui_timeout'])
+            else:
+                for index in range(chambers):
+                    seq, sample = read_slot(block.slots[index])
+                    if seq == seen[index]:
+                        continue
+                    seen[index] = seq
+                    published, clock, temperature, target, duty, reading_clock = sample
+                    result = detectors[index].update(clock, temperature, target, duty, reading_clock)
+                    if result is not None:
+                        latch(result[0], index, result[1], published)
+                        break
+            time.sleep(config['poll'])
+    finally:
+        del header, block
+        memory.close()
+        if os.getppid() != parent:
+            # Nobody else will remove the block
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class Watchdog:
+    # The dryer's side: starts the process, publishes into the block and
+    # reads the latched fault. `outputs` has one entry per chamber, what the
+    # watchdog process can force low for it (see _Outputs) or None where only
+    # the dryer can switch the heater (the simulator's fake GPIO).
+    def __init__(self, outputs, fault_file=FAULT_FILE, **config):
+        if len(outputs) > MAX_CHAMBERS:
+            raise ValueError(f"The watchdog handles at most {MAX_CHAMBERS} chambers")
+        self.outputs = list(outputs)
+        self.fault_file = os.path.abspath(fault_file)
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.process = None
+        self.local_fault = None
+        self.closing = False
+        directory = '/dev/shm' if os.path.isdir('/dev/shm') else None
+        fd, self.path = tempfile.mkstemp(prefix='dryer-watchdog-', dir=directory)
+        os.ftruncate(fd, ctypes.sizeof(_Block))
+        os.close(fd)
+        self.memory, self.block = _map(self.path)
+        self.header = self.block.header
+
+    def start(self):
+        config = dict(self.config, chambers=len(self.outputs), outputs=self.outputs, parent=os.getpid(),
+                      fault_file=self.fault_file)
+        self.header.watchdog_heartbeat = 0.0
+        self.process = subprocess.Popen([sys.executable, os.path.abspath(__file__), self.path, json.dumps(config)])
+        deadline = time.monotonic() + START_TIMEOUT
+        while not self.header.watchdog_heartbeat and time.monotonic() < deadline and self.process.poll() is None:
+            time.sleep(0.01)
+        if not self.header.watchdog_heartbeat:
+            print("[WATCHDOG] The watchdog process did not start; heaters stay off")
+
+    def publish(self, index, clock, temperature, target, duty, reading_clock):
+        slot = self.block.slots[index]
+        slot.seq += 1
+        slot.published = time.monotonic()
+        slot.clock = clock
+        slot.temperature = math.nan if temperature is None else temperature
+        slot.target = math.nan if target is None else target
+        slot.duty = duty
+        slot.reading_clock = reading_clock
+        slot.seq += 1
+
+    def beat(self):
+        self.header.heartbeat = time.monotonic()
+
+    def ui_beat(self):
+        self.header.ui_heartbeat = time.monotonic()
+
+    def fault(self):
+        # The latched fault, or None
+        if self.local_fault is None and not self.closing and self.process is not None:
+            now = time.monotonic()
+            if self.process.poll() is not None or now - self.header.watchdog_heartbeat > WATCHDOG_TIMEOUT:
+                self.local_fault = WatchdogFault(WATCHDOG_LOST, FAULTS[WATCHDOG_LOST], None,
+                                                 now - self.header.watchdog_heartbeat, now, now)
+                print("[WATCHDOG] The watchdog process stopped responding; heaters off until it is cleared")
+        if self.local_fault is not None:
+            return self.local_fault
+        header = self.header
+        code = header.fault
+        if not code:
+            return None
+        return WatchdogFault(code, FAULTS.get(code, f'fault {code}'), None if header.fault_chamber < 0 else header.fault_chamber,
+                             header.fault_value, header.onset, header.acted)
+
+    @property
+    def acknowledged(self):
+        return self.header.ack == self.header.fault_seq
+
+    def acknowledge(self):
+        # Called once the dryer has switched its heaters off
+        self.header.ack = self.header.fault_seq
+
+    def clear(self):
+        if self.local_fault is not None:
+            self.local_fault = None
+            self.stop_process()
+            self.start()
+        self.header.clear += 1
+
+    def stop_process(self):
+        if self.process is None:
+            return
+        self.header.closing = 1
+        try:
+            self.process.wait(2.0)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+        self.header.closing = 0
+        self.process = None
+
+    def close(self):
+        self.closing = True
+        self.stop_process()
+        del self.header, self.block
+        self.memory.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], json.loads(sys.argv[2]))
@@ -0,0 +1,191 @@
+import os
+import numpy as np
+from kivy.graphics import Color, Line
+from kivy.metrics import dp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.label import Label
+from kivy.uix.widget import Widget
+from plot_buffer import PlotBuffer, AxisScaler, BlitRenderer, nan_range
+from metrics import METRICS
+
+TEMP_COLOR = (0.84, 0.15, 0.16, 1)   # tab:red
+PWM_COLOR = (0.12, 0.47, 0.71, 1)    # tab:blue
+AXIS_COLOR = (0.6, 0.6, 0.6, 1)
+
+RENDER_TIME = METRICS.histogram('ui_graph_render_seconds', 'Time to redraw a live plot')
+
+
+class LivePlot(Widget):
+    # Temperature and PWM history drawn with Kivy Line instructions. Each
+    # refresh maps the ring buffer to pixels with NumPy and swaps the line
+    # points; tick labels and the frame are only rebuilt when an axis range
+    # or the widget size changes.
+    def __init__(self, capacity=120, **kwargs):
+        super().__init__(**kwargs)
+        self.buffer = PlotBuffer(capacity, series=2)
+        self.x_scale = AxisScaler(-60.0, 0.0, min_span=10.0, padding=0.0, shrink=0.0)
+        self.temp_scale = AxisScaler(0.0, 100.0, min_span=5.0)
+        self.pwm_scale = AxisScaler(0.0, 100.0, fixed=True)
+        self.margin = (dp(40), dp(20), dp(40), dp(10))  # left, bottom, right, top
+        self._drawn_version = -1
+        self._layout_dirty = True
+        self._tick_labels = []
+        self.rescales = 0
+
+        with self.canvas:
+            Color(*AXIS_COLOR)
+            self._frame = Line(rectangle=(0, 0, 0, 0), width=1)
+            self._grid = Line(points=[], width=1)
+            self._temp_color = Color(*TEMP_COLOR)
+            self._temp_lines = []
+            self._pwm_color = Color(*PWM_COLOR)
+            self._pwm_lines = []
+        self.bind(pos=self._on_geometry, size=self._on_geometry)
+
+    def append(self, t, temperature, duty):
+        self.buffer.append(t, temperature, duty)
+
+    def set_history(self, times, temperatures, duties):
+        self.buffer.extend(times, temperatures, duties)
+
+    def clear(self):
+        self.buffer.clear()
+
+    def _on_geometry(self, *args):
+        self._layout_dirty = True
+        self.refresh()
+
+    def refresh(self, *args):
+        if self.buffer.version == self._drawn_version and not self._layout_dirty:
+            return
+        with RENDER_TIME.time():
+            self._draw()
+
+    def _draw(self):
+        self._drawn_version = self.buffer.version
+        times = self.buffer.times()
+        if not len(times):
+            return
+        x = times - times[-1]
+        temps = self.buffer.values(0)
+        duties = self.buffer.values(1)
+
+        rescaled = self.x_scale.update(float(x[0]), 0.0)
+        lo, hi = nan_range(temps)
+        rescaled = self.temp_scale.update(lo, hi) or rescaled
+        if rescaled or self._layout_dirty:
+            self.rescales += 1
+            self._layout_axes()
+            self._layout_dirty = False
+
+        left, bottom, right, top = self.margin
+        x0 = self.x + left
+        y0 = self.y + bottom
+        w = max(self.width - left - right, 1)
+        h = max(self.height - bottom - top, 1)
+        px = x0 + (x - self.x_scale.lo) * (w / (self.x_scale.hi - self.x_scale.lo))
+        self._set_series(self._temp_lines, self._temp_color, px,
+                         y0 + (temps - self.temp_scale.lo) * (h / (self.temp_scale.hi - self.temp_scale.lo)))
+        self._set_series(self._pwm_lines, self._pwm_color, px,
+                         y0 + (duties - self.pwm_scale.lo) * (h / (self.pwm_scale.hi - self.pwm_scale.lo)))
+
+    def _set_series(self, pool, color, px, py):
+        # Missing readings (NaN) split the series into separate Line
+        # instructions so gaps stay visible
+        valid = np.isfinite(py)
+        if valid.all():
+            segments = [(0, len(py))]
+        else:
+            edges = np.flatnonzero(np.diff(np.concatenate(([0], valid.view(np.int8), [0]))))
+            segments = list(zip(edges[::2], edges[1::2]))
+        while len(pool) < len(segments):
+            line = Line(points=[], width=dp(1.2))
+            # Keep new segments after this series' Color instruction
+            self.canvas.insert(self.canvas.indexof(color) + 1, line)
+            pool.append(line)
+        for line, (start, end) in zip(pool, segments):
+            points = np.empty(2 * (end - start))
+            points[0::2] = px[start:end]
+            points[1::2] = py[start:end]
+            line.points = points.tolist()
+        for line in pool[len(segments):]:
+            if line.points:
+                line.points = []
+
+    def _layout_axes(self):
+        left, bottom, right, top = self.margin
+        x0 = self.x + left
+        y0 = self.y + bottom
+        w = max(self.width - left - right, 1)
+        h = max(self.height - bottom - top, 1)
+        self._frame.rectangle = (x0, y0, w, h)
+        for label in self._tick_labels:
+            self.remove_widget(label)
+        self._tick_labels = []
+        grid = []
+        span = self.temp_scale.hi - self.temp_scale.lo
+        for tick in self.temp_scale.ticks():
+            ty = y0 + (tick - self.temp_scale.lo) * h / span
+            grid += [x0, ty, x0 + w, ty, x0, ty]
+            self._add_label(f'{tick:g}', x0 - left, ty, left - dp(4), 'right', TEMP_COLOR)
+        for tick in (0, 50, 100):
+            ty = y0 + tick * h / 100.0
+            self._add_label(f'{tick}%', x0 + w + dp(4), ty, right - dp(4), 'left', PWM_COLOR)
+        xspan = self.x_scale.hi - self.x_scale.lo
+        for tick in self.x_scale.ticks():
+            tx = x0 + (tick - self.x_scale.lo) * w / xspan
+            self._add_label(f'{tick:g}s', tx - dp(20), y0 - bottom / 2, dp(40), 'center', AXIS_COLOR)
+        self._grid.points = grid
+
+    def _add_label(self, text, x, y, width, halign, color):
+        label = Label(text=text, font_size=dp(10), color=color, halign=halign, valign='middle',
+                      size=(width, dp(14)), pos=(x, y - dp(7)), text_size=(width, dp(14)))
+        self.add_widget(label)
+        self._tick_labels.append(label)
+
+
+class MatplotlibLivePlot(BoxLayout):
+    # Fallback with the same interface as LivePlot, rendered by matplotlib
+    # with blitting instead of a full Agg redraw per update.
+    def __init__(self, capacity=120, **kwargs):
+        super().__init__(**kwargs)
+        from kivy.garden.matplotlib import FigureCanvasKivyAgg
+        import matplotlib.pyplot as plt
+        self.buffer = PlotBuffer(capacity, series=2)
+        figure, _ = plt.subplots()
+        self.figure_canvas = FigureCanvasKivyAgg(figure)
+        # Workaround for resize_event error in some garden.matplotlib versions
+        if not hasattr(self.figure_canvas, 'resize_event'):
+            self.figure_canvas.resize_event = lambda *args, **kwargs: None
+        # Workaround for motion_notify_event error in some garden.matplotlib versions
+        if not hasattr(self.figure_canvas, 'motion_notify_event'):
+            self.figure_canvas.motion_notify_event = lambda *args, **kwargs: None
+        self.renderer = BlitRenderer(figure, self.figure_canvas)
+        figure.tight_layout()
+        self.figure_canvas.bind(size=self.renderer.invalidate)
+        self.add_widget(self.figure_canvas)
+        self._drawn_version = -1
+
+    def append(self, t, temperature, duty):
+        self.buffer.append(t, temperature, duty)
+
+    def set_history(self, times, temperatures, duties):
+        self.buffer.extend(times, temperatures, duties)
+
+    def clear(self):
+        self.buffer.clear()
+
+    def refresh(self, *args):
+        if self.buffer.version == self._drawn_version:
+            return
+        self._drawn_version = self.buffer.version
+        with RENDER_TIME.time():
+            self.renderer.render(self.buffer)
+
+
+def create_live_plot(capacity=120, kind=None, **kwargs):
+    # 'kivy' (default) or 'matplotlib', also selectable with $DRYER_PLOT
+    kind = kind or os.environ.get('DRYER_PLOT', 'kivy')
+    if kind == 'matplotlib':
+        return MatplotlibLivePlot(capacity, **kwargs)
+    return LivePlot(capacity, **kwargs)
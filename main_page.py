@@ -5,10 +5,18 @@ from kivy.uix.label import Label
 from kivy.uix.button import Button
 from kivy.uix.slider import Slider
 from kivy.uix.gridlayout import GridLayout
+from drying_program import describe_status
+from ui_updates import UI_UPDATES
 
 class MainPage(BoxLayout):
-    def __init__(self, switch_to_settings, switch_to_preset_selection, switch_to_testing=None, **kwargs):
+    def __init__(self, switch_to_settings, switch_to_preset_selection, switch_to_testing=None, start_program=None, stop_program=None, switch_to_chambers=None,
+                 switch_to_diagnostics=None, clear_fault=None, **kwargs):
         super().__init__(orientation='vertical', **kwargs)
+        self.start_program = start_program
+        self.stop_program = stop_program
+        self.clear_fault = clear_fault
+        self.fault_popup = None
+        self.shown_fault = None
 
         self.add_widget(Label(text='Filament Dryer Control', font_size=sp(32), bold=True, size_hint=(1, 0.2)))
 
@@ -43,17 +51,77 @@ class MainPage(BoxLayout):
         self.testing_btn.bind(on_press=lambda x: switch_to_testing())
         self.add_widget(self.testing_btn)
 
+        tools_layout = BoxLayout(size_hint=(1, 0.2))
+        if switch_to_chambers is not None:
+            self.chambers_button = Button(text='All Chambers', font_size=sp(18))
+            self.chambers_button.bind(on_press=lambda instance: switch_to_chambers())
+            tools_layout.add_widget(self.chambers_button)
+        if switch_to_diagnostics is not None:
+            self.diagnostics_button = Button(text='Diagnostics', font_size=sp(18))
+            self.diagnostics_button.bind(on_press=lambda instance: switch_to_diagnostics())
+            tools_layout.add_widget(self.diagnostics_button)
+        if tools_layout.children:
+            self.add_widget(tools_layout)
+
         self.selected_preset_label = Label(text='Selected Preset: None', font_size=sp(18), size_hint=(1, 0.2))
         self.add_widget(self.selected_preset_label)
 
+        self.status_label = Label(text='Status: Idle', font_size=sp(18), size_hint=(1, 0.2))
+        self.add_widget(self.status_label)
+
     def update_temperature(self, instance, value):
         self.temperature_label.text = f'Temperature: {int(value)}°C'
 
     def start_dryer(self, instance):
-        print('Dryer started at', self.temperature_label.text)
+        if self.start_program is not None:
+            self.start_program(self.temperature_slider.value)
+        else:
+            print('Dryer started at', self.temperature_label.text)
 
     def stop_dryer(self, instance):
-        print('Dryer stopped')
+        if self.stop_program is not None:
+            self.stop_program()
+        else:
+            print('Dryer stopped')
+
+    def update_status(self, snapshot, fault=None):
+        # snapshot is the dryer's latest control snapshot (or None), fault
+        # the watchdog's latched fault (or None)
+        status = snapshot.program if snapshot is not None else None
+        text = f'Status: {describe_status(status)}'
+        if fault is not None:
+            text = f'FAULT: {fault.reason}'
+        if snapshot is not None and snapshot.temperature is not None:
+            text += f' | {snapshot.temperature:.1f}°C'
+        UI_UPDATES.set(self.status_label, text=text)
+        if fault is None:
+            self.shown_fault = None
+            if self.fault_popup is not None:
+                self.fault_popup.dismiss()
+        elif fault.acted != self.shown_fault:
+            self.shown_fault = fault.acted
+            self.open_fault_popup(fault)
+
+    def open_fault_popup(self, fault):
+        if self.fault_popup is not None:
+            self.fault_popup.dismiss()
+        popup_layout = BoxLayout(orientation='vertical', spacing=10)
+        where = f' in chamber {fault.chamber + 1}' if fault.chamber is not None else ''
+        popup_layout.add_widget(Label(text=f'{fault.reason}{where}.\nAll heaters are off until the fault is cleared.',
+                                      font_size=sp(18), halign='center'))
+        buttons = BoxLayout(size_hint=(1, 0.3), spacing=10)
+        if self.clear_fault is not None:
+            clear_button = Button(text='Clear Fault', font_size=sp(18))
+            clear_button.bind(on_press=lambda instance: self.clear_fault())
+            buttons.add_widget(clear_button)
+        close_button = Button(text='Close', font_size=sp(18))
+        buttons.add_widget(close_button)
+        popup_layout.add_widget(buttons)
+        popup = Popup(title='Heater Fault', content=popup_layout, size_hint=(0.9, 0.6), auto_dismiss=False)
+        close_button.bind(on_press=lambda instance: popup.dismiss())
+        popup.bind(on_dismiss=lambda instance: setattr(self, 'fault_popup', None))
+        self.fault_popup = popup
+        popup.open()
 
     def update_selected_preset(self, preset):
         self.selected_preset_label.text = f'Selected Preset: {preset}'
@@ -0,0 +1,244 @@
+import bisect
+import math
+import os
+import threading
+import time
+from file_utils import write_text_atomic
+
+METRICS_FILE = 'metrics.prom'
+PROFILE_DIR = 'profiles'
+
+# Bucket upper bounds in seconds: 10 µs to ~40 s, doubling
+TIME_BUCKETS = tuple(1e-5 * 2 ** i for i in range(23))
+
+
+class Histogram:
+    # Fixed buckets, so observe() is a bisect and two additions with no
+    # allocation. Quantiles are estimated from the buckets. Updates are not
+    # locked: a racing observation can at worst be lost, which a diagnostic
+    # histogram can afford.
+    def __init__(self, name, help='', buckets=TIME_BUCKETS, labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.buckets = tuple(buckets)
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q):
+        # Linear interpolation inside the bucket holding the q-th observation
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                lo = self.buckets[i - 1] if i else 0.0
+                hi = self.buckets[i] if i < len(self.buckets) else self.max
+                return min(lo + (hi - lo) * (rank - seen) / n, self.max)
+            seen += n
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+
+class _Timer:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Counter:
+    def __init__(self, name, help='', labels=None):
+        self.name = name
+        self.help = help
+        self.labels = labels or {}
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def reset(self):
+        self.value = 0
+
+
+class Registry:
+    # Named metrics, created on first use. The same name with different
+    # labels gives separate series that are exported under one family.
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labels, **kwargs):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            with self._lock:
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = cls(name, help, labels=labels, **kwargs)
+        return metric
+
+    def histogram(self, name, help='', buckets=TIME_BUCKETS, **labels):
+        return self._get(Histogram, name, help, labels, buckets=buckets)
+
+    def counter(self, name, help='', **labels):
+        return self._get(Counter, name, help, labels)
+
+    def get(self, name, **labels):
+        return self.metrics.get((name, tuple(sorted(labels.items()))))
+
+    def histograms(self):
+        return [m for m in list(self.metrics.values()) if isinstance(m, Histogram)]
+
+    def counters(self):
+        return [m for m in list(self.metrics.values()) if isinstance(m, Counter)]
+
+    def reset(self):
+        for metric in list(self.metrics.values()):
+            metric.reset()
+
+    def render_prometheus(self):
+        # Prometheus text exposition format
+        lines = []
+        families = {}
+        for metric in list(self.metrics.values()):
+            families.setdefault(metric.name, []).append(metric)
+        for name in sorted(families):
+            series = families[name]
+            kind = 'histogram' if isinstance(series[0], Histogram) else 'counter'
+            if series[0].help:
+                lines.append(f'# HELP {name} {series[0].help}')
+            lines.append(f'# TYPE {name} {kind}')
+            for metric in series:
+                if kind == 'counter':
+                    lines.append(f'{name}{_labels(metric.labels)} {metric.value}')
+                    continue
+                cumulative = 0
+                for bound, n in zip(metric.buckets, metric.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{_labels(metric.labels, le=_number(bound))} {cumulative}')
+                lines.append(f'{name}_bucket{_labels(metric.labels, le="+Inf")} {metric.count}')
+                lines.append(f'{name}_sum{_labels(metric.labels)} {_number(metric.sum)}')
+                lines.append(f'{name}_count{_labels(metric.labels)} {metric.count}')
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path=METRICS_FILE):
+        # Atomic, for node_exporter's textfile collector
+        write_text_atomic(path, self.render_prometheus())
+
+
+def _number(value):
+    return repr(float(value)) if math.isfinite(value) else ('+Inf' if value > 0 else '-Inf')
+
+
+def _labels(labels, **extra):
+    labels = {**labels, **extra}
+    if not labels:
+        return ''
+    items = ','.join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+    return '{' + items + '}'
+
+
+class MetricsExporter:
+    # Rewrites the Prometheus text file every `interval` seconds
+    def __init__(self, registry, path=METRICS_FILE, interval=15.0):
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='metrics-export', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(2.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.registry.write_prometheus(self.path)
+            except OSError as e:
+                print(f"[METRICS] Could not write {self.path}: {e}")
+
+
+class Profiler:
+    # cProfile around control ticks, switched on and off at runtime. cProfile
+    # only sees the thread that enables it, so the control loop wraps each
+    # tick in run() while active; stop() saves a .pstats file.
+    def __init__(self, directory=PROFILE_DIR):
+        self.directory = directory
+        self.active = False
+        self._profile = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        import cProfile
+        with self._lock:
+            if not self.active:
+                self._profile = cProfile.Profile()
+                self.active = True
+                print("[PROFILE] Profiling control ticks")
+
+    def run(self, fn, *args):
+        # Holding the lock lets stop() wait for the tick in progress
+        with self._lock:
+            if self._profile is None:
+                return fn(*args)
+            return self._profile.runcall(fn, *args)
+
+    def stop(self):
+        # Returns the path of the saved profile (None if it was not running)
+        with self._lock:
+            if not self.active:
+                return None
+            profile, self._profile = self._profile, None
+            self.active = False
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, time.strftime('profile-%Y%m%d-%H%M%S.pstats'))
+        profile.dump_stats(path)
+        print(f"[PROFILE] Saved {path}")
+        return path
+
+    def toggle(self):
+        if self.active:
+            return self.stop()
+        self.start()
+        return None
+
+
+# Process-wide registry and profiler used by the control loop and the UI
+METRICS = Registry()
+PROFILER = Profiler()
@@ -0,0 +1,164 @@
+import math
+import numpy as np
+
+NAN = float('nan')
+
+
+class PlotBuffer:
+    # Preallocated ring of (time, series...) samples. Every sample is written
+    # twice, at i and i + capacity, so the newest `count` samples are always
+    # one contiguous slice and reading never copies or concatenates.
+    def __init__(self, capacity=120, series=2):
+        self.capacity = capacity
+        self.series = series
+        self._times = np.full(2 * capacity, NAN)
+        self._data = np.full((series, 2 * capacity), NAN)
+        self.index = 0
+        self.count = 0
+        self.version = 0
+
+    def append(self, t, *values):
+        i = self.index
+        j = i + self.capacity
+        self._times[i] = self._times[j] = t
+        for k, value in enumerate(values):
+            v = NAN if value is None else value
+            self._data[k, i] = v
+            self._data[k, j] = v
+        self.index = (i + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+        self.version += 1
+
+    def extend(self, times, *columns):
+        # Bulk load, e.g. a whole session from the telemetry log; only the
+        # newest `capacity` samples are kept
+        times = np.asarray(times, dtype=float)[-self.capacity:]
+        n = len(times)
+        self.clear()
+        self._times[:n] = times
+        self._times[self.capacity:self.capacity + n] = times
+        for k, column in enumerate(columns):
+            column = np.asarray(column, dtype=float)[-self.capacity:]
+            self._data[k, :n] = column
+            self._data[k, self.capacity:self.capacity + n] = column
+        self.index = n % self.capacity
+        self.count = n
+        self.version += 1
+
+    def clear(self):
+        self._times.fill(NAN)
+        self._data.fill(NAN)
+        self.index = 0
+        self.count = 0
+        self.version += 1
+
+    def times(self):
+        end = self.index + self.capacity
+        return self._times[end - self.count:end]
+
+    def values(self, k):
+        end = self.index + self.capacity
+        return self._data[k, end - self.count:end]
+
+
+def nice_step(span, ticks=5):
+    raw = span / ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for m in (1, 2, 2.5, 5, 10):
+        if raw <= m * magnitude:
+            return m * magnitude
+    return 10 * magnitude
+
+
+class AxisScaler:
+    # Keeps an axis range stable: it only changes when the data leaves the
+    # current range or shrinks to a small part of it, so most frames only move
+    # points and never relayout ticks.
+    def __init__(self, lo=0.0, hi=1.0, min_span=1.0, padding=0.1, shrink=0.3, fixed=False):
+        self.lo = lo
+        self.hi = hi
+        self.min_span = min_span
+        self.padding = padding
+        self.shrink = shrink
+        self.fixed = fixed
+
+    def update(self, data_lo, data_hi):
+        # Returns True when the range changed
+        if self.fixed or not (math.isfinite(data_lo) and math.isfinite(data_hi)):
+            return False
+        span = self.hi - self.lo
+        if self.lo <= data_lo and data_hi <= self.hi and (data_hi - data_lo) >= self.shrink * span:
+            return False
+        data_span = max(data_hi - data_lo, self.min_span)
+        pad = data_span * self.padding
+        step = nice_step(data_span + 2 * pad)
+        lo = math.floor((data_lo - pad) / step) * step
+        hi = math.ceil((data_hi + pad) / step) * step
+        if (lo, hi) == (self.lo, self.hi):
+            return False
+        self.lo, self.hi = lo, hi
+        return True
+
+    def ticks(self):
+        step = nice_step(self.hi - self.lo)
+        first = math.ceil(self.lo / step) * step
+        return [float(v) for v in np.arange(first, self.hi + step * 0.5, step)]
+
+
+def nan_range(values):
+    finite = values[np.isfinite(values)]
+    if not len(finite):
+        return NAN, NAN
+    return float(finite.min()), float(finite.max())
+
+
+class BlitRenderer:
+    # Matplotlib fallback: the axes background is rendered once and cached,
+    # each frame restores it and redraws only the two line artists. A full
+    # draw happens only when an axis range changes or the canvas is resized.
+    def __init__(self, figure, canvas):
+        self.figure = figure
+        self.canvas = canvas
+        self.ax1 = figure.axes[0] if figure.axes else figure.add_subplot(111)
+        self.ax2 = self.ax1.twinx()
+        self.ax1.set_xlabel('Time (s)')
+        self.ax1.set_ylabel('Temperature (°C)', color='tab:red')
+        self.ax2.set_ylabel('PWM (%)', color='tab:blue')
+        self.temp_line, = self.ax1.plot([], [], 'r-', label='Temperature', animated=True)
+        self.pwm_line, = self.ax2.plot([], [], 'b-', label='PWM', animated=True)
+        self.x_scale = AxisScaler(-60.0, 0.0, min_span=10.0, padding=0.0, shrink=0.0)
+        self.temp_scale = AxisScaler(0.0, 100.0, min_span=5.0)
+        self.ax2.set_ylim(0, 100)
+        self.background = None
+        self.full_draws = 0
+
+    def invalidate(self, *args):
+        self.background = None
+
+    def render(self, buffer):
+        times = buffer.times()
+        if not len(times):
+            return
+        # Relative time axis (seconds before the newest sample) stays put
+        # once the window is full instead of scrolling every frame
+        x = times - times[-1]
+        temps = buffer.values(0)
+        duties = buffer.values(1)
+        if self.x_scale.update(float(x[0]), 0.0):
+            self.background = None
+        lo, hi = nan_range(temps)
+        if self.temp_scale.update(lo, hi):
+            self.background = None
+        self.temp_line.set_data(x, temps)
+        self.pwm_line.set_data(x, duties)
+        if self.background is None:
+            self.ax1.set_xlim(self.x_scale.lo, self.x_scale.hi)
+            self.ax1.set_ylim(self.temp_scale.lo, self.temp_scale.hi)
+            self.canvas.draw()
+            self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+            self.full_draws += 1
+        else:
+            self.canvas.restore_region(self.background)
+        self.ax1.draw_artist(self.temp_line)
+        self.ax2.draw_artist(self.pwm_line)
+        self.canvas.blit(self.figure.bbox)
@@ -0,0 +1,172 @@
+import bisect
+import re
+import threading
+from preset_store import preset_material
+
+_WORD = re.compile(r'[a-z0-9+]+')
+# Changes to more presets than this rebuild the index instead of patching it
+BULK_CHANGE = 64
+
+# Sort orders for the preset lists; ties break on the name
+SORT_KEYS = {
+    'name': lambda p: p.name.lower(),
+    'material': lambda p: (preset_material(p).lower() or '\uffff', p.name.lower()),
+    'temperature': lambda p: (p.temperature, p.name.lower()),
+}
+
+
+def tokenize(text):
+    return _WORD.findall(text.lower())
+
+
+def _deletions(word):
+    return {word[:i] + word[i + 1:] for i in range(len(word))}
+
+
+class PresetIndex:
+    # In-memory search over a PresetStore, kept current through its listener.
+    # A query's words match in three tiers, best first:
+    #   prefix  every word starts a word of the name or material ("pet bla")
+    #   typo    words one substitution, insertion, deletion or swap away from
+    #           a whole word ("petq blakc"); found through a table of
+    #           single-letter deletions so nothing is scanned
+    #   fuzzy   the query's letters appear in order in the name ("ptgblk")
+    # Results are names, by tier and then by the chosen sort key.
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        self.rebuild()
+        store.bind(self.on_presets_changed)
+
+    def rebuild(self):
+        with self._lock:
+            self._rebuild()
+
+    def _rebuild(self):
+        self._words = []         # sorted (word, name)
+        self._name_words = {}    # name -> its words
+        self._word_names = {}    # word -> names using it
+        self._deleted = {}       # word with one letter dropped -> words
+        self._lower = {}         # name -> lowercase name
+        self._sorted = {}        # sort key -> ({name: position}, names in order)
+        for preset in self.store:
+            self._add(preset, bulk=True)
+        self._words.sort()
+
+    def close(self):
+        self.store.unbind(self.on_presets_changed)
+
+    def on_presets_changed(self, changed, removed):
+        with self._lock:
+            if len(changed) + len(removed) > BULK_CHANGE:
+                # An import: one sort beats thousands of list inserts
+                self._rebuild()
+                return
+            for name in removed:
+                self._remove(name)
+            for name in changed:
+                self._remove(name)
+                preset = self.store.get(name)
+                if preset is not None:
+                    self._add(preset)
+            self._sorted = {}
+
+    def _add(self, preset, bulk=False):
+        name = preset.name
+        words = set(tokenize(name)) | set(tokenize(preset_material(preset)))
+        self._name_words[name] = words
+        self._lower[name] = name.lower()
+        for word in words:
+            if bulk:
+                self._words.append((word, name))
+            else:
+                bisect.insort(self._words, (word, name))
+            names = self._word_names.get(word)
+            if names is None:
+                names = self._word_names[word] = set()
+                for variant in _deletions(word) | {word}:
+                    self._deleted.setdefault(variant, set()).add(word)
+            names.add(name)
+
+    def _remove(self, name):
+        words = self._name_words.pop(name, None)
+        if words is None:
+            return
+        del self._lower[name]
+        for word in words:
+            i = bisect.bisect_left(self._words, (word, name))
+            if i < len(self._words) and self._words[i] == (word, name):
+                del self._words[i]
+            names = self._word_names[word]
+            names.discard(name)
+            if not names:
+                del self._word_names[word]
+                for variant in _deletions(word) | {word}:
+                    variants = self._deleted.get(variant)
+                    if variants is not None:
+                        variants.discard(word)
+                        if not variants:
+                            del self._deleted[variant]
+
+    def sorted_names(self, sort='name'):
+        with self._lock:
+            return list(self._order(sort)[1])
+
+    def _order(self, sort):
+        order = self._sorted.get(sort)
+        if order is None:
+            key = SORT_KEYS[sort]
+            presets = self.store.presets
+            names = sorted(self._name_words, key=lambda n: key(presets[n]))
+            order = self._sorted[sort] = ({name: i for i, name in enumerate(names)}, names)
+        return order
+
+    def search(self, query, sort='name', fuzzy=True):
+        words = tokenize(query)
+        with self._lock:
+            if not words:
+                return list(self._order(sort)[1])
+            prefix = self._match_all(words, self._prefix_names)
+            typo = self._match_all(words, self._near_names) - prefix
+            found = prefix | typo
+            # Fuzzy matches rank by how tightly the letters sit together
+            loose = {}
+            if fuzzy and len(''.join(words)) >= 3:
+                pattern = re.compile('.*?'.join(re.escape(c) for c in ''.join(words)))
+                for name, lower in self._lower.items():
+                    if name not in found:
+                        match = pattern.search(lower)
+                        if match:
+                            loose[name] = match.end() - match.start()
+            position = self._order(sort)[0]
+        rank = {name: (0, 0) for name in prefix}
+        rank.update((name, (1, 0)) for name in typo)
+        rank.update((name, (2, span)) for name, span in loose.items())
+        return sorted(rank, key=lambda n: (rank[n], position[n]))
+
+    def _match_all(self, words, match):
+        # Names matching every query word
+        result = None
+        for word in words:
+            names = match(word)
+            result = names if result is None else result & names
+            if not result:
+                return set()
+        return result
+
+    def _prefix_names(self, word):
+        names = set()
+        i = bisect.bisect_left(self._words, (word,))
+        while i < len(self._words) and self._words[i][0].startswith(word):
+            names.add(self._words[i][1])
+            i += 1
+        return names
+
+    def _near_names(self, word):
+        if len(word) < 4:
+            return self._prefix_names(word)
+        names = set()
+        for variant in _deletions(word) | {word}:
+            for near in self._deleted.get(variant, ()):
+                names |= self._word_names[near]
+        return names | self._prefix_names(word)
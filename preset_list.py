@@ -0,0 +1,82 @@
+from kivy.clock import Clock
+from kivy.metrics import dp, sp
+from kivy.uix.boxlayout import BoxLayout
+from kivy.uix.button import Button
+from kivy.uix.label import Label
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.textinput import TextInput
+from preset_index import SORT_KEYS
+
+# Seconds of no typing before the list is filtered
+SEARCH_DELAY = 0.15
+
+
+class PresetBrowser(BoxLayout):
+    # Search box, sort toggle and a recycled list of presets. Only the rows on
+    # screen exist as widgets; scrolling rebinds them to other entries of
+    # `data`, so thousands of presets cost what a screenful does.
+    # `row_data(preset)` gives the properties of a preset's `viewclass` row.
+    def __init__(self, presets, index, viewclass, row_data, row_height=dp(52), **kwargs):
+        super().__init__(orientation='vertical', spacing=dp(4), **kwargs)
+        self.presets = presets
+        self.index = index
+        self.row_data = row_data
+        self.sort = 'name'
+        self.names = []
+        self.positions = {}
+        self.search_event = None
+
+        bar = BoxLayout(size_hint=(1, None), height=dp(44), spacing=dp(4))
+        self.search_input = TextInput(hint_text='Search name or material', multiline=False, font_size=sp(18))
+        self.search_input.bind(text=self.on_search_text)
+        bar.add_widget(self.search_input)
+        self.sort_button = Button(text=f'Sort: {self.sort}', size_hint=(0.3, 1), font_size=sp(16))
+        self.sort_button.bind(on_press=self.next_sort)
+        bar.add_widget(self.sort_button)
+        self.count_label = Label(size_hint=(0.15, 1), font_size=sp(14))
+        bar.add_widget(self.count_label)
+        self.add_widget(bar)
+
+        self.list = RecycleView(bar_width=dp(10), scroll_type=['bars', 'content'])
+        layout = RecycleBoxLayout(orientation='vertical', default_size=(None, row_height),
+                                  default_size_hint=(1, None), size_hint=(1, None), spacing=dp(2))
+        layout.bind(minimum_height=layout.setter('height'))
+        self.list.add_widget(layout)
+        # Needs the layout in place; as a constructor argument it is dropped
+        self.list.viewclass = viewclass
+        self.add_widget(self.list)
+
+        self.refresh()
+        self.presets.bind(self.on_presets_changed)
+
+    def on_search_text(self, instance, text):
+        # Filter once typing pauses, not on every key
+        if self.search_event is not None:
+            self.search_event.cancel()
+        self.search_event = Clock.schedule_once(lambda dt: self.refresh(), SEARCH_DELAY)
+
+    def next_sort(self, instance=None):
+        keys = list(SORT_KEYS)
+        self.sort = keys[(keys.index(self.sort) + 1) % len(keys)]
+        self.sort_button.text = f'Sort: {self.sort}'
+        self.refresh()
+
+    def refresh(self):
+        self.search_event = None
+        self.names = self.index.search(self.search_input.text, self.sort)
+        self.positions = {name: i for i, name in enumerate(self.names)}
+        presets = self.presets.presets
+        self.list.data = [self.row_data(presets[name]) for name in self.names]
+        self.list.scroll_y = 1.0
+        self.count_label.text = str(len(self.names))
+
+    def on_presets_changed(self, changed, removed):
+        # Edits relabel their rows in place, so a row does not jump away
+        # while it is being changed; new or removed presets refilter
+        if removed or any(name not in self.positions for name in changed):
+            self.refresh()
+            return
+        data = self.list.data
+        for name in changed:
+            data[self.positions[name]] = self.row_data(self.presets.get(name))
@@ -1,37 +1,45 @@
+from kivy.metrics import sp
+from kivy.properties import ObjectProperty, StringProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
+from preset_store import format_temperature, format_duration, preset_material
+from preset_list import PresetBrowser
+
+class PresetRowButton(Button):
+    # Recycled row; `select` is called with the preset name
+    preset_name = StringProperty('')
+    select = ObjectProperty(None, allownone=True)
+
+    def on_release(self):
+        if self.select is not None:
+            self.select(self.preset_name)
 
 class PresetSelectionPage(BoxLayout):
-    def __init__(self, switch_to_main, presets, **kwargs):
+    def __init__(self, switch_to_main, presets, index, **kwargs):
         super().__init__(orientation='vertical', **kwargs)
 
         self.presets = presets
         self.switch_to_main = switch_to_main
 
-        self.add_widget(Label(text='Select a Preset', font_size=24))
+        self.add_widget(Label(text='Select a Preset', font_size=24, size_hint=(1, 0.12)))
 
-        for preset, value in self.presets.items():
-            button = Button(text=f'{preset}: {value}')
-            button.bind(on_press=lambda instance, p=preset: self.select_preset(p))
-            self.add_widget(button)
+        self.browser = PresetBrowser(presets, index, PresetRowButton, self.row_data)
+        self.add_widget(self.browser)
 
-        self.back_button = Button(text='Back to Main')
+        self.back_button = Button(text='Back to Main', size_hint=(1, 0.12))
         self.back_button.bind(on_press=lambda instance: switch_to_main())
         self.add_widget(self.back_button)
 
-    def select_preset(self, preset):
-        print(f'Selected preset: {preset} with value {self.presets[preset]}')
-        self.switch_to_main(preset)
-
-    def update_presets(self, presets):
-        self.presets = presets
-        self.clear_widgets()
-        self.add_widget(Label(text='Select a Preset', font_size=24))
+    def preset_text(self, preset):
+        material = preset_material(preset)
+        material = f' [{material}]' if material and material.lower() not in preset.name.lower() else ''
+        return f'{preset.name}{material}: {format_temperature(preset.temperature)}, {format_duration(preset.duration)}'
 
-        for preset, value in self.presets.items():
-            button = Button(text=f'{preset}: {value}')
-            button.bind(on_press=lambda instance, p=preset: self.select_preset(p))
-            self.add_widget(button)
+    def row_data(self, preset):
+        return {'text': self.preset_text(preset), 'preset_name': preset.name, 'select': self.select_preset,
+                'font_size': sp(16)}
 
-        self.add_widget(self.back_button)
\ No newline at end of file
+    def select_preset(self, preset):
+        print(f'Selected preset: {preset} with value {format_temperature(self.presets.get(preset).temperature)}')
+        self.switch_to_main(preset)
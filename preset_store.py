@@ -0,0 +1,247 @@
+import csv
+import io
+import json
+import re
+import shutil
+from collections import namedtuple
+from file_utils import write_json_atomic, write_text_atomic
+
+PRESETS_FILE = 'presets.json'
+
+# temperature in °C, duration in minutes, humidity target in %RH (None = not
+# controlled), ramp_rate in °C/min (None = heat as fast as possible),
+# material (None = guessed from the name, see preset_material)
+Preset = namedtuple('Preset', 'name temperature duration humidity ramp_rate material', defaults=(240, None, None, None))
+
+# Recognised in preset names, longest first so PETG is not read as PET
+MATERIALS = ('PLA+', 'PETG', 'PCTG', 'HIPS', 'PEEK', 'PEKK', 'NYLON', 'PLA', 'PET', 'ABS', 'ASA', 'TPU', 'TPE',
+             'PVA', 'BVOH', 'PVB', 'PA6', 'PA12', 'PA', 'PC', 'PP', 'CPE')
+_MATERIAL_ALIASES = {'NYLON': 'PA', 'PA6': 'PA', 'PA12': 'PA'}
+
+# Accepted range of each numeric field; values outside it (or NaN) are invalid.
+# The temperature range covers every material in MATERIALS, PEEK and PEKK
+# included (they dry at up to about 150-160 °C).
+FIELD_LIMITS = {
+    'temperature': (0.0, 200.0),
+    'duration': (0, 7 * 24 * 60),
+    'humidity': (0.0, 100.0),
+    'ramp_rate': (0.01, 100.0),
+}
+OPTIONAL_FIELDS = ('humidity', 'ramp_rate', 'material')
+
+DEFAULT_PRESETS = {
+    'PLA': Preset('PLA', 50.0),
+    'ABS': Preset('ABS', 60.0),
+    'PETG': Preset('PETG', 55.0),
+}
+
+
+def format_temperature(temperature):
+    return f'{temperature:g}°C'
+
+
+def format_duration(minutes):
+    return f'{int(minutes) // 60}h {int(minutes) % 60:02d}m'
+
+
+def preset_material(preset):
+    # The preset's material, or the first one named in it ('' if none)
+    if preset.material:
+        return preset.material
+    for word in re.findall(r'[A-Za-z0-9+]+', preset.name.upper()):
+        if word in MATERIALS:
+            return _MATERIAL_ALIASES.get(word, word)
+    return ''
+
+
+def parse_field(key, value):
+    # One preset field from JSON or text, converted and range-checked.
+    # Raises ValueError/TypeError for anything a Preset must not hold.
+    if key in OPTIONAL_FIELDS and (value is None or value == ''):
+        return None
+    if key == 'material':
+        return str(value).strip() or None
+    if isinstance(value, bool):
+        raise TypeError(f'{key} must be a number')
+    if isinstance(value, str):
+        value = value.replace('°C', '').strip()
+    number = float(value)
+    if key == 'duration':
+        number = int(number)
+    low, high = FIELD_LIMITS[key]
+    if not low <= number <= high:
+        raise ValueError(f'{key} {value} is outside {low:g}-{high:g}')
+    return number
+
+
+def parse_preset(name, value):
+    # Accepts the numeric schema and the legacy '50°C' strings
+    if not isinstance(value, dict):
+        return Preset(name, parse_field('temperature', value))
+    return Preset(name, parse_field('temperature', value['temperature']),
+                  parse_field('duration', value.get('duration', 240)),
+                  *(parse_field(key, value.get(key)) for key in OPTIONAL_FIELDS))
+
+
+def preset_dict(preset):
+    return {'temperature': preset.temperature, 'duration': preset.duration, 'humidity': preset.humidity,
+            'ramp_rate': preset.ramp_rate, 'material': preset.material}
+
+
+def read_presets(path):
+    # A preset library file: JSON as for parse_library, or a CSV with a
+    # header row naming at least name and temperature. Returns (presets, rows
+    # skipped); raises OSError or ValueError if the file cannot be used.
+    with open(path, 'r', newline='', encoding='utf-8-sig') as file:
+        if not path.lower().endswith('.csv'):
+            return parse_library(json.load(file))
+        # Empty cells are missing values
+        try:
+            rows = [{k.strip().lower(): v.strip() for k, v in row.items() if k and v and v.strip()}
+                    for row in csv.DictReader(file)]
+        except csv.Error as e:
+            raise ValueError(f'not a CSV file: {e}')
+    return parse_library(rows)
+
+
+def parse_library(data):
+    # presets.json's {name: fields} schema or a list of {"name": ..., fields};
+    # fields may be numbers or strings (CSV cells). Invalid rows are skipped
+    # and counted; anything but a dict or list raises ValueError.
+    if isinstance(data, dict):
+        data = [{'name': k, **(v if isinstance(v, dict) else {'temperature': v})} for k, v in data.items()]
+    elif not isinstance(data, list):
+        raise ValueError('expected {name: fields} or a list of presets')
+    presets = []
+    skipped = 0
+    for row in data:
+        try:
+            name = str(row['name']).strip()
+            if not name:
+                raise ValueError('empty name')
+            presets.append(parse_preset(name, row))
+        except (KeyError, ValueError, TypeError, AttributeError):
+            skipped += 1
+    return presets, skipped
+
+
+def write_presets(path, presets):
+    # Export in the format given by the extension (.csv or .json)
+    presets = list(presets)
+    if path.lower().endswith('.csv'):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(('name',) + Preset._fields[1:])
+        for preset in presets:
+            writer.writerow(['' if v is None else v for v in preset])
+        write_text_atomic(path, out.getvalue())
+    else:
+        write_json_atomic(path, {p.name: preset_dict(p) for p in presets}, indent=2)
+    return len(presets)
+
+
+class PresetStore:
+    # The single in-memory copy of the presets, shared by every page. Files
+    # are read once and written atomically; listeners get the names that
+    # changed so pages can update just those rows.
+    def __init__(self, path=PRESETS_FILE):
+        self.path = path
+        self.listeners = []
+        self.dirty = False
+        self.presets = self.load()
+
+    def load(self):
+        # Invalid presets are skipped; the file is copied aside first so the
+        # next save does not lose them. Only a missing file means defaults.
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                presets, skipped = parse_library(json.load(file))
+        except FileNotFoundError:
+            return dict(DEFAULT_PRESETS)
+        except (OSError, ValueError) as e:
+            self._keep_copy(f'Could not read {self.path}: {e}')
+            return dict(DEFAULT_PRESETS)
+        if skipped:
+            self._keep_copy(f'Skipped {skipped} invalid presets in {self.path}')
+        return {preset.name: preset for preset in presets}
+
+    def _keep_copy(self, problem):
+        backup = self.path + '.bak'
+        try:
+            shutil.copy2(self.path, backup)
+            print(f"[PRESETS] {problem}; the original is kept as {backup}")
+        except OSError as e:
+            print(f"[PRESETS] {problem}; could not keep a copy: {e}")
+
+    def save(self):
+        write_presets(self.path, self.presets.values())
+        self.dirty = False
+
+    def bind(self, listener):
+        # listener(changed_names, removed_names)
+        self.listeners.append(listener)
+
+    def unbind(self, listener):
+        self.listeners.remove(listener)
+
+    def __contains__(self, name):
+        return name in self.presets
+
+    def __iter__(self):
+        return iter(self.presets.values())
+
+    def __len__(self):
+        return len(self.presets)
+
+    def get(self, name, default=None):
+        return self.presets.get(name, default)
+
+    def names(self):
+        return list(self.presets)
+
+    def update(self, name, **fields):
+        # Change some fields of a preset, or create it if it does not exist
+        current = self.presets.get(name) or Preset(name, fields.pop('temperature', 0.0))
+        preset = current._replace(**fields)
+        if preset == self.presets.get(name):
+            return preset
+        self.presets[name] = preset
+        self.dirty = True
+        self._notify({name}, set())
+        return preset
+
+    def update_many(self, presets):
+        # Add or replace whole presets with a single notification
+        changed = set()
+        for preset in presets:
+            if self.presets.get(preset.name) != preset:
+                self.presets[preset.name] = preset
+                changed.add(preset.name)
+        if changed:
+            self.dirty = True
+            self._notify(changed, set())
+        return changed
+
+    def import_file(self, path):
+        # Merge a JSON/CSV library; presets with the same name are replaced.
+        # Returns (presets added or changed, rows skipped).
+        presets, skipped = read_presets(path)
+        changed = self.update_many(presets)
+        print(f"[PRESETS] Imported {len(changed)} of {len(presets)} presets from {path}"
+              + (f", skipped {skipped} invalid rows" if skipped else ""))
+        return len(changed), skipped
+
+    def export_file(self, path, names=None):
+        presets = self.presets.values() if names is None else [self.presets[n] for n in names if n in self.presets]
+        count = write_presets(path, presets)
+        print(f"[PRESETS] Exported {count} presets to {path}")
+        return count
+
+    def remove(self, name):
+        if self.presets.pop(name, None) is not None:
+            self.dirty = True
+            self._notify(set(), {name})
+
+    def _notify(self, changed, removed):
+        for listener in list(self.listeners):
+            listener(changed, removed)
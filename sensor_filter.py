@@ -0,0 +1,119 @@
+import os
+
+FILTER_KINDS = ('kalman', 'ema', 'median', 'off')
+# DS18B20 measuring range; anything outside is a bus error (-127 °C, 4095 °C)
+VALID_RANGE = (-55.0, 125.0)
+
+
+def filter_kind(kind=None):
+    # 'kalman', 'ema', 'median', 'off', or None for $DRYER_SENSOR_FILTER
+    kind = kind or os.environ.get('DRYER_SENSOR_FILTER', 'kalman')
+    if kind not in FILTER_KINDS:
+        print(f"[FILTER] Unknown filter '{kind}', using kalman")
+        kind = 'kalman'
+    return kind
+
+
+class SensorFilter:
+    # Streaming filter for one probe. The median of the last `window` good
+    # readings rejects single spikes (a DS18B20 that browns out reads 85 °C
+    # once), then a constant-velocity Kalman filter or an EMA smooths what is
+    # left. The Kalman filter tracks the rate of change as well, so it does
+    # not lag behind a ramp the way an EMA does.
+    #
+    # A failed reading holds the last estimate for up to max_hold seconds so
+    # one CRC error does not switch the heater off; after that the probe
+    # reads None and the control loop turns the heater off as before.
+    def __init__(self, kind='kalman', window=3, alpha=0.3, process_noise=1e-4, measurement_noise=4e-3,
+                 max_hold=5.0, valid_range=VALID_RANGE):
+        self.kind = kind
+        self.window = window
+        self.alpha = alpha
+        self.process_noise = process_noise          # (°C/s²)² acceleration noise
+        self.measurement_noise = measurement_noise  # °C² probe noise incl. 1/16 °C steps
+        self.max_hold = max_hold                    # s
+        self.valid_range = valid_range
+        self.reset()
+
+    def reset(self):
+        self.recent = []
+        self.value = None
+        self.rate = 0.0
+        self.last_good = None
+        self._last_update = None
+        # Kalman covariance [[p00, p01], [p01, p11]] of (temperature, rate)
+        self._p00 = self._p01 = self._p11 = 0.0
+
+    def update(self, now, raw):
+        # Feed one reading (None for a failed read); returns the estimate or
+        # None when the probe has been failing for longer than max_hold
+        if raw is not None and not self.valid_range[0] <= raw <= self.valid_range[1]:
+            raw = None
+        if raw is None:
+            if self.last_good is None or now - self.last_good > self.max_hold:
+                if self.value is not None:
+                    print(f"[FILTER] No good reading for {self.max_hold:g} s, dropping the held value")
+                    self.reset()
+                return None
+            return self.value
+        self.last_good = now
+        self.recent.append(raw)
+        if len(self.recent) > self.window:
+            del self.recent[0]
+        measured = sorted(self.recent)[len(self.recent) // 2] if self.window > 1 else raw
+        if self.value is None:
+            # Start from the first reading with an unknown rate
+            self.value = measured
+            self._p00 = self.measurement_noise
+            self._p11 = 0.01
+        elif self.kind == 'median':
+            self.value = measured
+        elif self.kind == 'ema':
+            self.value += self.alpha * (measured - self.value)
+        else:
+            self._kalman(now - self._last_update, measured)
+        self._last_update = now
+        return self.value
+
+    def _kalman(self, dt, measured):
+        dt = max(dt, 0.0)
+        # Predict: x += rate * dt, P = F P F' + Q (white acceleration noise)
+        q = self.process_noise
+        p00 = self._p00 + dt * (2 * self._p01 + dt * self._p11) + q * dt ** 3 / 3
+        p01 = self._p01 + dt * self._p11 + q * dt ** 2 / 2
+        p11 = self._p11 + q * dt
+        predicted = self.value + self.rate * dt
+        # Update with the temperature measurement
+        s = p00 + self.measurement_noise
+        k0 = p00 / s
+        k1 = p01 / s
+        residual = measured - predicted
+        self.value = predicted + k0 * residual
+        self.rate += k1 * residual
+        self._p00 = (1 - k0) * p00
+        self._p01 = (1 - k0) * p01
+        self._p11 = p11 - k1 * p01
+
+
+class SensorFilterBank:
+    # One SensorFilter per probe, created as probes show up
+    def __init__(self, kind=None, **options):
+        self.kind = filter_kind(kind)
+        self.options = options
+        self.filters = {}
+
+    def update(self, now, readings):
+        # {sensor_id: raw or None} -> {sensor_id: estimate or None}
+        if self.kind == 'off':
+            return readings
+        filtered = {}
+        for sensor_id, raw in readings.items():
+            sensor_filter = self.filters.get(sensor_id)
+            if sensor_filter is None:
+                sensor_filter = self.filters[sensor_id] = SensorFilter(self.kind, **self.options)
+            filtered[sensor_id] = sensor_filter.update(now, raw)
+        return filtered
+
+    def reset(self):
+        for sensor_filter in self.filters.values():
+            sensor_filter.reset()
@@ -0,0 +1,124 @@
+import json
+import os
+import threading
+import time
+from file_utils import write_json_atomic, fsync_directory
+from metrics import METRICS
+
+CHECKPOINT_FILE = 'session_checkpoint.json'
+VERSION = 1
+# s between checkpoints of a running program ($DRYER_CHECKPOINT_INTERVAL);
+# stage changes are written sooner, but never more often than MIN_WRITE_GAP
+CHECKPOINT_INTERVAL = float(os.environ.get('DRYER_CHECKPOINT_INTERVAL', 60.0))
+MIN_WRITE_GAP = 5.0
+# Runs interrupted for longer than this are not resumed: the filament has
+# taken the moisture back and the box may well have been opened
+MAX_OUTAGE = float(os.environ.get('DRYER_RESUME_MAX_OUTAGE', 4 * 3600))
+
+
+class SessionCheckpoint:
+    # The running programs on disk, so a run survives a power cut. The
+    # control loop only asks due() and hands over a small dict; a background
+    # thread does the JSON, the write and the fsync, so a slow SD card never
+    # delays a tick. Each write replaces the file atomically: after a power
+    # cut it holds either the old checkpoint or the new one, never half.
+    def __init__(self, path=CHECKPOINT_FILE, interval=CHECKPOINT_INTERVAL, min_gap=MIN_WRITE_GAP, clock=time.time):
+        self.path = path
+        self.interval = interval
+        self.min_gap = min_gap
+        self.clock = clock
+        self.writes = 0
+        self._pending = None
+        self._has_pending = False
+        self._last_write = None
+        self._key = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._write_time = METRICS.histogram('dryer_checkpoint_write_seconds', 'Time to write and fsync a checkpoint')
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='checkpoint', daemon=True)
+            self._thread.start()
+
+    def due(self, key):
+        # Cheap enough for every tick. `key` changes when a program starts,
+        # stops or changes stage; None means nothing is running.
+        now = self.clock()
+        last = self._last_write
+        if key != self._key:
+            # Stopping writes at once: a stopped run must not come back
+            if key is None or last is None or now - last >= self.min_gap or now < last:
+                return True
+            return False
+        return key is not None and (last is None or now - last >= self.interval or now < last)
+
+    def submit(self, key, state):
+        # state: {'chambers': [...]} from the control thread, or None to
+        # remove the checkpoint
+        self._key = key
+        self._last_write = self.clock()
+        if state is not None:
+            state = dict(state, version=VERSION, time=self._last_write)
+        with self._lock:
+            self._pending = state
+            self._has_pending = True
+        if self._thread is None:
+            self._write_pending()
+        else:
+            self._wake.set()
+
+    def load(self):
+        # The last checkpoint, or None
+        try:
+            with open(self.path) as file:
+                state = json.load(file)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"[CHECKPOINT] Could not read {self.path}: {e}")
+            return None
+        if not isinstance(state, dict) or state.get('version') != VERSION:
+            print(f"[CHECKPOINT] Ignoring {self.path}: unknown format")
+            return None
+        return state
+
+    def clear(self):
+        self.submit(None, None)
+
+    def close(self):
+        # Writes whatever was submitted last
+        self._stop_event.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(5.0)
+            self._thread = None
+        self._write_pending()
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            self._wake.wait()
+            self._wake.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        with self._lock:
+            if not self._has_pending:
+                return
+            state = self._pending
+            self._has_pending = False
+        start = time.perf_counter()
+        try:
+            if state is None:
+                if os.path.exists(self.path):
+                    os.remove(self.path)
+            else:
+                write_json_atomic(self.path, state)
+                fsync_directory(self.path)
+            self.writes += 1
+        except OSError as e:
+            print(f"[CHECKPOINT] Write failed: {e}")
+        self._write_time.observe(time.perf_counter() - start)
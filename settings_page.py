@@ -1,37 +1,63 @@
-import json
-from kivy.metrics import sp
+import os
+from kivy.metrics import dp, sp
+from kivy.properties import ObjectProperty, StringProperty
 from kivy.uix.popup import Popup
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.label import Label
 from kivy.uix.button import Button
-from kivy.uix.gridlayout import GridLayout
 from kivy.uix.slider import Slider
+from kivy.uix.textinput import TextInput
+from preset_store import PresetStore, format_temperature, format_duration
+from preset_index import PresetIndex
+from preset_list import PresetBrowser
+
+class PresetSettingsRow(BoxLayout):
+    # Recycled row: name, then temperature and duration buttons that call
+    # back with the preset name
+    preset_name = StringProperty('')
+    temperature_text = StringProperty('')
+    duration_text = StringProperty('')
+    edit_temperature = ObjectProperty(None, allownone=True)
+    edit_duration = ObjectProperty(None, allownone=True)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.name_label = Label(font_size=sp(18), padding=(dp(8), 0), halign='left', valign='middle', shorten=True, shorten_from='right')
+        self.name_label.bind(size=lambda label, size: setattr(label, 'text_size', size))
+        self.add_widget(self.name_label)
+        self.temperature_button = Button(font_size=sp(18), size_hint=(0.5, 1))
+        self.temperature_button.bind(on_release=lambda instance: self.edit_temperature(self.preset_name))
+        self.add_widget(self.temperature_button)
+        self.duration_button = Button(font_size=sp(18), size_hint=(0.5, 1))
+        self.duration_button.bind(on_release=lambda instance: self.edit_duration(self.preset_name))
+        self.add_widget(self.duration_button)
+
+    def on_preset_name(self, instance, name):
+        self.name_label.text = f'{name}:'
+
+    def on_temperature_text(self, instance, text):
+        self.temperature_button.text = text
+
+    def on_duration_text(self, instance, text):
+        self.duration_button.text = text
 
 class SettingsPage(BoxLayout):
-    def __init__(self, switch_to_main, presets_data_file='presets.json', **kwargs):
+    def __init__(self, switch_to_main, presets_data_file='presets.json', preset_store=None, index=None, **kwargs):
         self.presets_file = presets_data_file
-        self.presets = self.load_presets()
+        self.presets = preset_store if preset_store is not None else PresetStore(presets_data_file)
+        self.index = index if index is not None else PresetIndex(self.presets)
         super().__init__(orientation='vertical', **kwargs)
 
-        self.preset_buttons = {}
+        self.add_widget(Label(text='Settings', font_size=sp(32), bold=True, size_hint=(1, 0.14)))
 
-        self.add_widget(Label(text='Settings', font_size=sp(32), bold=True, size_hint=(1, 0.2)))
+        self.browser = PresetBrowser(self.presets, self.index, PresetSettingsRow, self.row_data)
+        self.add_widget(self.browser)
 
-        grid_layout = GridLayout(cols=2, size_hint=(1, 0.6))
+        button_layout = BoxLayout(size_hint=(1, 0.14))
 
-        for preset, value in self.presets.items():
-            label = Label(text=f'{preset}:', font_size=sp(18))
-            grid_layout.add_widget(label)
-
-            button = Button(text=f'{value}', font_size=sp(18))
-            button.bind(on_press=lambda instance, p=preset: self.open_slider_popup(p))
-            grid_layout.add_widget(button)
-
-            self.preset_buttons[preset] = button
-
-        self.add_widget(grid_layout)
-
-        button_layout = BoxLayout(size_hint=(1, 0.2))
+        self.library_button = Button(text='Import / Export', font_size=sp(18))
+        self.library_button.bind(on_press=self.open_library_popup)
+        button_layout.add_widget(self.library_button)
 
         self.save_button = Button(text='Save Presets', font_size=sp(18))
         self.save_button.bind(on_press=self.save_presets)
@@ -43,21 +69,64 @@ class SettingsPage(BoxLayout):
 
         self.add_widget(button_layout)
 
-    def load_presets(self):
+    def row_data(self, preset):
+        return {'preset_name': preset.name, 'temperature_text': format_temperature(preset.temperature),
+                'duration_text': format_duration(preset.duration),
+                'edit_temperature': self.open_slider_popup, 'edit_duration': self.open_duration_popup}
+
+    def open_library_popup(self, instance=None):
+        # Import a JSON/CSV preset library, or export the presets listed
+        # under the current search
+        from kivy.uix.filechooser import FileChooserListView
+        popup_layout = BoxLayout(orientation='vertical', spacing=dp(4))
+
+        chooser = FileChooserListView(path=os.getcwd(), filters=['*.json', '*.csv'])
+        popup_layout.add_widget(chooser)
+
+        filename = TextInput(text='presets-export.csv', multiline=False, font_size=sp(18), size_hint=(1, None), height=dp(44))
+        chooser.bind(selection=lambda instance, selection: selection and setattr(filename, 'text', os.path.basename(selection[0])))
+        popup_layout.add_widget(filename)
+
+        status = Label(text=f'{len(self.browser.names)} presets listed', font_size=sp(16), size_hint=(1, None), height=dp(32))
+        popup_layout.add_widget(status)
+
+        buttons = BoxLayout(size_hint=(1, None), height=dp(52))
+        import_button = Button(text='Import', font_size=sp(18))
+        import_button.bind(on_press=lambda instance: self.import_library(os.path.join(chooser.path, filename.text), status))
+        buttons.add_widget(import_button)
+        export_button = Button(text='Export Listed', font_size=sp(18))
+        export_button.bind(on_press=lambda instance: self.export_library(os.path.join(chooser.path, filename.text), status, chooser))
+        buttons.add_widget(export_button)
+        close_button = Button(text='Close', font_size=sp(18))
+        buttons.add_widget(close_button)
+        popup_layout.add_widget(buttons)
+
+        popup = Popup(title='Preset Library', content=popup_layout, size_hint=(0.95, 0.95))
+        close_button.bind(on_press=popup.dismiss)
+        popup.open()
+
+    def import_library(self, path, status):
+        try:
+            count, skipped = self.presets.import_file(path)
+        except (OSError, ValueError) as e:
+            status.text = f'Import failed: {e}'
+            return
+        status.text = f'Imported {count} presets' + (f', skipped {skipped}' if skipped else '') + ' - Save to keep'
+
+    def export_library(self, path, status, chooser):
         try:
-            with open(self.presets_file, 'r') as file:
-                return json.load(file)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {
-                'PLA': '50°C',
-                'ABS': '60°C',
-                'PETG': '55°C'
-            }
+            count = self.presets.export_file(path, self.browser.names)
+        except OSError as e:
+            status.text = f'Export failed: {e}'
+            return
+        # Re-dispatching path makes the chooser list the directory again
+        chooser.property('path').dispatch(chooser)
+        status.text = f'Exported {count} presets to {os.path.basename(path)}'
 
     def open_slider_popup(self, preset):
         popup_layout = BoxLayout(orientation='vertical')
 
-        slider = Slider(min=0, max=100, value=int(self.presets[preset].replace('°C', '')))
+        slider = Slider(min=0, max=100, value=self.presets.get(preset).temperature)
         slider_label = Label(text=f'{int(slider.value)}°C', font_size=sp(18))
         slider.bind(value=lambda instance, value: self.update_slider_label(slider_label, value))
         popup_layout.add_widget(slider_label)
@@ -70,19 +139,35 @@ class SettingsPage(BoxLayout):
         popup = Popup(title=f'Set {preset}', content=popup_layout, size_hint=(0.8, 0.5))
         popup.open()
 
+    def open_duration_popup(self, preset):
+        popup_layout = BoxLayout(orientation='vertical')
+
+        slider = Slider(min=0, max=24 * 60, step=15, value=self.presets.get(preset).duration)
+        slider_label = Label(text=format_duration(slider.value), font_size=sp(18))
+        slider.bind(value=lambda instance, value: setattr(slider_label, 'text', format_duration(value)))
+        popup_layout.add_widget(slider_label)
+        popup_layout.add_widget(slider)
+
+        close_button = Button(text='Set', size_hint=(1, 0.2), font_size=sp(18))
+        close_button.bind(on_press=lambda instance: self.set_preset_duration_and_close(preset, slider.value, popup))
+        popup_layout.add_widget(close_button)
+
+        popup = Popup(title=f'Set {preset} duration', content=popup_layout, size_hint=(0.8, 0.5))
+        popup.open()
+
     def update_slider_label(self, label, value):
         label.text = f'{int(value)}°C'
 
     def set_preset_value_and_close(self, preset, value, popup):
-        self.presets[preset] = f'{int(value)}°C'
+        self.presets.update(preset, temperature=float(int(value)))
         popup.dismiss()
+        print(f'Updated {preset} to {format_temperature(self.presets.get(preset).temperature)}')
 
-        if preset in self.preset_buttons:
-            self.preset_buttons[preset].text = f'{self.presets[preset]}'
-
-        print(f'Updated {preset} to {self.presets[preset]}')
+    def set_preset_duration_and_close(self, preset, value, popup):
+        self.presets.update(preset, duration=int(value))
+        popup.dismiss()
+        print(f'Updated {preset} duration to {format_duration(self.presets.get(preset).duration)}')
 
     def save_presets(self, instance=None):
-        with open(self.presets_file, 'w') as file:
-            json.dump(self.presets, file)
-        print('Presets saved:', self.presets)
\ No newline at end of file
+        self.presets.save()
+        print('Presets saved:', self.presets.names())
@@ -0,0 +1,370 @@
+import math
+import os
+import random
+import tempfile
+import time
+from hardware import GPIOBackend, HeaterOutput, TemperatureSensors, PWM_PIN
+from w1_sampler import W1Sampler, format_w1_slave
+
+SIM_SENSOR_IDS = ('28-00000000sim0',)
+
+
+class VirtualClock:
+    # speed=None: time only moves when sleep() is called, so a control loop
+    # runs as fast as the CPU allows. speed=x: virtual time runs x times
+    # faster than the wall clock (1.0 for a realtime demo on a dev box).
+    def __init__(self, speed=None, start=0.0):
+        self.speed = speed
+        self.now = start
+        self._real_start = time.monotonic()
+
+    def monotonic(self):
+        if self.speed is None:
+            return self.now
+        return self.now + (time.monotonic() - self._real_start) * self.speed
+
+    def sleep(self, dt):
+        if dt <= 0:
+            return
+        if self.speed is None:
+            self.now += dt
+        else:
+            time.sleep(dt / self.speed)
+
+    def advance(self, dt):
+        self.sleep(dt)
+
+
+class ThermalPlant:
+    # Lumped thermal model of a dryer box. order=2 models the heater element
+    # and the chamber air as two masses; order=1 puts the heater power straight
+    # into the chamber. The probe sees the chamber through a first-order lag.
+    def __init__(self, heater_power=60.0, heater_capacity=150.0, coupling=3.0,
+                 chamber_capacity=2000.0, loss=0.6, ambient=22.0, sensor_lag=10.0,
+                 noise=0.05, resolution=0.0625, order=2, max_step=0.5, seed=None):
+        self.heater_power = heater_power          # W at 100 % duty
+        self.heater_capacity = heater_capacity    # J/K of the element
+        self.coupling = coupling                  # W/K element -> air
+        self.chamber_capacity = chamber_capacity  # J/K of air, walls and spool
+        self.loss = loss                          # W/K chamber -> ambient
+        self.ambient = ambient
+        self.sensor_lag = sensor_lag              # s
+        self.noise = noise                        # °C standard deviation
+        self.resolution = resolution              # DS18B20 12-bit steps
+        self.order = order
+        self.max_step = max_step
+        self.random = random.Random(seed)
+        self.duty = 0.0
+        self.time = 0.0
+        self.heater_temperature = ambient
+        self.chamber_temperature = ambient
+        self.sensor_temperature = ambient
+        self.energy = 0.0                         # J delivered by the heater
+
+    def set_duty(self, duty):
+        self.duty = min(max(duty, 0.0), 100.0)
+
+    def advance_to(self, t):
+        if t > self.time:
+            self.advance(t - self.time)
+
+    def advance(self, dt):
+        steps = max(1, int(math.ceil(dt / self.max_step)))
+        h = dt / steps
+        power = self.heater_power * self.duty / 100.0
+        for _ in range(steps):
+            loss = self.loss * (self.chamber_temperature - self.ambient)
+            if self.order == 1:
+                self.chamber_temperature += h * (power - loss) / self.chamber_capacity
+            else:
+                flow = self.coupling * (self.heater_temperature - self.chamber_temperature)
+                self.heater_temperature += h * (power - flow) / self.heater_capacity
+                self.chamber_temperature += h * (flow - loss) / self.chamber_capacity
+            if self.sensor_lag > 0:
+                self.sensor_temperature += (self.chamber_temperature - self.sensor_temperature) * (1.0 - math.exp(-h / self.sensor_lag))
+            else:
+                self.sensor_temperature = self.chamber_temperature
+        self.energy += power * dt
+        self.time += dt
+
+    def measure(self, offset=0.0):
+        value = self.sensor_temperature + offset
+        if self.noise:
+            value += self.random.gauss(0.0, self.noise)
+        if self.resolution:
+            value = round(value / self.resolution) * self.resolution
+        return value
+
+
+class FakeGPIO:
+    # Stand-in for the RPi.GPIO module. Pin levels and PWM duties are recorded
+    # and forwarded to listeners(pin, duty) so a plant can follow the heater pin.
+    BCM = 11
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    PUD_UP = 22
+
+    def __init__(self):
+        self.mode = None
+        self.pins = {}
+        self.duties = {}
+        self.listeners = []
+
+    def setmode(self, mode):
+        self.mode = mode
+
+    def setup(self, pin, direction, pull_up_down=None, initial=None):
+        self.pins[pin] = direction
+
+    def output(self, pin, value):
+        self._set(pin, 100.0 if value else 0.0)
+
+    def cleanup(self, pin=None):
+        for p in ([pin] if pin is not None else list(self.duties)):
+            self._set(p, 0.0)
+
+    def PWM(self, pin, frequency):
+        return _FakePWM(self, pin, frequency)
+
+    def _set(self, pin, duty):
+        self.duties[pin] = duty
+        for listener in self.listeners:
+            listener(pin, duty)
+
+
+class _FakePWM:
+    def __init__(self, gpio, pin, frequency):
+        self.gpio = gpio
+        self.pin = pin
+        self.frequency = frequency
+
+    def start(self, duty):
+        self.gpio._set(self.pin, duty)
+
+    def ChangeDutyCycle(self, duty):
+        self.gpio._set(self.pin, duty)
+
+    def ChangeFrequency(self, frequency):
+        self.frequency = frequency
+
+    def stop(self):
+        self.gpio._set(self.pin, 0.0)
+
+
+class SimulatedSensors(TemperatureSensors):
+    # Probes reading the plant. Individual probes can be dropped out or given
+    # a CRC failure rate to exercise the error paths; a failed read is
+    # retried crc_retries times like W1Sampler does. spike_rate is how often
+    # a probe reads its 85 °C power-on value. `plants` maps probes to their
+    # own plant when several boxes share the bus.
+    def __init__(self, plant, clock, sensor_ids=SIM_SENSOR_IDS, offsets=None, crc_error_rate=0.0, plants=None,
+                 crc_retries=1, spike_rate=0.0):
+        self.plant = plant
+        self.clock = clock
+        self.ids = tuple(sensor_ids)
+        self.plants = plants or {sensor_id: plant for sensor_id in self.ids}
+        if offsets is None:
+            # Probes sharing a plant disagree slightly, like real ones do
+            offsets = {} if plants else {sensor_id: 0.15 * i for i, sensor_id in enumerate(self.ids)}
+        self.offsets = offsets
+        self.crc_error_rate = crc_error_rate
+        self.crc_retries = crc_retries
+        self.spike_rate = spike_rate
+        self.retries = 0
+        self.dropped = set()
+
+    def read_all(self):
+        now = self.clock.monotonic()
+        for plant in set(self.plants.values()):
+            plant.advance_to(now)
+        readings = {}
+        for sensor_id in self.ids:
+            plant = self.plants[sensor_id]
+            if sensor_id in self.dropped:
+                readings[sensor_id] = None
+                continue
+            value = self._read(plant, sensor_id)
+            for _ in range(self.crc_retries if value is None else 0):
+                self.retries += 1
+                value = self._read(plant, sensor_id)
+                if value is not None:
+                    break
+            readings[sensor_id] = value
+        return readings
+
+    def _read(self, plant, sensor_id):
+        if self.crc_error_rate and plant.random.random() < self.crc_error_rate:
+            return None
+        if self.spike_rate and plant.random.random() < self.spike_rate:
+            return 85.0
+        return plant.measure(self.offsets.get(sensor_id, 0.0))
+
+    def sensor_ids(self):
+        return list(self.ids)
+
+
+class FakeW1Tree:
+    # Mirrors simulated probes into a directory laid out like
+    # /sys/bus/w1/devices so the real W1Sampler can be run against it.
+    def __init__(self, base_dir, sensors):
+        self.base_dir = base_dir
+        self.sensors = sensors
+        os.makedirs(os.path.join(base_dir, 'w1_bus_master1'), exist_ok=True)
+
+    def update(self):
+        for sensor_id, temp in self.sensors.read_all().items():
+            folder = os.path.join(self.base_dir, sensor_id)
+            if sensor_id in self.sensors.dropped:
+                if os.path.exists(folder):
+                    os.remove(os.path.join(folder, 'w1_slave'))
+                    os.rmdir(folder)
+                continue
+            os.makedirs(folder, exist_ok=True)
+            # Rewrite in place so readers holding the file open see new data
+            with open(os.path.join(folder, 'w1_slave'), 'r+' if os.path.exists(os.path.join(folder, 'w1_slave')) else 'w') as f:
+                f.write(format_w1_slave(temp if temp is not None else 0.0, crc_ok=temp is not None))
+                f.truncate()
+
+
+class FakePWMTree:
+    # A directory laid out like /sys/class/pwm with every channel already
+    # exported (there is no kernel to react to writes to `export`)
+    def __init__(self, base_dir, chips=1, channels=2):
+        self.base_dir = base_dir
+        for chip in range(chips):
+            chip_dir = os.path.join(base_dir, f'pwmchip{chip}')
+            os.makedirs(chip_dir, exist_ok=True)
+            for name, value in (('npwm', channels), ('export', ''), ('unexport', '')):
+                with open(os.path.join(chip_dir, name), 'w') as f:
+                    f.write(str(value))
+            for channel in range(channels):
+                channel_dir = os.path.join(chip_dir, f'pwm{channel}')
+                os.makedirs(channel_dir, exist_ok=True)
+                for name, value in (('period', 0), ('duty_cycle', 0), ('enable', 0), ('polarity', 'normal')):
+                    with open(os.path.join(channel_dir, name), 'w') as f:
+                        f.write(f'{value}\n')
+
+    def read(self, name, channel=0, chip=0):
+        # Writes land at offset 0 like on sysfs, so a shorter value leaves
+        # the tail of the previous one after its newline
+        with open(os.path.join(self.base_dir, f'pwmchip{chip}', f'pwm{channel}', name)) as f:
+            return f.readline().strip()
+
+    def duty(self, channel=0, chip=0):
+        # Duty in % as the PWM peripheral would output it
+        period = int(self.read('period', channel, chip))
+        if not int(self.read('enable', channel, chip)) or not period:
+            return 0.0
+        return 100.0 * int(self.read('duty_cycle', channel, chip)) / period
+
+
+class _PlantTap(HeaterOutput):
+    # Forwards a heater's duty to the plant on its pin, for outputs that do
+    # not go through FakeGPIO
+    def __init__(self, heater, on_duty):
+        self.heater = heater
+        self.kind = heater.kind
+        self.pin = heater.pin
+        self.on_duty = on_duty
+
+    def set_duty(self, duty):
+        self.heater.set_duty(duty)
+        self.on_duty(self.pin, duty)
+
+    def stop(self):
+        self.heater.stop()
+        self.on_duty(self.pin, 0.0)
+
+    def forced_low(self):
+        self.heater.forced_low()
+        self.on_duty(self.pin, 0.0)
+
+
+class _SysfsLoopback(TemperatureSensors):
+    def __init__(self, tree, sampler):
+        self.tree = tree
+        self.sampler = sampler
+
+    def read_all(self):
+        self.tree.update()
+        return self.sampler.read_all()
+
+    def sensor_ids(self):
+        self.tree.update()
+        return self.sampler.sensor_ids()
+
+    def close(self):
+        self.sampler.close()
+
+
+def sim_sensor_id(index):
+    return f'28-00000000sim{index}'
+
+
+class SimulatedBackend(GPIOBackend):
+    # Heater on a FakeGPIO pin driving a ThermalPlant, on a VirtualClock.
+    # With fake_w1_dir the probes go through a fake sysfs tree and the real
+    # W1Sampler instead of being read from the plant directly. `chambers`,
+    # a list of (pin, sensor_id), simulates several boxes on one bus, each
+    # with its own plant. Kernel PWM heaters write to a FakePWMTree in
+    # fake_pwm_dir (a temporary directory by default).
+    name = 'sim'
+
+    def __init__(self, speed=1.0, plant=None, clock=None, sensor_ids=SIM_SENSOR_IDS, pin=PWM_PIN,
+                 crc_error_rate=0.0, fake_w1_dir=None, chambers=None, seed=None, fake_pwm_dir=None, **plant_kwargs):
+        self.virtual_clock = clock or VirtualClock(speed)
+        self.gpio = FakeGPIO()
+        self.gpio.setmode(FakeGPIO.BCM)
+        if chambers:
+            pin = chambers[0][0]
+            self.plants = {p: ThermalPlant(seed=None if seed is None else seed + i, **plant_kwargs)
+                           for i, (p, _) in enumerate(chambers)}
+            plants = {sensor_id: self.plants[p] for p, sensor_id in chambers}
+            sensor_ids = list(plants)
+            self.plant = self.plants[pin]
+        else:
+            self.plant = plant or ThermalPlant(seed=seed, **plant_kwargs)
+            self.plants = {pin: self.plant}
+            plants = None
+        self.pin = pin
+        self.gpio.listeners.append(self._on_pin)
+        self.simulated_sensors = SimulatedSensors(self.plant, self.virtual_clock, sensor_ids,
+                                                  crc_error_rate=crc_error_rate, plants=plants)
+        sensors = self.simulated_sensors
+        if fake_w1_dir:
+            sensors = _SysfsLoopback(FakeW1Tree(fake_w1_dir, sensors), W1Sampler(fake_w1_dir))
+        self._pwm_tmp = None
+        if fake_pwm_dir is None:
+            self._pwm_tmp = tempfile.TemporaryDirectory(prefix='fake-pwm-')
+            fake_pwm_dir = self._pwm_tmp.name
+        self.pwm_tree = FakePWMTree(fake_pwm_dir)
+        super().__init__(self.gpio, pin, sensors, clock=self.virtual_clock.monotonic, sleep=self.virtual_clock.sleep,
+                         pwm_base_dir=fake_pwm_dir, time_scale=self.virtual_clock.speed)
+
+    def create_heater(self, pin, kind='soft', **options):
+        heater = super().create_heater(pin, kind, **options)
+        if kind == 'sysfs':
+            heater = _PlantTap(heater, self._on_pin)
+        return heater
+
+    def watchdog_output(self, heater):
+        # Kernel PWM goes through the fake sysfs tree, which the watchdog
+        # process can write too; fake GPIO pins only exist in this process
+        if heater.kind == 'sysfs':
+            return ('sysfs', heater.heater.channel_dir)
+        return None
+
+    def close(self):
+        super().close()
+        if self._pwm_tmp is not None:
+            self._pwm_tmp.cleanup()
+            self._pwm_tmp = None
+
+    def _on_pin(self, pin, duty):
+        plant = self.plants.get(pin)
+        if plant is not None:
+            # Bring the plant up to now before the power level changes
+            plant.advance_to(self.virtual_clock.monotonic())
+            plant.set_duty(duty)
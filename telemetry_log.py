@@ -0,0 +1,289 @@
+import csv
+import glob
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+import warnings
+import numpy as np
+
+TELEMETRY_DIR = 'telemetry'
+MAGIC = b'FDTL'
+VERSION = 1
+HEADER_SIZE = 256
+# magic, version, sensor count, record size, session start (epoch s)
+HEADER_STRUCT = struct.Struct('<4sHHHxxd')
+NAN = float('nan')
+
+
+def record_dtype(sensor_count):
+    # timestamp (epoch s), setpoint and duty, then one temperature per probe;
+    # missing values are NaN
+    return np.dtype([('t', '<f8'), ('setpoint', '<f4'), ('duty', '<f4'), ('temps', '<f4', (sensor_count,))])
+
+
+class TelemetryLog:
+    # Append-only log of fixed-size binary records. append() only packs into
+    # an in-memory batch; a background thread writes batches every
+    # flush_interval, fsyncs every fsync_interval and rotates files by size
+    # or age, so the control loop never waits on the SD card.
+    def __init__(self, directory=TELEMETRY_DIR, sensor_ids=(), max_bytes=16 * 1024 * 1024, max_age=6 * 3600,
+                 max_files=64, flush_interval=5.0, fsync_interval=30.0):
+        self.directory = directory
+        self.sensor_ids = list(sensor_ids)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.max_files = max_files
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.session_start = time.time()
+        # Where this session's history starts; earlier when a run resumed
+        # after a restart
+        self.history_start = self.session_start
+        self._record = struct.Struct(f'<dff{len(self.sensor_ids)}f')
+        self._batch = bytearray()
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._fd = None
+        self.path = None
+        self._file_size = 0
+        self._file_opened = 0.0
+        self._last_fsync = 0.0
+        self._stop_event = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='telemetry-log', daemon=True)
+            self._thread.start()
+
+    def append(self, t, temps, duty, setpoint):
+        # temps in sensor_ids order; None for a missing reading
+        values = [NAN if v is None else v for v in temps]
+        packed = self._record.pack(t, NAN if setpoint is None else setpoint, duty, *values)
+        with self._lock:
+            self._batch += packed
+
+    def append_snapshot(self, snapshot):
+        readings = snapshot.readings
+        self.append(self.session_start + snapshot.t, [readings.get(s) for s in self.sensor_ids],
+                    snapshot.duty, snapshot.target)
+
+    def flush(self, fsync=False):
+        # Safe to call from any thread, e.g. before reading the session back
+        with self._io_lock:
+            with self._lock:
+                batch = self._batch
+                self._batch = bytearray()
+            if batch:
+                if self._fd is None or self._should_rotate():
+                    self._open_new_file()
+                os.write(self._fd, batch)
+                self._file_size += len(batch)
+            now = time.monotonic()
+            if self._fd is not None and (fsync or now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._fd)
+                self._last_fsync = now
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1.0)
+            self._thread = None
+        self.flush(fsync=True)
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"[TELEMETRY] Write failed: {e}")
+
+    def _should_rotate(self):
+        return (self._file_size >= self.max_bytes
+                or time.monotonic() - self._file_opened >= self.max_age)
+
+    def _open_new_file(self):
+        if self._fd is not None:
+            os.fsync(self._fd)
+            os.close(self._fd)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.directory, f'telemetry-{stamp}.fdt')
+        suffix = 1
+        while os.path.exists(path):
+            path = os.path.join(self.directory, f'telemetry-{stamp}-{suffix}.fdt')
+            suffix += 1
+        header = HEADER_STRUCT.pack(MAGIC, VERSION, len(self.sensor_ids), self._record.size, self.session_start)
+        ids = json.dumps(self.sensor_ids).encode()
+        if len(header) + len(ids) > HEADER_SIZE:
+            raise ValueError('Too many sensor ids for the telemetry header')
+        self._fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        os.write(self._fd, (header + ids).ljust(HEADER_SIZE, b'\0'))
+        self.path = path
+        self._file_size = HEADER_SIZE
+        self._file_opened = time.monotonic()
+        self._last_fsync = self._file_opened
+        self._prune()
+
+    def _prune(self):
+        files = log_files(self.directory)
+        for path in files[:max(0, len(files) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class TelemetryGroup:
+    # Several logs (one per chamber) flushed by a single background thread
+    # instead of one thread per log
+    def __init__(self, logs, flush_interval=5.0):
+        self.logs = list(logs)
+        self.flush_interval = flush_interval
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop_event.clear()
+            self._thread = threading.Thread(target=self._run, name='telemetry-group', daemon=True)
+            self._thread.start()
+
+    def close(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(self.flush_interval + 1.0)
+            self._thread = None
+        for log in self.logs:
+            log.close()
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            for log in self.logs:
+                try:
+                    log.flush()
+                except OSError as e:
+                    print(f"[TELEMETRY] Write failed for {log.directory}: {e}")
+
+
+class TelemetryReader:
+    # Memory-mapped view of one log file. `records` is a NumPy structured
+    # array over the mapping, so range queries are a binary search on the
+    # timestamps and nothing is copied until the caller asks for it.
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(HEADER_SIZE)
+            if len(header) < HEADER_SIZE:
+                # Power cut before the header was written out
+                raise ValueError(f'{path} has an incomplete header')
+            magic, version, sensor_count, record_size, session_start = HEADER_STRUCT.unpack_from(header)
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f'{path} is not a telemetry log')
+            self.sensor_ids = json.loads(header[HEADER_STRUCT.size:].rstrip(b'\0'))
+            self.session_start = session_start
+            self.dtype = record_dtype(sensor_count)
+            size = os.fstat(f.fileno()).st_size
+            # A trailing partial record (power cut mid-write) is ignored
+            count = (size - HEADER_SIZE) // record_size
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if count else None
+        self.records = (np.frombuffer(self._mmap, dtype=self.dtype, count=count, offset=HEADER_SIZE)
+                        if count else np.empty(0, dtype=self.dtype))
+
+    def __len__(self):
+        return len(self.records)
+
+    def range(self, t0=None, t1=None):
+        times = self.records['t']
+        lo = 0 if t0 is None else int(np.searchsorted(times, t0, 'left'))
+        hi = len(times) if t1 is None else int(np.searchsorted(times, t1, 'right'))
+        return self.records[lo:hi]
+
+    def close(self):
+        self.records = None
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
+
+def log_files(directory=TELEMETRY_DIR):
+    return sorted(glob.glob(os.path.join(directory, 'telemetry-*.fdt')), key=os.path.getmtime)
+
+
+def query(t0=None, t1=None, directory=TELEMETRY_DIR, session_start=None):
+    # Records between t0 and t1 across rotated files, as one array (copied out
+    # of the mappings). Pass session_start to stay within one session.
+    parts = []
+    sensor_ids = None
+    for path in log_files(directory):
+        try:
+            reader = TelemetryReader(path)
+        except (OSError, ValueError):
+            continue
+        if session_start is not None and reader.session_start != session_start:
+            reader.close()
+            continue
+        if sensor_ids is not None and reader.sensor_ids != sensor_ids:
+            reader.close()
+            continue
+        sensor_ids = reader.sensor_ids
+        # Copy out so the mapping can be closed
+        part = reader.range(t0, t1).copy()
+        reader.close()
+        if len(part):
+            parts.append(part)
+    if not parts:
+        return sensor_ids or [], np.empty(0, dtype=record_dtype(len(sensor_ids or [])))
+    return sensor_ids, np.concatenate(parts)
+
+
+def decimate(records, max_points=600):
+    # Bucket means so a 12 h session can be drawn with a few hundred points
+    n = len(records)
+    temps = records['temps'][:, 0] if records['temps'].shape[1] else np.full(n, NAN)
+    if n <= max_points:
+        return records['t'], temps, records['duty']
+    bucket = int(math.ceil(n / max_points))
+    usable = n - n % bucket
+    with warnings.catch_warnings():
+        # All-NaN buckets (sensor outage) stay NaN
+        warnings.simplefilter('ignore', RuntimeWarning)
+        times = records['t'][:usable].reshape(-1, bucket).mean(axis=1)
+        temps = np.nanmean(temps[:usable].reshape(-1, bucket), axis=1)
+        duties = records['duty'][:usable].reshape(-1, bucket).mean(axis=1)
+    return times, temps, duties
+
+
+def export_csv(out, t0=None, t1=None, directory=TELEMETRY_DIR):
+    # Write the records between t0 and t1 to a CSV file path or open file
+    sensor_ids, records = query(t0, t1, directory)
+    close = False
+    if isinstance(out, str):
+        out = open(out, 'w', newline='')
+        close = True
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['timestamp', 'iso_time', 'setpoint', 'duty'] + list(sensor_ids))
+        for rec in records:
+            t = float(rec['t'])
+            row = [f'{t:.3f}', time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(t)),
+                   _fmt(rec['setpoint']), _fmt(rec['duty'])]
+            row += [_fmt(v) for v in rec['temps']]
+            writer.writerow(row)
+    finally:
+        if close:
+            out.close()
+    return len(records)
+
+
+def _fmt(value):
+    value = float(value)
+    return '' if math.isnan(value) else f'{value:.3f}'
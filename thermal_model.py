@@ -0,0 +1,112 @@
+import json
+import math
+import time
+from collections import namedtuple
+import numpy as np
+from file_utils import write_json_atomic
+from telemetry_log import query, TELEMETRY_DIR
+
+MODELS_FILE = 'thermal_models.json'
+
+# First order plus dead time: the probe settles `gain` °C above `ambient` per
+# % of duty, with time constant `tau` and `dead_time` before it reacts (s).
+# `rmse` is the one-step prediction error of the fit (°C) over `samples`
+# resampled points.
+ThermalModel = namedtuple('ThermalModel', 'gain tau dead_time ambient rmse samples fitted',
+                          defaults=(0.0, 0, 0.0))
+
+FIT_STEP = 5.0           # s, resampling grid
+MAX_DEAD_TIME = 180.0    # s
+FIT_HISTORY = 48 * 3600  # s of telemetry used for a fit
+MIN_SAMPLES = 120
+MIN_DUTY_SPREAD = 10.0   # % standard deviation; less is not enough excitation
+MIN_TEMP_SPREAD = 3.0    # °C
+
+
+def resample(t, temps, duty, step=FIT_STEP):
+    # Bucket means on a uniform grid; NaN where a bucket has no reading (gaps,
+    # sensor outages, time between sessions). Records that go back in time
+    # (a Pi without an RTC before its clock is set again) are dropped.
+    forward = np.ones(len(t), dtype=bool)
+    forward[1:] = t[1:] > np.maximum.accumulate(t)[:-1]
+    if not forward.all():
+        t, temps, duty = t[forward], temps[forward], duty[forward]
+    index = ((t - t[0]) // step).astype(np.int64)
+    n = int(index[-1]) + 1
+    good = np.isfinite(temps)
+    temp_count = np.bincount(index[good], minlength=n)
+    temp_sum = np.bincount(index[good], temps[good], minlength=n)
+    duty_count = np.bincount(index, minlength=n)
+    duty_sum = np.bincount(index, np.nan_to_num(duty), minlength=n)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        resampled_temps = np.where(temp_count > 0, temp_sum / temp_count, np.nan)
+        resampled_duty = np.where(duty_count > 0, duty_sum / duty_count, np.nan)
+    return resampled_temps, resampled_duty
+
+
+def fit_model(t, temps, duty, step=FIT_STEP, max_dead_time=MAX_DEAD_TIME):
+    # Least-squares fit of T[k+1] = a T[k] + b u[k-d] + c on the resampled
+    # log, for every dead time d up to max_dead_time; the d with the smallest
+    # residual wins. Returns a ThermalModel, or None if the log does not hold
+    # enough heating to tell anything.
+    t = np.asarray(t, dtype=np.float64)
+    temps = np.asarray(temps, dtype=np.float64)
+    duty = np.asarray(duty, dtype=np.float64)
+    if len(t) < 2:
+        return None
+    temp, u = resample(t, temps, duty, step)
+    logged = np.isfinite(temp) & np.isfinite(u)
+    if logged.sum() < MIN_SAMPLES or np.std(u[logged]) < MIN_DUTY_SPREAD or np.ptp(temp[logged]) < MIN_TEMP_SPREAD:
+        return None
+    best = None
+    for d in range(int(max_dead_time // step) + 1):
+        if len(temp) - d < 2:
+            break
+        y = temp[d + 1:]
+        x = temp[d:-1]
+        u_delayed = u[:len(u) - d - 1]
+        valid = np.isfinite(y) & np.isfinite(x) & np.isfinite(u_delayed)
+        if valid.sum() < MIN_SAMPLES:
+            continue
+        design = np.column_stack((x[valid], u_delayed[valid], np.ones(valid.sum())))
+        coef, residual, rank, _ = np.linalg.lstsq(design, y[valid], rcond=None)
+        if rank < 3:
+            continue
+        sse = float(residual[0]) if len(residual) else float(np.sum((design @ coef - y[valid]) ** 2))
+        if best is None or sse < best[0]:
+            best = (sse, d, coef, int(valid.sum()))
+    if best is None:
+        return None
+    sse, d, (a, b, c), samples = best
+    if not 0.0 < a < 1.0 or b <= 0.0:
+        return None
+    return ThermalModel(gain=float(b / (1.0 - a)), tau=float(-step / math.log(a)), dead_time=d * step,
+                        ambient=float(c / (1.0 - a)), rmse=math.sqrt(sse / samples), samples=samples,
+                        fitted=time.time())
+
+
+def fit_from_telemetry(directory=TELEMETRY_DIR, history=FIT_HISTORY, sensor=0):
+    # Fit on the last `history` seconds of a chamber's telemetry log
+    _, records = query(time.time() - history, None, directory)
+    if not len(records) or records['temps'].shape[1] <= sensor:
+        return None
+    return fit_model(records['t'], records['temps'][:, sensor], records['duty'])
+
+
+def load_model(name='default', path=MODELS_FILE):
+    try:
+        with open(path, 'r') as file:
+            data = json.load(file).get(name)
+        return ThermalModel(**data) if data else None
+    except (FileNotFoundError, json.JSONDecodeError, TypeError):
+        return None
+
+
+def save_model(model, name='default', path=MODELS_FILE):
+    try:
+        with open(path, 'r') as file:
+            models = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        models = {}
+    models[name] = model._asdict()
+    write_json_atomic(path, models, indent=2)
@@ -0,0 +1,49 @@
+import threading
+from kivy.clock import Clock
+from metrics import METRICS
+
+
+class UiUpdates:
+    # Widget property writes, applied together once per frame and only where
+    # the value differs from what the widget already shows. A later write to
+    # the same property in a frame replaces the earlier one. `set` may be
+    # called from any thread; widgets are only touched on the Kivy thread.
+    # While paused (display blanked) writes are held and applied on resume.
+    def __init__(self):
+        self.pending = {}
+        self.paused = False
+        self._lock = threading.Lock()
+        self._trigger = Clock.create_trigger(self.flush, 0)
+        self.applied = METRICS.counter('ui_property_updates_total', 'Queued widget property writes', result='applied')
+        self.unchanged = METRICS.counter('ui_property_updates_total', 'Queued widget property writes', result='unchanged')
+        self.frames = METRICS.counter('ui_update_flushes_total', 'Frames that applied queued widget writes')
+
+    def set(self, widget, **values):
+        with self._lock:
+            for prop, value in values.items():
+                self.pending[(id(widget), prop)] = (widget, prop, value)
+        if not self.paused:
+            self._trigger()
+
+    def flush(self, dt=None):
+        with self._lock:
+            pending, self.pending = self.pending, {}
+        applied = 0
+        for widget, prop, value in pending.values():
+            if getattr(widget, prop) != value:
+                setattr(widget, prop, value)
+                applied += 1
+        self.applied.inc(applied)
+        self.unchanged.inc(len(pending) - applied)
+        if pending:
+            self.frames.inc()
+
+    def pause(self):
+        self.paused = True
+
+    def resume(self):
+        self.paused = False
+        self._trigger()
+
+
+UI_UPDATES = UiUpdates()
@@ -0,0 +1,142 @@
+import glob
+import os
+import time
+
+W1_BASE_DIR = '/sys/bus/w1/devices/'
+DS18B20_FAMILY = '28-'
+# w1_slave is ~75 bytes for a DS18B20; read a little more in one syscall
+READ_SIZE = 128
+
+
+def parse_w1_slave(buf):
+    # Parse the raw w1_slave contents:
+    #   "72 01 4b 46 7f ff 0e 10 57 : crc=57 YES\n72 01 4b 46 7f ff 0e 10 57 t=23125\n"
+    # Works on the whole buffer with find/endswith so no per-line lists or
+    # stripped copies are created. Returns degrees C or None.
+    nl = buf.find(b'\n')
+    if nl == -1:
+        return None
+    end = nl
+    if end and buf[end - 1] == 13:  # tolerate '\r\n'
+        end -= 1
+    if not buf.endswith(b'YES', 0, end):
+        return None
+    pos = buf.find(b't=', nl)
+    if pos == -1:
+        return None
+    try:
+        return int(buf[pos + 2:]) / 1000.0
+    except ValueError:
+        return None
+
+
+def format_w1_slave(temp_c, crc_ok=True):
+    # Build w1_slave contents the way the w1_therm driver does (used for fake trees)
+    milli = int(round(temp_c * 1000))
+    raw = '72 01 4b 46 7f ff 0e 10 57'
+    return f"{raw} : crc=57 {'YES' if crc_ok else 'NO'}\n{raw} t={milli}\n"
+
+
+class W1Sampler:
+    def __init__(self, base_dir=W1_BASE_DIR, hotplug_interval=30.0, family=DS18B20_FAMILY, bulk=True, crc_retries=1):
+        self.base_dir = base_dir
+        self.hotplug_interval = hotplug_interval
+        self.family = family
+        self.bulk = bulk
+        # A failed CRC or missing t= is usually a glitch on the bus during
+        # the transfer, so the probe is read again straight away. Each retry
+        # is a fresh conversion (up to 750 ms at 12 bits), hence the limit.
+        self.crc_retries = crc_retries
+        self.retries = 0
+        self._fds = {}
+        self._next_scan = 0.0
+        self._bulk_paths = ()
+
+    def sensor_ids(self):
+        if time.monotonic() >= self._next_scan:
+            self.rescan()
+        return sorted(self._fds)
+
+    def rescan(self):
+        # Discover devices and keep one open fd per w1_slave file
+        found = {}
+        try:
+            device_folders = sorted(glob.glob(os.path.join(self.base_dir, self.family + '*')))
+        except Exception:
+            device_folders = []
+        for folder in device_folders:
+            sensor_id = os.path.basename(folder)
+            fd = self._fds.pop(sensor_id, None)
+            if fd is None:
+                try:
+                    fd = os.open(os.path.join(folder, 'w1_slave'), os.O_RDONLY)
+                except OSError:
+                    continue
+            found[sensor_id] = fd
+        # Anything left over has disappeared from the bus
+        for fd in self._fds.values():
+            self._close_fd(fd)
+        self._fds = found
+        # Bus masters that support a simultaneous convert-T for every probe
+        self._bulk_paths = tuple(glob.glob(os.path.join(self.base_dir, 'w1_bus_master*', 'therm_bulk_read'))) if self.bulk else ()
+        self._next_scan = time.monotonic() + self.hotplug_interval
+
+    def read_all(self):
+        # One batched pass over every cached probe: {sensor_id: temp_c or None}.
+        # An empty bus is looked at again every hotplug_interval, like a full one.
+        if time.monotonic() >= self._next_scan:
+            self.rescan()
+        self._trigger_bulk_conversion()
+        readings = {}
+        lost = None
+        for sensor_id, fd in self._fds.items():
+            try:
+                buf = os.pread(fd, READ_SIZE, 0)
+                value = parse_w1_slave(buf)
+                for _ in range(self.crc_retries if value is None else 0):
+                    self.retries += 1
+                    value = parse_w1_slave(os.pread(fd, READ_SIZE, 0))
+                    if value is not None:
+                        break
+            except OSError:
+                # Device unplugged: its sysfs node is gone, rescan on next pass
+                readings[sensor_id] = None
+                lost = lost or []
+                lost.append(sensor_id)
+                continue
+            readings[sensor_id] = value
+        if lost:
+            for sensor_id in lost:
+                self._close_fd(self._fds.pop(sensor_id))
+            self._next_scan = 0.0
+        return readings
+
+    def read(self, sensor_id=None):
+        readings = self.read_all()
+        if sensor_id is None:
+            # First probe on the bus, like the old device_folders[0]
+            return next(iter(readings.values()), None)
+        return readings.get(sensor_id)
+
+    def close(self):
+        for fd in self._fds.values():
+            self._close_fd(fd)
+        self._fds = {}
+        self._next_scan = 0.0
+
+    def _trigger_bulk_conversion(self):
+        # With therm_bulk_read every probe converts at once, so the per-probe
+        # reads below no longer wait ~750 ms each.
+        for path in self._bulk_paths:
+            try:
+                with open(path, 'w') as f:
+                    f.write('trigger\n')
+            except OSError:
+                pass
+
+    @staticmethod
+    def _close_fd(fd):
+        try:
+            os.close(fd)
+        except OSError:
+            pass